@@ -0,0 +1,187 @@
+"""
+Incremental per-user posture baseline.
+
+Keeps running statistics (weighted Welford mean / variance, optionally with
+exponential decay) of each user's filtered IMU channels, updated from new
+sensor_data documents as they arrive. The state is a few numbers per user and
+is persisted, so a restart resumes from the last processed _id instead of
+rescanning history. Baselines are published at a fixed cadence to:
+  - the Mongo `user_baselines` collection (one document per user)
+  - Datasets/user_posture_baseline.csv (same schema preprocess.py writes)
+
+Filtering and normalization match preprocess.py: a FILTER_WINDOW-sample moving
+average per user, then min-max scaling with the min/max seen over all users.
+Since scaling is affine, statistics are kept in sensor units and scaled when
+published.
+
+Usage:
+    python baseline_service.py [--decay-half-life SAMPLES] [--publish-seconds 300]
+"""
+import argparse
+import datetime
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+from bson import ObjectId
+from pymongo import MongoClient, UpdateOne
+
+from preprocess import FILTERED, IMU, RAW_FILE, BASELINE_FILE, continue_moving_average
+
+MONGO_URI = os.getenv("MONGO_URI", "mongodb://mongodb:27017/neurochair")
+DATASET_PATH = os.getenv("DATASET_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Datasets'))
+STATE_PATH = os.getenv("BASELINE_STATE_PATH", os.path.join(DATASET_PATH, 'baseline_state.json'))
+POLL_SECONDS = 5
+BATCH_SIZE = 5000
+
+class BaselineTracker:
+    """
+    Per-user weighted Welford statistics of the filtered IMU channels.
+    decay is the weight kept by existing data per new sample (1.0 = no decay).
+    """
+    def __init__(self, decay=1.0):
+        self.decay = decay
+        self.users = {}  # user id -> {'weight', 'mean', 'm2', 'tail'}
+        self.mins = np.full(len(IMU), np.inf)
+        self.maxs = np.full(len(IMU), -np.inf)
+        self.watermark = None  # Last processed sensor_data _id
+
+    def _user(self, user_id):
+        if user_id not in self.users:
+            self.users[user_id] = {'weight': 0.0, 'mean': np.zeros(len(IMU)), 'm2': np.zeros(len(IMU)),
+                                   'tail': np.empty((0, len(IMU)))}
+        return self.users[user_id]
+
+    def _update_user(self, state, raw):
+        # Moving average, continuing from the user's last raw samples
+        filt, state['tail'] = continue_moving_average(state['tail'], raw)
+        self.mins = np.minimum(self.mins, filt.min(axis=0))
+        self.maxs = np.maximum(self.maxs, filt.max(axis=0))
+
+        # Weighted batch statistics (sample i of n keeps decay ** (n - 1 - i))
+        n = len(filt)
+        w = self.decay ** np.arange(n - 1, -1, -1, dtype=np.float64)
+        wb = w.sum()
+        mean_b = (w[:, None] * filt).sum(axis=0) / wb
+        m2_b = (w[:, None] * (filt - mean_b) ** 2).sum(axis=0)
+
+        # Chan et al. merge with the decayed running state
+        carried = self.decay ** n
+        wa, mean_a, m2_a = state['weight'] * carried, state['mean'], state['m2'] * carried
+        total = wa + wb
+        delta = mean_b - mean_a
+        state['mean'] = mean_a + delta * wb / total
+        state['m2'] = m2_a + m2_b + delta ** 2 * wa * wb / total
+        state['weight'] = total
+
+    def update(self, df):
+        """Add samples (rows in arrival order with User_ID / user_id and IMU columns)."""
+        user_col = 'User_ID' if 'User_ID' in df else 'user_id'
+        df = df.dropna(subset=IMU + [user_col])
+        for user_id, group in df.groupby(user_col, sort=False):
+            self._update_user(self._user(user_id), group[IMU].to_numpy(dtype=np.float64))
+
+    def baselines(self):
+        """Normalized per-user means (and standard deviations), as published."""
+        span = np.where(self.maxs > self.mins, self.maxs - self.mins, 1.0)
+        rows = []
+        for user_id in sorted(self.users):
+            s = self.users[user_id]
+            if s['weight'] == 0:
+                continue
+            rows.append({'User_ID': user_id, 'weight': s['weight'],
+                         **dict(zip(FILTERED, (s['mean'] - self.mins) / span)),
+                         **dict(zip([c + '_std' for c in FILTERED], np.sqrt(s['m2'] / s['weight']) / span))})
+        return pd.DataFrame(rows)
+
+    # ---- persistence ----
+
+    def to_state(self):
+        return {
+            'decay': self.decay,
+            'watermark': str(self.watermark) if self.watermark is not None else None,
+            'mins': self.mins.tolist(), 'maxs': self.maxs.tolist(),
+            'users': {u: {'weight': s['weight'], 'mean': s['mean'].tolist(), 'm2': s['m2'].tolist(),
+                          'tail': s['tail'].tolist()} for u, s in self.users.items()},
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        tracker = cls(state['decay'])
+        tracker.watermark = ObjectId(state['watermark']) if state['watermark'] else None
+        tracker.mins, tracker.maxs = np.array(state['mins']), np.array(state['maxs'])
+        for u, s in state['users'].items():
+            tracker.users[u] = {'weight': s['weight'], 'mean': np.array(s['mean']), 'm2': np.array(s['m2']),
+                                'tail': np.array(s['tail']).reshape(-1, len(IMU))}
+        return tracker
+
+def save_state(tracker, path=STATE_PATH):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(tracker.to_state(), f)
+    os.replace(tmp_path, path)
+
+def load_state(path=STATE_PATH):
+    try:
+        with open(path) as f:
+            return BaselineTracker.from_state(json.load(f))
+    except FileNotFoundError:
+        return None
+
+def bootstrap(tracker, raw_path, chunksize=200_000):
+    """Seed a new tracker from the raw dataset (one pass, in chunks)."""
+    if os.path.exists(raw_path):
+        for chunk in pd.read_csv(raw_path, chunksize=chunksize):
+            tracker.update(chunk)
+
+def publish(tracker, db, csv_path):
+    baselines = tracker.baselines()
+    if baselines.empty:
+        return
+    now = datetime.datetime.now()
+    db['user_baselines'].bulk_write([
+        UpdateOne({'_id': row['User_ID']}, {'$set': dict(row, updated_at=now)}, upsert=True)
+        for row in baselines.to_dict('records')
+    ], ordered=False)
+    baselines[['User_ID'] + FILTERED].to_csv(csv_path + '.tmp', index=False)
+    os.replace(csv_path + '.tmp', csv_path)
+    print(f"Published baselines for {len(baselines)} users")
+
+def run(decay, publish_seconds):
+    db = MongoClient(MONGO_URI)['neurochair']
+    collection = db['sensor_data']
+    tracker = load_state()
+    if tracker is None or tracker.decay != decay:
+        tracker = BaselineTracker(decay)
+        bootstrap(tracker, os.path.join(DATASET_PATH, RAW_FILE))
+        latest = list(collection.find({}, {'_id': 1}).sort('_id', -1).limit(1))
+        tracker.watermark = latest[0]['_id'] if latest else None
+    projection = {f: 1 for f in IMU + ['user_id', 'User_ID']}
+    last_publish = 0.0
+    try:
+        while True:
+            query = {'_id': {'$gt': tracker.watermark}} if tracker.watermark is not None else {}
+            docs = list(collection.find(query, projection).sort('_id', 1).limit(BATCH_SIZE))
+            if docs:
+                tracker.update(pd.DataFrame(docs).reindex(columns=['User_ID', 'user_id'] + IMU)
+                               .assign(User_ID=lambda d: d['User_ID'].fillna(d['user_id'])))
+                tracker.watermark = docs[-1]['_id']
+            if time.time() - last_publish >= publish_seconds:
+                publish(tracker, db, os.path.join(DATASET_PATH, BASELINE_FILE))
+                save_state(tracker)
+                last_publish = time.time()
+            if len(docs) < BATCH_SIZE:
+                time.sleep(POLL_SECONDS)
+    finally:
+        save_state(tracker)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Maintain per-user posture baselines from new sensor data.")
+    parser.add_argument('--decay-half-life', type=float, default=None,
+                        help="Samples after which old data counts half (default: no decay)")
+    parser.add_argument('--publish-seconds', type=float, default=300, help="Publish/persist cadence")
+    args = parser.parse_args()
+    decay = 0.5 ** (1 / args.decay_half_life) if args.decay_half_life else 1.0
+    run(decay, args.publish_seconds)
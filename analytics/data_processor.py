@@ -1,39 +1,393 @@
-import paho.mqtt.client as mqtt
-from pymongo import MongoClient
+"""
+MQTT -> MongoDB ingestion for chair samples published on neurochair/sensors/#.
+
+Each message is decoded, stamped with its arrival time and topic, scored by the
+posture classifier when a model is available, and stored in sensor_data.
+
+Ingestion modes (INGEST_MODE):
+  single  one insert_one per message
+  batch   messages are buffered and written with insert_many(ordered=False)
+          every INGEST_BATCH_SIZE messages or INGEST_FLUSH_SECONDS
+
+Delivery is at-least-once: the client keeps a persistent MQTT v5 session
+(fixed INGEST_CLIENT_ID, clean_start=False, session expiry) subscribed with
+QoS 1, so the broker queues samples while the backend is down, and every
+message is acked only after its document is committed to Mongo. Failed writes
+stay buffered and are retried (insert_many sets _id client-side, so a retry of
+a partly written batch skips the duplicates). The broker sends at most
+INGEST_INFLIGHT unacked messages (MQTT v5 Receive Maximum); batches are capped
+at that window. Lost connections are retried with exponential backoff.
+Redeliveries and the other counters are printed every INGEST_STATS_SECONDS.
+Devices must publish with QoS 1 for their samples to be queued.
+
+Edge gateways (gateway.py) publish envelopes of many samples from many chairs
+on neurochair/batches/<gateway> (format: envelope.py). An envelope is unpacked
+column-wise, scored with one score_frame call and stored as one insert_many
+(or added to the batch buffer whole); it is acked once all its samples are
+written.
+
+Samples of an envelope can be older than today (a gateway catching up after an
+outage). When a write reaches into a closed day, the data generation document
+(data_generations/sensor_data, see dashboard/database.py) is bumped, so the
+dashboard recomputes its cached closed-day aggregates.
+
+Buffered documents share one copy of each device/user ID string (interned).
+Numeric fields keep their decoded Python types: BSON stores doubles and
+int32/int64 only, so narrower buffers would not survive the insert.
+
+Importing this module has no side effects; benchmarks/bench_ingest.py drives
+Ingestor directly with in-process or local broker/database stand-ins.
+
+Usage:
+    MQTT_BROKER=localhost MONGO_URI=mongodb://localhost:27017/neurochair python data_processor.py
+"""
 import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
 from datetime import datetime
 
-# Connect to MongoDB
-mongo_client = MongoClient('mongodb://mongodb:27017/')
-db = mongo_client['neurochair']
-collection = db['sensor_data']
+import pandas as pd
+import paho.mqtt.client as mqtt
+from paho.mqtt.packettypes import PacketTypes
+from paho.mqtt.properties import Properties
+from pymongo import MongoClient
+from pymongo.errors import BulkWriteError, PyMongoError
 
-# MQTT callbacks
+import envelope
+from posture_model import IMU, SWITCHES, OnlineScorer, PostureModel
 
+MQTT_BROKER = os.getenv("MQTT_BROKER", "mqtt-broker")
+MQTT_PORT = int(os.getenv("MQTT_PORT", 1883))
+MONGO_URI = os.getenv("MONGO_URI", "mongodb://mongodb:27017/neurochair")
+TOPIC = "neurochair/sensors/#"
+INGEST_MODE = os.getenv("INGEST_MODE", "single")
+BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", 500))
+FLUSH_SECONDS = float(os.getenv("INGEST_FLUSH_SECONDS", 0.5))
+LOG_MESSAGES = os.getenv("INGEST_LOG_MESSAGES", "1") == "1"  # Print every stored document
+CLIENT_ID = os.getenv("INGEST_CLIENT_ID", "neurochair-ingest")  # One per ingesting process
+SESSION_EXPIRY_SECONDS = int(os.getenv("INGEST_SESSION_EXPIRY", 7 * 86400))  # Broker keeps the queue this long
+INFLIGHT = int(os.getenv("INGEST_INFLIGHT", 1000))  # Unacked messages the broker may send
+RECONNECT_MIN_SECONDS = 1
+RECONNECT_MAX_SECONDS = int(os.getenv("INGEST_RECONNECT_MAX", 120))
+STATS_SECONDS = float(os.getenv("INGEST_STATS_SECONDS", 60))  # 0 = no periodic stats line
+DUPLICATE_KEY = 11000
+STAGES = ('decode', 'enrich', 'store')
+ID_FIELDS = ('User_ID', 'NFC_ID', 'user_id', 'topic')  # Repeated on every message
+SCORE_FIELDS = IMU + ['FSR_Left', 'FSR_Right', 'FSR_Back']  # Required to score a sample
+GENERATIONS = 'data_generations'  # Closed-day data generation (dashboard/database.py)
+GENERATION_ID = 'sensor_data'
 
-def on_connect(client, userdata, flags, rc):
-    print(f"Connected to MQTT broker with code {rc}")
-    client.subscribe("neurochair/sensors/#")
+def load_scorer():
+    """Online scorer for the latest posture model, or None without one."""
+    try:
+        scorer = OnlineScorer(PostureModel.load())
+        print(f"Loaded posture model v{scorer.model.version}")
+        return scorer
+    except (FileNotFoundError, ValueError) as e:
+        print(f"Posture model not loaded: {e}")
+        return None
 
+def decode(payload):
+    return json.loads(payload.decode())
 
-def on_message(client, userdata, msg):
-    try:
-        data = json.loads(msg.payload.decode())
-        data['timestamp'] = datetime.now()
-        data['topic'] = msg.topic
+def enrich(data, topic, scorer=None):
+    data['timestamp'] = datetime.now()
+    data['topic'] = topic
+    if scorer is not None:
+        predicted = scorer.score(data)
+        if predicted is not None:
+            data['Predicted_Class'] = predicted
+    return data
+
+def score_documents(docs, scorer):
+    """Set Predicted_Class on the scorable documents of one envelope with a single score_frame call."""
+    scorable = [d for d in docs if all(d.get(c) is not None for c in SCORE_FIELDS)]
+    if not scorable:
+        return
+    frame = pd.DataFrame({c: [d.get(c) for d in scorable] for c in SCORE_FIELDS + SWITCHES},
+                         dtype='float64')
+    frame['User_ID'] = [d.get('User_ID') or d.get('user_id') for d in scorable]
+    for doc, predicted in zip(scorable, scorer.score_frame(frame).tolist()):
+        doc['Predicted_Class'] = predicted
+
+def bump_data_generation(db):
+    """Mark samples of closed days as changed (dashboard caches key closed days on this)."""
+    db[GENERATIONS].update_one({'_id': GENERATION_ID}, {'$inc': {'generation': 1}}, upsert=True)
+
+def compact_document(doc):
+    """Intern the ID strings of doc so buffered documents share them."""
+    for field in ID_FIELDS:
+        value = doc.get(field)
+        if isinstance(value, str):
+            doc[field] = sys.intern(value)
+    return doc
+
+class Ingestor:
+    """
+    Turns MQTT messages into sensor_data documents. collection needs insert_one
+    / insert_many. timings, if given, maps each of STAGES to a list that
+    receives per-message seconds. on_commit, if set, is called with the ack
+    tokens ((mid, qos) pairs) of messages whose documents were written.
+    db, if given, gets the data generation bumped when written samples fall
+    before today.
+    """
+    def __init__(self, collection, mode=INGEST_MODE, batch_size=BATCH_SIZE, flush_seconds=FLUSH_SECONDS,
+                 scorer=None, log_messages=LOG_MESSAGES, timings=None, on_commit=None, db=None):
+        if mode not in ('single', 'batch'):
+            raise ValueError(f"Unknown ingestion mode: {mode}")
+        self.collection = collection
+        self.mode = mode
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.scorer = scorer
+        self.log_messages = log_messages
+        self.timings = timings
+        self.on_commit = on_commit
+        self.db = db
+        self.stored = 0
+        self.stats = Counter()  # received, envelopes, redelivered, duplicates, rejected, acked, write_errors, ...
+        self.max_pending = 0
+        self._buffer = []
+        self._tokens = []  # Ack tokens of the buffered documents, same order
+        self._pending = set()  # Tokens buffered and not yet committed
+        self._buffer_started = None
+        self._lock = threading.Lock()
+
+    def handle(self, payload, topic, token=None):
+        t0 = time.perf_counter()
+        data = decode(payload)
+        t1 = time.perf_counter()
+        doc = enrich(data, topic, self.scorer)
+        t2 = time.perf_counter()
+        self.store(doc, token)
+        if self.timings is not None:
+            t3 = time.perf_counter()
+            for stage, seconds in zip(STAGES, (t1 - t0, t2 - t1, t3 - t2)):
+                self.timings[stage].append(seconds)
+
+    def handle_envelope(self, payload, token=None):
+        t0 = time.perf_counter()
+        docs = envelope.decode(payload)
+        t1 = time.perf_counter()
+        if self.scorer is not None:
+            score_documents(docs, self.scorer)
+        t2 = time.perf_counter()
+        self.stats['envelopes'] += 1
+        self.stats['envelope_samples'] += len(docs)
+        self.store_many(docs, token)
+        if self.timings is not None:
+            t3 = time.perf_counter()
+            for stage, seconds in zip(STAGES, (t1 - t0, t2 - t1, t3 - t2)):
+                self.timings[stage].append(seconds)
+
+    def store(self, doc, token=None):
+        if self.mode == 'single':
+            try:
+                self.collection.insert_one(doc)
+            except PyMongoError:
+                self.stats['write_errors'] += 1
+                self._enqueue([doc], token)  # Retried by the flusher, acked once written
+                raise
+            self.stored += 1
+            self._written([doc])
+            self._commit([token])
+            if self.log_messages:
+                print(f"Stored data: {doc}")
+            return
+        if self._enqueue([doc], token) >= self.batch_size:
+            self.flush()
+
+    def store_many(self, docs, token=None):
+        """Store the documents of one envelope; token is committed once all of them are written."""
+        if not docs:
+            self._commit([token])
+            return
+        if self.mode == 'single':
+            try:
+                self.collection.insert_many(docs, ordered=False)
+            except PyMongoError:
+                self.stats['write_errors'] += 1
+                self._enqueue(docs, token)
+                raise
+            self.stored += len(docs)
+            self._written(docs)
+            self._commit([token])
+            if self.log_messages:
+                print(f"Stored {len(docs)} documents")
+            return
+        if self._enqueue(docs, token) >= self.batch_size:
+            self.flush()
+
+    def _enqueue(self, docs, token):
+        """Buffer docs; token rides on the last one, so it is committed with the whole group."""
+        for doc in docs:
+            compact_document(doc)
+        with self._lock:
+            if not self._buffer:
+                self._buffer_started = time.monotonic()
+            self._buffer.extend(docs)
+            self._tokens.extend([None] * (len(docs) - 1))
+            self._tokens.append(token)
+            if token is not None:
+                self._pending.add(token)
+                self.max_pending = max(self.max_pending, len(self._pending))
+            return len(self._buffer)
+
+    def _requeue(self, docs, tokens):
+        with self._lock:
+            self._buffer[:0] = docs
+            self._tokens[:0] = tokens
+            self._buffer_started = time.monotonic()  # Next attempt after flush_seconds
+            self.stats['write_errors'] += 1
+
+    def _written(self, docs):
+        """Bump the data generation if any written sample belongs to a closed day."""
+        if self.db is None:
+            return
+        midnight = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        if not any(doc.get('timestamp') is not None and doc['timestamp'] < midnight for doc in docs):
+            return
+        try:
+            bump_data_generation(self.db)
+            self.stats['closed_day_writes'] += 1
+        except PyMongoError as e:
+            print(f"Data generation bump failed: {e}")
+
+    def _commit(self, tokens):
+        tokens = [t for t in tokens if t is not None]
+        if not tokens:
+            return
+        with self._lock:
+            self._pending.difference_update(tokens)
+            self.stats['acked'] += len(tokens)
+        if self.on_commit is not None:
+            self.on_commit(tokens)
+
+    def flush(self):
+        """Write buffered documents; on failure they stay buffered (unacked) for the next flush."""
+        with self._lock:
+            docs, self._buffer = self._buffer, []
+            tokens, self._tokens = self._tokens, []
+            self._buffer_started = None
+        if not docs:
+            return
+        try:
+            self.collection.insert_many(docs, ordered=False)
+        except BulkWriteError as e:
+            if e.details.get('writeConcernErrors') or \
+                    any(err['code'] != DUPLICATE_KEY for err in e.details.get('writeErrors', [])):
+                self._requeue(docs, tokens)
+                raise
+            # Only duplicates: written by an earlier attempt whose reply was lost
+        except PyMongoError:
+            self._requeue(docs, tokens)
+            raise
+        self.stored += len(docs)
+        self._written(docs)
+        self._commit(tokens)
+        if self.log_messages:
+            print(f"Stored {len(docs)} documents")
+
+    def flush_due(self):
+        with self._lock:
+            due = self._buffer_started is not None and time.monotonic() - self._buffer_started >= self.flush_seconds
+        if due:
+            self.flush()
+
+    def report(self):
+        with self._lock:
+            return dict(self.stats, stored=self.stored, buffered=len(self._buffer), pending=len(self._pending),
+                        max_pending=self.max_pending)
+
+    def start_flusher(self, stats_seconds=0):
+        """
+        Background thread that flushes partial batches after flush_seconds
+        (and retries failed writes); prints report() every stats_seconds.
+        """
+        def run():
+            last_stats = time.monotonic()
+            while True:
+                time.sleep(self.flush_seconds / 2)
+                try:
+                    self.flush_due()
+                except PyMongoError as e:
+                    print(f"Error: {e}")
+                if stats_seconds and time.monotonic() - last_stats >= stats_seconds:
+                    print(f"Ingest stats: {self.report()}")
+                    last_stats = time.monotonic()
+        threading.Thread(target=run, name="ingest-flusher", daemon=True).start()
+
+    # MQTT callbacks (paho-mqtt 2.x, CallbackAPIVersion.VERSION2)
+
+    def on_connect(self, client, userdata, flags, reason_code, properties=None):
+        print(f"Connected to MQTT broker: {reason_code} (session present: {flags.session_present})")
+        self.stats['connects'] += 1
+        if not reason_code.is_failure:
+            client.subscribe([(TOPIC, 1), (envelope.TOPIC, 1)])
+
+    def on_disconnect(self, client, userdata, flags, reason_code, properties=None):
+        self.stats['disconnects'] += 1
+        print(f"Disconnected from MQTT broker: {reason_code}; reconnecting")
+
+    def on_message(self, client, userdata, msg):
+        token = (msg.mid, msg.qos) if msg.qos > 0 else None
+        self.stats['received'] += 1
+        if msg.dup:
+            self.stats['redelivered'] += 1
+            with self._lock:
+                duplicate = token in self._pending
+            if duplicate:
+                self.stats['duplicates'] += 1  # Still buffered from the first delivery
+                return
+        try:
+            if msg.topic.startswith(envelope.TOPIC_PREFIX):
+                self.handle_envelope(msg.payload, token)
+            else:
+                self.handle(msg.payload, msg.topic, token)
+        except PyMongoError as e:
+            print(f"Error: {e}")
+        except Exception as e:
+            print(f"Error: {e}")
+            self.stats['rejected'] += 1
+            self._commit([token])  # Malformed message: ack it so it is not redelivered forever
+
+def create_client(ingestor, client_id=CLIENT_ID):
+    """MQTT v5 client with manual acks, wired to ingestor."""
+    client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id=client_id, protocol=mqtt.MQTTv5,
+                         manual_ack=True)
+    client.on_connect = ingestor.on_connect
+    client.on_disconnect = ingestor.on_disconnect
+    client.on_message = ingestor.on_message
+    client.reconnect_delay_set(RECONNECT_MIN_SECONDS, RECONNECT_MAX_SECONDS)  # Doubles per failed attempt
+
+    def ack(tokens):
+        for mid, qos in tokens:
+            client.ack(mid, qos)
+    ingestor.on_commit = ack
+    return client
 
-        # Store in MongoDB
-        collection.insert_one(data)
-        print(f"Stored data: {data}")
-    except Exception as e:
-        print(f"Error: {e}")
+def connect(client, host=MQTT_BROKER, port=MQTT_PORT, inflight=INFLIGHT):
+    """Connect (asynchronously) resuming the persistent session, with inflight as Receive Maximum."""
+    properties = Properties(PacketTypes.CONNECT)
+    properties.SessionExpiryInterval = SESSION_EXPIRY_SECONDS
+    properties.ReceiveMaximum = inflight
+    client.connect_async(host, port, keepalive=60, clean_start=False, properties=properties)
 
+def main():
+    db = MongoClient(MONGO_URI)['neurochair']
+    ingestor = Ingestor(db['sensor_data'], scorer=load_scorer(), db=db)
+    if ingestor.mode == 'batch' and ingestor.batch_size > INFLIGHT:
+        # The broker stops at INFLIGHT unacked messages, so larger batches would only flush on time
+        print(f"Batch size capped at the in-flight window ({INFLIGHT})")
+        ingestor.batch_size = INFLIGHT
+    ingestor.start_flusher(STATS_SECONDS)
 
-# Create MQTT client
-mqtt_client = mqtt.Client()
-mqtt_client.on_connect = on_connect
-mqtt_client.on_message = on_message
+    mqtt_client = create_client(ingestor)
+    connect(mqtt_client)
+    mqtt_client.loop_forever(retry_first_connection=True)
 
-# Connect to MQTT broker
-mqtt_client.connect("mqtt-broker", 1883, 60)
-mqtt_client.loop_forever()
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""
+Batched envelope format for chair samples (edge gateway -> data_processor).
+
+An envelope carries the samples of many devices collected over a short window
+in one MQTT message on neurochair/batches/<gateway id>. It is zlib-compressed
+JSON with one array per field instead of one object per sample:
+
+    {"v": 1, "gateway": "edge-01", "n": 3,
+     "topics": ["neurochair/sensors/NFC01", "neurochair/sensors/NFC02"],
+     "topic": [0, 1, 0],              index into topics, per sample
+     "age_ms": [950, 420, 10],        ms between arrival at the gateway and publishing
+     "columns": {"AccX": [0.1, 0.2, null], ...}}
+
+A sample that lacks a field has null in that column. Ages rather than absolute
+times keep samples stamped with the receiving server's clock, as direct
+messages are (timestamp = arrival of the envelope - age).
+"""
+import json
+import zlib
+from datetime import datetime
+
+import numpy as np
+
+VERSION = 1
+TOPIC_PREFIX = "neurochair/batches/"
+TOPIC = TOPIC_PREFIX + "#"
+COMPRESS_LEVEL = 6
+
+def encode(samples, gateway_id, now):
+    """
+    Envelope bytes for samples, a list of (topic, received, data) with
+    received in the same clock as now (e.g. time.monotonic()).
+    """
+    topics, topic_index, columns = [], {}, {}
+    indexes, ages = [], []
+    for i, (topic, received, data) in enumerate(samples):
+        if topic not in topic_index:
+            topic_index[topic] = len(topics)
+            topics.append(topic)
+        indexes.append(topic_index[topic])
+        ages.append(max(0, round((now - received) * 1000)))
+        for field, value in data.items():
+            column = columns.get(field)
+            if column is None:
+                column = columns[field] = [None] * i
+            column.append(value)
+        for column in columns.values():
+            if len(column) == i:
+                column.append(None)
+    body = {'v': VERSION, 'gateway': gateway_id, 'n': len(samples), 'topics': topics,
+            'topic': indexes, 'age_ms': ages, 'columns': columns}
+    return zlib.compress(json.dumps(body, separators=(',', ':')).encode(), COMPRESS_LEVEL)
+
+def decode(payload, now=None):
+    """
+    The samples of an envelope as sensor_data documents (timestamp and topic
+    set, missing fields left out), in their original order.
+    """
+    body = json.loads(zlib.decompress(payload))
+    if body.get('v') != VERSION:
+        raise ValueError(f"Unsupported envelope version: {body.get('v')}")
+    n = body['n']
+    columns = body['columns']
+    if any(len(values) != n for values in columns.values()) or len(body['topic']) != n or len(body['age_ms']) != n:
+        raise ValueError("Envelope columns do not match its sample count")
+    now = np.datetime64(now or datetime.now(), 'us')
+    timestamps = (now - np.asarray(body['age_ms'], dtype='timedelta64[ms]')).astype(datetime).tolist()
+    topics = np.asarray(body['topics'], dtype=object)[np.asarray(body['topic'], dtype=np.intp)].tolist()
+    fields = list(columns) + ['timestamp', 'topic']
+    rows = zip(*columns.values(), timestamps, topics)
+    return [{k: v for k, v in zip(fields, row) if v is not None} for row in rows]
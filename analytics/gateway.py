@@ -0,0 +1,189 @@
+"""
+Edge gateway: batches chair samples into envelopes for data_processor.py.
+
+Chairs behind a gateway publish their usual one-sample messages to a broker at
+the edge (GATEWAY_SOURCE_BROKER). The gateway collects the samples of all
+chairs for up to --window-seconds (or --max-samples) and publishes them as one
+compressed, columnar envelope (envelope.py) to the central broker on
+neurochair/batches/<gateway id>, so broker and ingestion overhead is paid per
+envelope instead of per sample.
+
+Source messages are acked only after the central broker has acknowledged the
+envelope carrying them (QoS 1 on both sides, persistent sessions), so a
+gateway restart does not lose samples; they are redelivered and batched again.
+
+Usage:
+    GATEWAY_SOURCE_BROKER=localhost:1884 MQTT_BROKER=central python gateway.py
+        [--gateway-id edge-01] [--window-seconds 1.0] [--max-samples 500]
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from collections import Counter
+
+import paho.mqtt.client as mqtt
+from paho.mqtt.packettypes import PacketTypes
+from paho.mqtt.properties import Properties
+
+import envelope
+
+MQTT_BROKER = os.getenv("MQTT_BROKER", "mqtt-broker")
+MQTT_PORT = int(os.getenv("MQTT_PORT", 1883))
+SOURCE_BROKER = os.getenv("GATEWAY_SOURCE_BROKER", "localhost:1884")  # host:port of the edge broker
+SOURCE_TOPIC = os.getenv("GATEWAY_SOURCE_TOPIC", "neurochair/sensors/#")
+GATEWAY_ID = os.getenv("GATEWAY_ID", "edge-01")
+WINDOW_SECONDS = float(os.getenv("GATEWAY_WINDOW_SECONDS", 1.0))
+MAX_SAMPLES = int(os.getenv("GATEWAY_MAX_SAMPLES", 500))
+INFLIGHT = int(os.getenv("GATEWAY_INFLIGHT", 5000))  # Unacked source messages; >= MAX_SAMPLES
+SESSION_EXPIRY_SECONDS = int(os.getenv("GATEWAY_SESSION_EXPIRY", 7 * 86400))
+RECONNECT_MAX_SECONDS = 60
+STATS_SECONDS = float(os.getenv("GATEWAY_STATS_SECONDS", 60))
+
+def _host_port(address, default_port=1883):
+    host, _, port = address.partition(':')
+    return host, int(port or default_port)
+
+def _client(client_id, inflight, **kwargs):
+    client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id=client_id, protocol=mqtt.MQTTv5, **kwargs)
+    client.reconnect_delay_set(1, RECONNECT_MAX_SECONDS)
+    properties = Properties(PacketTypes.CONNECT)
+    properties.SessionExpiryInterval = SESSION_EXPIRY_SECONDS
+    properties.ReceiveMaximum = inflight
+    return client, properties
+
+class Gateway:
+    """
+    Buffers (topic, received, data) samples with their source ack tokens and
+    publishes them as envelopes through publish(topic, payload) -> mid; call
+    published(mid) when the central broker acknowledged an envelope.
+    """
+    def __init__(self, gateway_id=GATEWAY_ID, window_seconds=WINDOW_SECONDS, max_samples=MAX_SAMPLES,
+                 publish=None, ack=None):
+        self.gateway_id = gateway_id
+        self.topic = envelope.TOPIC_PREFIX + gateway_id
+        self.window_seconds = window_seconds
+        self.max_samples = max_samples
+        self.publish = publish
+        self.ack = ack
+        self.stats = Counter()
+        self._samples = []
+        self._tokens = []
+        self._window_started = None
+        self._unconfirmed = {}  # envelope mid -> source tokens
+        self._lock = threading.Lock()
+
+    def add(self, topic, payload, token=None):
+        try:
+            data = json.loads(payload.decode())
+        except ValueError as e:
+            print(f"Error: {e}")
+            self.stats['rejected'] += 1
+            if token is not None and self.ack is not None:
+                self.ack([token])
+            return
+        with self._lock:
+            if not self._samples:
+                self._window_started = time.monotonic()
+            self._samples.append((topic, time.monotonic(), data))
+            if token is not None:
+                self._tokens.append(token)
+            full = len(self._samples) >= self.max_samples
+        if full:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            samples, self._samples = self._samples, []
+            tokens, self._tokens = self._tokens, []
+            self._window_started = None
+            if not samples:
+                return
+            payload = envelope.encode(samples, self.gateway_id, time.monotonic())
+            # Under the lock, so published() cannot run before the mid is recorded
+            mid = self.publish(self.topic, payload)
+            self._unconfirmed[mid] = tokens
+            self.stats['envelopes'] += 1
+            self.stats['samples'] += len(samples)
+            self.stats['bytes'] += len(payload)
+
+    def flush_due(self):
+        with self._lock:
+            due = self._window_started is not None and time.monotonic() - self._window_started >= self.window_seconds
+        if due:
+            self.flush()
+
+    def published(self, mid):
+        with self._lock:
+            tokens = self._unconfirmed.pop(mid, None)
+        if tokens and self.ack is not None:
+            self.ack(tokens)
+
+    def report(self):
+        with self._lock:
+            report = dict(self.stats, buffered=len(self._samples), unconfirmed=len(self._unconfirmed))
+        if report.get('envelopes'):
+            report['samples_per_envelope'] = round(report['samples'] / report['envelopes'], 1)
+            report['bytes_per_sample'] = round(report['bytes'] / report['samples'], 1)
+        return report
+
+    def start_flusher(self, stats_seconds=0):
+        def run():
+            last_stats = time.monotonic()
+            while True:
+                time.sleep(min(self.window_seconds / 4, 0.25))
+                self.flush_due()
+                if stats_seconds and time.monotonic() - last_stats >= stats_seconds:
+                    print(f"Gateway stats: {self.report()}")
+                    last_stats = time.monotonic()
+        threading.Thread(target=run, name="gateway-flusher", daemon=True).start()
+
+def main(args):
+    source_host, source_port = _host_port(args.source_broker)
+    if (source_host, source_port) == (MQTT_BROKER, MQTT_PORT):
+        raise SystemExit("The source broker must be the edge broker, not the central one "
+                         "(data_processor.py would store every sample twice)")
+    if args.max_samples > INFLIGHT:
+        raise SystemExit(f"--max-samples must not exceed GATEWAY_INFLIGHT ({INFLIGHT})")
+
+    central, central_properties = _client(f"neurochair-gateway-{args.gateway_id}", INFLIGHT)
+    source, source_properties = _client(f"neurochair-gateway-{args.gateway_id}-source", INFLIGHT, manual_ack=True)
+
+    def publish(topic, payload):
+        return central.publish(topic, payload, qos=1).mid
+
+    def ack(tokens):
+        for mid, qos in tokens:
+            source.ack(mid, qos)
+
+    gateway = Gateway(args.gateway_id, args.window_seconds, args.max_samples, publish, ack)
+    central.on_publish = lambda client, userdata, mid, reason_code, properties: gateway.published(mid)
+    central.on_connect = lambda client, userdata, flags, reason_code, properties: \
+        print(f"Connected to central broker: {reason_code}")
+
+    def on_source_connect(client, userdata, flags, reason_code, properties):
+        print(f"Connected to edge broker: {reason_code} (session present: {flags.session_present})")
+        if not reason_code.is_failure:
+            client.subscribe(args.source_topic, qos=1)
+
+    def on_source_message(client, userdata, msg):
+        gateway.add(msg.topic, msg.payload, (msg.mid, msg.qos) if msg.qos > 0 else None)
+
+    source.on_connect = on_source_connect
+    source.on_message = on_source_message
+
+    central.connect_async(MQTT_BROKER, MQTT_PORT, keepalive=60, clean_start=False, properties=central_properties)
+    central.loop_start()
+    gateway.start_flusher(STATS_SECONDS)
+    source.connect_async(source_host, source_port, keepalive=60, clean_start=False, properties=source_properties)
+    source.loop_forever(retry_first_connection=True)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Batch chair samples from an edge broker into envelopes.")
+    parser.add_argument("--gateway-id", default=GATEWAY_ID, help="Envelope topic suffix and MQTT client id")
+    parser.add_argument("--source-broker", default=SOURCE_BROKER, help="host:port of the edge broker")
+    parser.add_argument("--source-topic", default=SOURCE_TOPIC)
+    parser.add_argument("--window-seconds", type=float, default=WINDOW_SECONDS, help="Longest time a sample waits")
+    parser.add_argument("--max-samples", type=int, default=MAX_SAMPLES, help="Samples per envelope at most")
+    main(parser.parse_args())
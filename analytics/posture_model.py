@@ -0,0 +1,273 @@
+"""
+Posture classifier: training, versioned serialization and batch inference.
+
+The model is multinomial logistic regression trained with numpy on
+posture_features.csv. At save time the feature standardization is folded into
+the weights, so scoring is one matrix product + argmax per chunk. The same
+artifact serves:
+  - batch scoring of feature matrices (PostureModel.predict / predict_proba)
+  - live scoring of raw samples (OnlineScorer, keeps per-user filter state)
+  - backfilling Predicted_Class on historical sensor_data (process pool, one
+    partition of users per worker)
+
+Artifacts are saved as MODEL_DIR/posture_model_v<N>.npz; loading without a
+version picks the highest N.
+
+Usage:
+    python posture_model.py train [--features ../Datasets/posture_features.csv]
+    python posture_model.py backfill [--workers N] [--version N]
+"""
+import argparse
+import datetime
+import glob
+import json
+import os
+import re
+import zlib
+from multiprocessing import Pool
+
+import numpy as np
+import pandas as pd
+from pymongo import MongoClient, UpdateOne
+
+from preprocess import FEATURES, FILTERED, IMU, continue_moving_average, feature_chunk, normalize_chunk
+
+MONGO_URI = os.getenv("MONGO_URI", "mongodb://mongodb:27017/neurochair")
+DATASET_PATH = os.getenv("DATASET_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Datasets'))
+MODEL_DIR = os.getenv("POSTURE_MODEL_DIR", os.path.join(DATASET_PATH, 'models'))
+FORMAT_VERSION = 1
+
+SWITCHES = ['Limit_Back_Up', 'Limit_Back_Down', 'Limit_Left', 'Limit_Right']
+MODEL_FEATURES = FILTERED + FEATURES + ['FSR_Left', 'FSR_Right', 'FSR_Back'] + SWITCHES
+CHUNK_ROWS = 1 << 16  # Rows scored per matrix product
+BACKFILL_BATCH = 10000
+
+def feature_matrix(df, dtype=np.float32):
+    """MODEL_FEATURES columns of a features frame as a dense matrix (non-finite values -> 0)."""
+    X = df.reindex(columns=MODEL_FEATURES).to_numpy(dtype=np.float64)
+    return np.nan_to_num(X, nan=0.0, posinf=0.0, neginf=0.0).astype(dtype, copy=False)
+
+def _softmax(z):
+    z = z - z.max(axis=1, keepdims=True)
+    e = np.exp(z)
+    return e / e.sum(axis=1, keepdims=True)
+
+class PostureModel:
+    """
+    Linear softmax classifier over MODEL_FEATURES.
+    norm_min / norm_max are the filtered-channel ranges used by preprocess.py's
+    normalization, needed to featurize raw samples the same way.
+    """
+    def __init__(self, weights, bias, classes, norm_min, norm_max, metadata=None):
+        self.weights = np.asarray(weights, dtype=np.float32)
+        self.bias = np.asarray(bias, dtype=np.float32)
+        self.classes = np.asarray(classes)
+        self.norm_min = pd.Series(norm_min, index=FILTERED)
+        self.norm_max = pd.Series(norm_max, index=FILTERED)
+        # As in normalize_chunk: constant channels map to 0
+        self._mins = self.norm_min.to_numpy(dtype=np.float64)
+        self._span = (self.norm_max - self.norm_min).replace(0, 1).to_numpy(dtype=np.float64)
+        self.metadata = metadata or {}
+
+    @property
+    def version(self):
+        return self.metadata.get('version')
+
+    # ---- training ----
+
+    @classmethod
+    def fit(cls, X, y, norm_min, norm_max, l2=1e-3, epochs=2000, lr=0.5):
+        """Full-batch gradient descent on standardized features."""
+        X = np.asarray(X, dtype=np.float64)
+        classes, y_idx = np.unique(y, return_inverse=True)
+        mu = X.mean(axis=0)
+        sigma = X.std(axis=0)
+        sigma[sigma == 0] = 1.0
+        Z = (X - mu) / sigma
+        onehot = np.eye(len(classes))[y_idx]
+        W = np.zeros((X.shape[1], len(classes)))
+        b = np.zeros(len(classes))
+        for _ in range(epochs):
+            grad = (_softmax(Z @ W + b) - onehot) / len(Z)
+            W -= lr * (Z.T @ grad + l2 * W)
+            b -= lr * grad.sum(axis=0)
+        # Fold standardization in: (x - mu) / sigma @ W + b == x @ W' + b'
+        W_folded = W / sigma[:, None]
+        b_folded = b - (mu / sigma) @ W
+        return cls(W_folded, b_folded, classes, norm_min, norm_max)
+
+    # ---- inference ----
+
+    def predict_proba(self, X, chunk_rows=CHUNK_ROWS):
+        X = np.asarray(X, dtype=np.float32)
+        out = np.empty((len(X), len(self.classes)), dtype=np.float32)
+        for start in range(0, len(X), chunk_rows):
+            out[start:start + chunk_rows] = _softmax(X[start:start + chunk_rows] @ self.weights + self.bias)
+        return out
+
+    def predict(self, X, chunk_rows=CHUNK_ROWS):
+        """Class label per row, scored in chunks of chunk_rows."""
+        X = np.asarray(X, dtype=np.float32)
+        out = np.empty(len(X), dtype=self.classes.dtype)
+        for start in range(0, len(X), chunk_rows):
+            logits = X[start:start + chunk_rows] @ self.weights + self.bias
+            out[start:start + chunk_rows] = self.classes[np.argmax(logits, axis=1)]
+        return out
+
+    def features_from_raw(self, df):
+        """Features for raw-channel rows that already carry *_filt columns (see OnlineScorer)."""
+        return feature_matrix(feature_chunk(normalize_chunk(df, self.norm_min, self.norm_max)))
+
+    # ---- serialization ----
+
+    def save(self, model_dir=MODEL_DIR):
+        os.makedirs(model_dir, exist_ok=True)
+        existing = [v for v, _ in list_versions(model_dir)]
+        version = max(existing, default=0) + 1
+        self.metadata.update(version=version, format_version=FORMAT_VERSION, features=MODEL_FEATURES,
+                             saved_at=datetime.datetime.now().isoformat())
+        path = os.path.join(model_dir, f'posture_model_v{version}.npz')
+        tmp_path = path + '.tmp.npz'
+        np.savez(tmp_path, weights=self.weights, bias=self.bias, classes=self.classes,
+                 norm_min=self.norm_min.to_numpy(), norm_max=self.norm_max.to_numpy(),
+                 metadata=np.array(json.dumps(self.metadata)))
+        os.replace(tmp_path, path)
+        return path
+
+    @classmethod
+    def load(cls, version=None, model_dir=MODEL_DIR):
+        versions = dict(list_versions(model_dir))
+        if not versions:
+            raise FileNotFoundError(f"No posture model in {model_dir}")
+        path = versions[version if version is not None else max(versions)]
+        with np.load(path) as data:
+            metadata = json.loads(str(data['metadata']))
+            if metadata.get('format_version') != FORMAT_VERSION or metadata.get('features') != MODEL_FEATURES:
+                raise ValueError(f"{path} was saved with an incompatible format or feature set")
+            return cls(data['weights'], data['bias'], data['classes'], data['norm_min'], data['norm_max'], metadata)
+
+def list_versions(model_dir=MODEL_DIR):
+    """(version, path) pairs of saved models."""
+    out = []
+    for path in glob.glob(os.path.join(model_dir, 'posture_model_v*.npz')):
+        match = re.search(r'_v(\d+)\.npz$', path)
+        if match:
+            out.append((int(match.group(1)), path))
+    return sorted(out)
+
+def train(features_path, filtered_path, test_fraction=0.2, seed=0, **fit_kwargs):
+    """
+    Train on posture_features.csv with a stratified hold-out split; returns the
+    model (metadata includes hold-out accuracy). The normalization ranges come
+    from posture_filtered.csv.
+    """
+    df = pd.read_csv(features_path)
+    filt = pd.read_csv(filtered_path, usecols=FILTERED)
+    rng = np.random.default_rng(seed)
+    test = np.zeros(len(df), dtype=bool)
+    for _, idx in df.groupby('Posture_Class').indices.items():
+        test[rng.choice(idx, max(1, int(len(idx) * test_fraction)), replace=False)] = True
+    X, y = feature_matrix(df, np.float64), df['Posture_Class'].to_numpy()
+    model = PostureModel.fit(X[~test], y[~test], filt.min(), filt.max(), **fit_kwargs)
+    accuracy = float((model.predict(X[test]) == y[test]).mean())
+    model.metadata.update(train_rows=int((~test).sum()), test_rows=int(test.sum()), test_accuracy=accuracy)
+    # Refit on everything for the saved model; the hold-out score is kept as the estimate
+    final = PostureModel.fit(X, y, filt.min(), filt.max(), **fit_kwargs)
+    final.metadata = model.metadata
+    return final
+
+class OnlineScorer:
+    """
+    Score raw samples as they arrive. Keeps each user's last FILTER_WINDOW - 1
+    raw IMU rows so the moving average matches preprocess.py.
+    """
+    def __init__(self, model):
+        self.model = model
+        self._tails = {}  # user id -> array of recent raw IMU rows
+
+    def score_frame(self, df, user_col='User_ID'):
+        """Predicted class per row of a frame of raw samples (rows in arrival order)."""
+        df = df.reset_index(drop=True)
+        filt = np.full((len(df), len(IMU)), np.nan)
+        for user_id, idx in df.groupby(user_col, sort=False).indices.items():
+            raw = df.loc[idx, IMU].to_numpy(dtype=np.float64)
+            filt[idx], self._tails[user_id] = continue_moving_average(self._tails.get(user_id), raw)
+        return self.model.predict(self.model.features_from_raw(df.assign(**dict(zip(FILTERED, filt.T)))))
+
+    def score(self, sample):
+        """Predicted class for one raw sample dict, or None if it lacks IMU/FSR fields."""
+        if any(sample.get(c) is None for c in IMU + ['FSR_Left', 'FSR_Right', 'FSR_Back']):
+            return None
+        user_id = sample.get('User_ID') or sample.get('user_id')
+        # Same arithmetic as score_frame, on plain arrays: a one-row DataFrame costs milliseconds
+        raw = np.array([[sample[c] for c in IMU]], dtype=np.float64)
+        filt, self._tails[user_id] = continue_moving_average(self._tails.get(user_id), raw)
+        model = self.model
+        scale = 1 / model._span
+        acc_x, acc_y, acc_z, gyro_x, gyro_y, gyro_z = filt[0] * scale - model._mins * scale
+        left, right, back = (float(sample[c]) for c in ('FSR_Left', 'FSR_Right', 'FSR_Back'))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            x = np.array([acc_x, acc_y, acc_z, gyro_x, gyro_y, gyro_z,
+                          np.arctan2(acc_y, acc_z), np.arctan2(-acc_x, np.sqrt(acc_y ** 2 + acc_z ** 2)),
+                          left - right, np.float64(back) / (left + right),
+                          np.sqrt(gyro_x ** 2 + gyro_y ** 2 + gyro_z ** 2),
+                          left, right, back] + [sample.get(c, np.nan) for c in SWITCHES], dtype=np.float64)
+        x = np.nan_to_num(x, nan=0.0, posinf=0.0, neginf=0.0).astype(np.float32)
+        return model.classes[np.argmax(x @ model.weights + model.bias)].item()
+
+# ---- backfill ----
+
+def _backfill_partition(args):
+    """Score one partition of users' stored samples and write Predicted_Class back."""
+    partition, partitions, version, user_ids = args
+    model = PostureModel.load(version)
+    collection = MongoClient(MONGO_URI)['neurochair']['sensor_data']
+    mine = [u for u in user_ids if zlib.crc32(str(u).encode()) % partitions == partition]
+    fields = {c: 1 for c in IMU + ['FSR_Left', 'FSR_Right', 'FSR_Back'] + SWITCHES + ['user_id', 'User_ID']}
+    written = 0
+    for user_id in mine:
+        scorer = OnlineScorer(model)
+        query = {'$or': [{'user_id': user_id}, {'User_ID': user_id}], 'AccX': {'$exists': True}}
+        batch = []
+        for doc in collection.find(query, fields).sort('_id', 1).batch_size(BACKFILL_BATCH):
+            batch.append(doc)
+            if len(batch) >= BACKFILL_BATCH:
+                written += _score_and_write(collection, scorer, model, batch, user_id)
+                batch = []
+        if batch:
+            written += _score_and_write(collection, scorer, model, batch, user_id)
+    return written
+
+def _score_and_write(collection, scorer, model, docs, user_id):
+    df = pd.DataFrame(docs).assign(User_ID=user_id)
+    predicted = scorer.score_frame(df)
+    collection.bulk_write([UpdateOne({'_id': doc['_id']}, {'$set': {'Predicted_Class': int(p), 'model_version': model.version}})
+                           for doc, p in zip(docs, predicted)], ordered=False)
+    return len(docs)
+
+def backfill(workers=None, version=None):
+    """Add Predicted_Class to every stored sample with IMU data, users split across a process pool."""
+    workers = workers or os.cpu_count() or 1
+    collection = MongoClient(MONGO_URI)['neurochair']['sensor_data']
+    user_ids = sorted({u for u in collection.distinct('user_id') + collection.distinct('User_ID') if u is not None})
+    partitions = workers * 4
+    with Pool(workers) as pool:
+        counts = pool.map(_backfill_partition, [(p, partitions, version, user_ids) for p in range(partitions)])
+    print(f"Scored {sum(counts)} samples for {len(user_ids)} users")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Train the posture classifier or backfill predictions.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    p_train = sub.add_parser('train')
+    p_train.add_argument('--features', default=os.path.join(DATASET_PATH, 'posture_features.csv'))
+    p_train.add_argument('--filtered', default=os.path.join(DATASET_PATH, 'posture_filtered.csv'))
+    p_backfill = sub.add_parser('backfill')
+    p_backfill.add_argument('--workers', type=int, default=None)
+    p_backfill.add_argument('--version', type=int, default=None, help="Model version (default: latest)")
+    args = parser.parse_args()
+    if args.command == 'train':
+        model = train(args.features, args.filtered)
+        path = model.save()
+        print(f"Saved {path} (hold-out accuracy {model.metadata['test_accuracy']:.3f})")
+    else:
+        backfill(args.workers, args.version)
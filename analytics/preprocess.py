@@ -0,0 +1,224 @@
+"""
+Regenerate the derived posture datasets from posture_raw_dataset.csv:
+
+    posture_raw_dataset.csv -> posture_filtered.csv -> posture_filtered_normalized.csv
+                            -> posture_features.csv, user_posture_baseline.csv
+
+The raw file is streamed in chunks and split by User_ID into partitions, which
+a process pool filters, normalizes and featurizes chunk by chunk. Memory is
+bounded by the chunk size plus a few values per user, so the raw file can grow
+to tens of millions of rows. Outputs keep the raw row order.
+
+Stages:
+  filter     trailing moving average over FILTER_WINDOW samples of each user's IMU channels
+  normalize  min-max scaling of the filtered channels to [0, 1], with min/max taken over all users
+  features   Roll, Pitch, FSR_LR_Diff, FSR_Back_Ratio, Gyro_Mag
+  baseline   per-user mean of the normalized filtered channels
+
+Usage:
+    python preprocess.py [--datasets ../Datasets] [--workers N] [--chunksize ROWS]
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import zlib
+from multiprocessing import Pool
+
+import numpy as np
+import pandas as pd
+
+RAW_FILE = 'posture_raw_dataset.csv'
+FILTERED_FILE = 'posture_filtered.csv'
+NORMALIZED_FILE = 'posture_filtered_normalized.csv'
+FEATURES_FILE = 'posture_features.csv'
+BASELINE_FILE = 'user_posture_baseline.csv'
+
+IMU = ['AccX', 'AccY', 'AccZ', 'GyroX', 'GyroY', 'GyroZ']
+FILTERED = [c + '_filt' for c in IMU]
+FEATURES = ['Roll', 'Pitch', 'FSR_LR_Diff', 'FSR_Back_Ratio', 'Gyro_Mag']
+FILTER_WINDOW = 5
+CHUNKSIZE = 200_000
+ROW = '_row'  # Raw row number, carried through the partitions to restore order
+
+def _partition_of(users, partitions):
+    # crc32 rather than hash(): stable across processes and runs
+    codes = {u: zlib.crc32(str(u).encode()) % partitions for u in pd.unique(users)}
+    return users.map(codes)
+
+def _append_csv(df, path):
+    df.to_csv(path, mode='a', header=not os.path.exists(path), index=False)
+
+def _read_chunks(path, chunksize, dtypes=None):
+    if not os.path.exists(path):
+        return iter(())
+    # round_trip keeps floats bit-identical through the intermediate files
+    return pd.read_csv(path, chunksize=chunksize, dtype=dtypes, float_precision='round_trip')
+
+# ---- stage functions (vectorized, one chunk at a time) ----
+
+def filter_chunk(df, carry):
+    """
+    Moving average of each user's IMU channels. carry holds each user's last
+    FILTER_WINDOW - 1 raw rows from earlier chunks; returns (filtered, new carry).
+    """
+    combined = pd.concat([carry, df], ignore_index=True) if carry is not None else df.reset_index(drop=True)
+    rolled = (combined.groupby('User_ID', sort=False)[IMU]
+              .rolling(FILTER_WINDOW, min_periods=1).mean()
+              .reset_index(level=0, drop=True).sort_index())
+    out = combined.copy()
+    out[FILTERED] = rolled.to_numpy()
+    new_carry = combined.groupby('User_ID', sort=False).tail(FILTER_WINDOW - 1)
+    return out.iloc[len(carry) if carry is not None else 0:], new_carry
+
+def continue_moving_average(tail, raw):
+    """
+    Moving average of one user's new raw IMU rows (n x channels), continuing from
+    tail, their previous FILTER_WINDOW - 1 raw rows. Returns (filtered, new tail).
+    Used by the streaming consumers; matches filter_chunk.
+    """
+    padded = np.vstack([tail, raw]) if tail is not None else raw
+    csum = np.vstack([np.zeros(raw.shape[1]), np.cumsum(padded, axis=0)])
+    end = np.arange(len(padded) - len(raw) + 1, len(padded) + 1)
+    start = np.maximum(0, end - FILTER_WINDOW)
+    return (csum[end] - csum[start]) / (end - start)[:, None], padded[-(FILTER_WINDOW - 1):]
+
+def normalize_chunk(df, mins, maxs):
+    """Min-max scale the filtered channels with global per-channel min/max."""
+    span = (maxs - mins).replace(0, 1)  # Constant channels map to 0
+    scale = 1 / span
+    out = df.copy()
+    out[FILTERED] = df[FILTERED] * scale - mins * scale
+    return out
+
+def feature_chunk(df):
+    out = df.copy()
+    out['Roll'] = np.arctan2(df['AccY_filt'], df['AccZ_filt'])
+    out['Pitch'] = np.arctan2(-df['AccX_filt'], np.sqrt(df['AccY_filt'] ** 2 + df['AccZ_filt'] ** 2))
+    out['FSR_LR_Diff'] = df['FSR_Left'] - df['FSR_Right']
+    out['FSR_Back_Ratio'] = df['FSR_Back'] / (df['FSR_Left'] + df['FSR_Right'])
+    out['Gyro_Mag'] = np.sqrt(df['GyroX_filt'] ** 2 + df['GyroY_filt'] ** 2 + df['GyroZ_filt'] ** 2)
+    return out
+
+# ---- per-partition workers ----
+
+def _part_path(workdir, stage, partition):
+    return os.path.join(workdir, f'{stage}-{partition:04d}.csv')
+
+def filter_partition(args):
+    """Filter one partition; returns its per-channel min and max."""
+    workdir, partition, chunksize, dtypes = args
+    carry, mins, maxs = None, None, None
+    for chunk in _read_chunks(_part_path(workdir, 'raw', partition), chunksize, dtypes):
+        filtered, carry = filter_chunk(chunk, carry)
+        _append_csv(filtered, _part_path(workdir, 'filtered', partition))
+        lo, hi = filtered[FILTERED].min(), filtered[FILTERED].max()
+        mins = lo if mins is None else np.minimum(mins, lo)
+        maxs = hi if maxs is None else np.maximum(maxs, hi)
+    return mins, maxs
+
+def transform_partition(args):
+    """Normalize and featurize one filtered partition; returns per-user baseline sums and counts."""
+    workdir, partition, chunksize, dtypes, mins, maxs = args
+    sums, counts = [], []
+    for chunk in _read_chunks(_part_path(workdir, 'filtered', partition), chunksize, dtypes):
+        normalized = normalize_chunk(chunk, mins, maxs)
+        _append_csv(normalized, _part_path(workdir, 'normalized', partition))
+        _append_csv(feature_chunk(normalized), _part_path(workdir, 'features', partition))
+        grouped = normalized.groupby('User_ID')[FILTERED]
+        sums.append(grouped.sum())
+        counts.append(grouped.count())
+    if not sums:
+        return None, None
+    return pd.concat(sums).groupby(level=0).sum(), pd.concat(counts).groupby(level=0).sum()
+
+# ---- driver ----
+
+def split_raw(raw_path, workdir, partitions, chunksize):
+    """Stream the raw file into per-partition files; returns the raw dtypes."""
+    dtypes, offset = None, 0
+    for chunk in pd.read_csv(raw_path, chunksize=chunksize, float_precision='round_trip'):
+        if dtypes is None:
+            dtypes = {c: str(t) for c, t in chunk.dtypes.items()}
+        chunk.insert(0, ROW, np.arange(offset, offset + len(chunk)))
+        offset += len(chunk)
+        for partition, part in chunk.groupby(_partition_of(chunk['User_ID'], partitions), sort=False):
+            _append_csv(part, _part_path(workdir, 'raw', partition))
+    return dtypes
+
+def merge_parts(paths, out_path, chunksize, dtypes=None):
+    """
+    k-way merge of partition files (each ascending in _row) into out_path,
+    dropping _row. Holds at most one chunk per partition in memory.
+    """
+    readers = [iter(_read_chunks(p, chunksize, dtypes)) for p in paths]
+    buffers = [None] * len(readers)
+    tmp_path = out_path + '.tmp'
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    header_written = False
+    while True:
+        for i, reader in enumerate(readers):
+            if reader is not None and (buffers[i] is None or buffers[i].empty):
+                buffers[i] = next(reader, None)
+                if buffers[i] is None:
+                    readers[i] = None
+        live = [b for b in buffers if b is not None and not b.empty]
+        if not live:
+            break
+        # Rows up to the smallest buffered maximum among unfinished readers are final
+        open_max = [buffers[i][ROW].iloc[-1] for i, r in enumerate(readers) if r is not None]
+        bound = min(open_max) if open_max else np.inf
+        ready = []
+        for i, b in enumerate(buffers):
+            if b is not None and not b.empty:
+                take = b[ROW] <= bound
+                ready.append(b[take])
+                buffers[i] = b[~take]
+        out = pd.concat(ready).sort_values(ROW, kind='stable').drop(columns=ROW)
+        out.to_csv(tmp_path, mode='a', header=not header_written, index=False)
+        header_written = True
+    if header_written:
+        os.replace(tmp_path, out_path)
+
+def run(datasets_dir, workers=None, partitions=None, chunksize=CHUNKSIZE):
+    workers = workers or os.cpu_count() or 1
+    partitions = partitions or workers * 4
+    raw_path = os.path.join(datasets_dir, RAW_FILE)
+    workdir = tempfile.mkdtemp(prefix='preprocess-', dir=datasets_dir)
+    try:
+        print(f"Splitting {raw_path} into {partitions} partitions...")
+        dtypes = split_raw(raw_path, workdir, partitions, chunksize)
+        raw_dtypes = dict(dtypes, **{ROW: 'int64'})
+        with Pool(workers) as pool:
+            print("Filtering...")
+            ranges = pool.map(filter_partition, [(workdir, p, chunksize, raw_dtypes) for p in range(partitions)])
+            ranges = [r for r in ranges if r[0] is not None]
+            mins = pd.concat([r[0] for r in ranges], axis=1).min(axis=1)
+            maxs = pd.concat([r[1] for r in ranges], axis=1).max(axis=1)
+            print("Normalizing and extracting features...")
+            results = pool.map(transform_partition, [(workdir, p, chunksize, raw_dtypes, mins, maxs) for p in range(partitions)])
+
+        print("Writing outputs...")
+        for stage, name in (('filtered', FILTERED_FILE), ('normalized', NORMALIZED_FILE), ('features', FEATURES_FILE)):
+            merge_parts([_part_path(workdir, stage, p) for p in range(partitions)],
+                        os.path.join(datasets_dir, name), chunksize, raw_dtypes)
+        results = [r for r in results if r[0] is not None]
+        sums = pd.concat([r[0] for r in results]).groupby(level=0).sum()
+        counts = pd.concat([r[1] for r in results]).groupby(level=0).sum()
+        baseline = (sums / counts).reset_index()
+        baseline_path = os.path.join(datasets_dir, BASELINE_FILE)
+        baseline.to_csv(baseline_path + '.tmp', index=False)
+        os.replace(baseline_path + '.tmp', baseline_path)
+        print(f"Done: {int(counts.iloc[:, 0].sum())} rows, {len(baseline)} users")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Regenerate derived posture datasets from the raw dataset.")
+    parser.add_argument('--datasets', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Datasets'))
+    parser.add_argument('--workers', type=int, default=None, help="Process pool size (default: CPU count)")
+    parser.add_argument('--partitions', type=int, default=None, help="User_ID partitions (default: 4 x workers)")
+    parser.add_argument('--chunksize', type=int, default=CHUNKSIZE, help="Rows per chunk")
+    args = parser.parse_args()
+    run(os.path.abspath(args.datasets), args.workers, args.partitions, args.chunksize)
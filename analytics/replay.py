@@ -0,0 +1,285 @@
+"""
+Replay recorded sensor data into the live system.
+
+Sources are the Datasets/ tables (posture_raw_dataset.csv and friends), CSV or
+Parquet files from the dashboard's /export, or directories of them. Rows are
+read in chunks and split by user across worker processes, so each user's
+samples stay in order while users are replayed in parallel.
+
+Modes:
+  mqtt   publish each sample to neurochair/sensors/<device> on its original
+         schedule, at real time (--speed 1) or N x faster (--speed N); with
+         --speed 0 samples are sent as fast as possible
+  mongo  bulk-load straight into sensor_data with large unordered insert_many
+         batches (what data_processor.py would have stored, without the broker)
+
+Sources with a timestamp column keep their inter-sample timing. The Datasets/
+tables have none, so each user's rows are spaced 1 / --hz seconds apart. In
+mongo mode untimed rows are placed from --start (default: now), timestamped
+rows keep their timestamps unless --start moves them. Loaded documents are
+tagged source='replay', so a backfill can be removed again with
+db.sensor_data.deleteMany({source: 'replay'}). A mongo load bumps the data
+generation (data_processor.bump_data_generation), so the dashboard drops its
+cached aggregates of the days it filled; do the same after deleting one.
+
+Usage:
+    python replay.py mqtt [SOURCE ...] [--speed 10] [--broker localhost] [--workers N]
+    python replay.py mongo [SOURCE ...] [--start 2024-01-01T08:00] [--workers N]
+"""
+import argparse
+import datetime
+import glob
+import heapq
+import json
+import os
+import shutil
+import tempfile
+import time
+from multiprocessing import Process, Queue
+
+import pandas as pd
+from pymongo import MongoClient
+
+from preprocess import RAW_FILE, _partition_of
+
+MONGO_URI = os.getenv("MONGO_URI", "mongodb://mongodb:27017/neurochair")
+MQTT_BROKER = os.getenv("MQTT_BROKER", "localhost")
+DATASET_PATH = os.getenv("DATASET_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Datasets'))
+TOPIC_PREFIX = 'neurochair/sensors/'
+CHUNKSIZE = 100_000
+INSERT_BATCH = 10_000
+QUEUE_DEPTH = 4  # Frames buffered per worker before the reader blocks
+OFFSET = '_offset'  # Seconds since the start of the replay, in data time
+
+# ---- sources ----
+
+def source_files(paths):
+    """Expand directories into the CSV/Parquet files under them, in name order."""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            found = glob.glob(os.path.join(path, '**', '*.csv*'), recursive=True) + \
+                    glob.glob(os.path.join(path, '**', '*.parquet'), recursive=True)
+            files.extend(sorted(found))
+        else:
+            files.append(path)
+    return files
+
+def read_chunks(path, chunksize=CHUNKSIZE):
+    """DataFrames of up to chunksize rows from a CSV (optionally compressed) or Parquet file."""
+    if path.endswith('.parquet'):
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, chunksize=chunksize)
+
+def _normalize(df):
+    # Datasets/ use User_ID, exports use user_id; keep both spellings consistent
+    if 'User_ID' not in df and 'user_id' in df:
+        df = df.rename(columns={'user_id': 'User_ID'})
+    df = df.drop(columns=['_id', 'topic'], errors='ignore')
+    if 'timestamp' in df:
+        df['timestamp'] = pd.to_datetime(df['timestamp'])
+    return df.dropna(subset=['User_ID'])
+
+class Clock:
+    """
+    Assigns each row its offset from the start of the replay (in data time).
+    Timestamped sources are measured from their first timestamp; untimed rows
+    are spaced 1 / hz apart per user, continuing across chunks and files.
+    """
+    def __init__(self, hz):
+        self.hz = hz
+        self.origin = None  # First timestamp seen
+        self.counts = {}  # user id -> rows seen (untimed sources)
+
+    def assign(self, df):
+        if 'timestamp' in df and df['timestamp'].notna().any():
+            if self.origin is None:
+                self.origin = df['timestamp'].min()
+            return df.assign(**{OFFSET: (df['timestamp'] - self.origin).dt.total_seconds()})
+        position = df['User_ID'].map(self.counts).fillna(0).to_numpy() + df.groupby('User_ID', sort=False).cumcount().to_numpy()
+        for user_id, n in df.groupby('User_ID', sort=False).size().items():
+            self.counts[user_id] = self.counts.get(user_id, 0) + n
+        return df.assign(**{OFFSET: position / self.hz})
+
+def _records(df):
+    """Row dicts without missing values or replay bookkeeping (native Python types)."""
+    return [{k: v for k, v in record.items() if v == v}  # NaN/NaT != themselves
+            for record in df.drop(columns=OFFSET).to_dict('records')]
+
+# ---- mqtt: per-user spools merged on the replay schedule ----
+
+def _mqtt_client(client_id):
+    import paho.mqtt.client as mqtt
+    if hasattr(mqtt, 'CallbackAPIVersion'):  # paho-mqtt 2.x
+        return mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id=client_id)
+    return mqtt.Client(client_id=client_id)
+
+def spool(files, clock, workdir, partitions, chunksize=CHUNKSIZE):
+    """
+    Write each user's rows (with offsets) to their own file under
+    workdir/<partition>/. Sources are often grouped by user rather than by
+    time, so per-user files let every worker merge its users by offset.
+    Returns {partition: [paths]}.
+    """
+    paths, spooled = {}, {}
+    for path in files:
+        print(f"Reading {path}...")
+        for chunk in read_chunks(path, chunksize):
+            df = clock.assign(_normalize(chunk)).drop(columns='timestamp', errors='ignore')
+            partition_of = _partition_of(df['User_ID'], partitions)
+            for user_id, rows in df.groupby('User_ID', sort=False):
+                if user_id not in spooled:
+                    partition = int(partition_of[rows.index[0]])
+                    os.makedirs(os.path.join(workdir, str(partition)), exist_ok=True)
+                    spooled[user_id] = os.path.join(workdir, str(partition), f'{len(spooled)}.csv')
+                    paths.setdefault(partition, []).append(spooled[user_id])
+                rows.to_csv(spooled[user_id], mode='a', header=not os.path.exists(spooled[user_id]), index=False)
+    return paths
+
+def _devices(df):
+    # Chairs publish under their NFC tag; fall back to the user when there is none
+    return (df['NFC_ID'].fillna(df['User_ID']) if 'NFC_ID' in df else df['User_ID']).astype(str)
+
+def _user_messages(path, chunksize):
+    """(offset, topic, payload) for one user's spooled rows, in order."""
+    for df in pd.read_csv(path, chunksize=chunksize, float_precision='round_trip'):
+        devices = _devices(df)
+        # data_processor stamps the arrival time, as for a live chair
+        yield from zip(df[OFFSET].to_numpy(), TOPIC_PREFIX + devices, map(json.dumps, _records(df)))
+
+def _mqtt_worker(options, partition, paths, results):
+    sent, max_lag = 0, 0.0  # Seconds behind schedule at worst
+    try:
+        client = _mqtt_client(f"neurochair-replay-{os.getpid()}-{partition}")
+        client.connect(options['broker'], options['port'], 60)
+        client.loop_start()
+        info = None
+        merged = heapq.merge(*(_user_messages(p, options['chunksize']) for p in paths), key=lambda m: m[0])
+        for offset, topic, payload in merged:
+            if options['speed']:
+                delay = options['wall_start'] + offset / options['speed'] - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    max_lag = max(max_lag, -delay)
+            info = client.publish(topic, payload, qos=options['qos'])
+            sent += 1
+        if info is not None:
+            info.wait_for_publish()
+        client.loop_stop()
+        client.disconnect()
+    except Exception as e:
+        print(f"Replay worker {partition} failed after {sent} messages: {e}")
+    results.put((partition, sent, max_lag))
+
+# ---- mongo: unordered bulk inserts ----
+
+def _mongo_worker(options, partition, frames, results):
+    inserted = 0
+    try:
+        collection = MongoClient(options['mongo_uri'])['neurochair']['sensor_data']
+        start = pd.Timestamp(options['start'])
+        while True:
+            df = frames.get()
+            if df is None:
+                break
+            if not options['start_given'] and 'timestamp' in df and df['timestamp'].notna().all():
+                timestamps = df['timestamp']
+            else:
+                # Offsets keep timestamped sources' spacing, now counted from --start
+                timestamps = start + pd.to_timedelta(df[OFFSET], unit='s')
+            df = df.assign(timestamp=timestamps, source='replay',
+                           topic=TOPIC_PREFIX + _devices(df))
+            docs = _records(df)
+            for i in range(0, len(docs), options['batch_size']):
+                collection.insert_many(docs[i:i + options['batch_size']], ordered=False)
+            inserted += len(docs)
+    except Exception as e:
+        print(f"Replay worker {partition} failed after {inserted} rows: {e}")
+        while frames.get() is not None:  # Keep draining so the reader doesn't block
+            pass
+    results.put((partition, inserted, 0.0))
+
+# ---- driver ----
+
+def _replay_mqtt(files, clock, workers, options):
+    workdir = tempfile.mkdtemp(prefix='replay-')
+    try:
+        paths = spool(files, clock, workdir, workers, options['chunksize'])
+        options['wall_start'] = time.time() + 1.0  # Shared schedule; gives workers time to connect
+        results = Queue()
+        procs = [Process(target=_mqtt_worker, args=(options, p, user_paths, results))
+                 for p, user_paths in paths.items()]
+        for proc in procs:
+            proc.start()
+        totals = [results.get() for _ in procs]
+        for proc in procs:
+            proc.join()
+        return totals
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def _replay_mongo(files, clock, workers, options):
+    queues = [Queue(QUEUE_DEPTH) for _ in range(workers)]
+    results = Queue()
+    procs = [Process(target=_mongo_worker, args=(options, p, queues[p], results)) for p in range(workers)]
+    for proc in procs:
+        proc.start()
+    try:
+        for path in files:
+            print(f"Loading {path}...")
+            for chunk in read_chunks(path, options['chunksize']):
+                df = clock.assign(_normalize(chunk))
+                for partition, part in df.groupby(_partition_of(df['User_ID'], workers), sort=False):
+                    queues[partition].put(part)
+    finally:
+        for q in queues:
+            q.put(None)
+        totals = [results.get() for _ in procs]
+        for proc in procs:
+            proc.join()
+    if any(t[1] for t in totals):
+        # Loaded samples usually land in closed days: have the dashboard recompute them
+        from data_processor import bump_data_generation
+        bump_data_generation(MongoClient(options['mongo_uri'])['neurochair'])
+    return totals
+
+def run(mode, sources, workers=None, hz=1.0, **options):
+    """Replay sources with one worker process per group of users; returns rows sent."""
+    workers = workers or os.cpu_count() or 1
+    options.setdefault('chunksize', CHUNKSIZE)
+    files = source_files(sources)
+    started = time.time()
+    replay = _replay_mqtt if mode == 'mqtt' else _replay_mongo
+    totals = replay(files, Clock(hz), workers, options)
+    rows = sum(t[1] for t in totals)
+    seconds = time.time() - started
+    print(f"Replayed {rows} rows from {len(files)} files in {seconds:.1f} s ({rows / max(seconds, 1e-9):,.0f} rows/s)")
+    if mode == 'mqtt' and options['speed'] and totals:
+        print(f"Max publish lag behind schedule: {max(t[2] for t in totals):.3f} s")
+    return rows
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Replay recorded sensor data into MQTT or MongoDB.")
+    parser.add_argument('mode', choices=['mongo', 'mqtt'])
+    parser.add_argument('sources', nargs='*', default=[os.path.join(DATASET_PATH, RAW_FILE)],
+                        help="CSV/Parquet files or directories (default: the raw posture dataset)")
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes, users split between them (default: CPU count)")
+    parser.add_argument('--hz', type=float, default=1.0, help="Samples per second per user for sources without timestamps")
+    parser.add_argument('--chunksize', type=int, default=CHUNKSIZE, help="Rows read per chunk")
+    parser.add_argument('--speed', type=float, default=1.0, help="mqtt: playback speed multiplier, 0 = as fast as possible")
+    parser.add_argument('--broker', default=MQTT_BROKER)
+    parser.add_argument('--port', type=int, default=1883)
+    parser.add_argument('--qos', type=int, choices=[0, 1], default=0)
+    parser.add_argument('--mongo-uri', default=MONGO_URI)
+    parser.add_argument('--start', default=None, help="mongo: time of the first sample (ISO, default: now); "
+                                                      "timestamped sources are shifted to start here")
+    parser.add_argument('--batch-size', type=int, default=INSERT_BATCH, help="mongo: documents per insert_many")
+    args = parser.parse_args()
+    run(args.mode, args.sources, args.workers, args.hz, chunksize=args.chunksize,
+        speed=args.speed, broker=args.broker, port=args.port, qos=args.qos,
+        mongo_uri=args.mongo_uri, batch_size=args.batch_size,
+        start=args.start or datetime.datetime.now().isoformat(), start_given=args.start is not None)
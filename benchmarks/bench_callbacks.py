@@ -0,0 +1,280 @@
+"""
+Benchmark: cost of one refresh of each server-side dashboard callback, on
+synthetic data for 1 / 100 / 10,000 users with growing history lengths.
+
+    python benchmarks/bench_callbacks.py [--users 1 100 10000] [--samples 10 100] [--days 30]
+                                         [--mongo-uri mongodb://localhost:27017] [--repeat 5]
+                                         [--save-baseline] [--baseline PATH]
+
+The four tab modules register their callbacks on a test app whose layout is
+the four tabs plus the refresh intervals/stores. Each callback is called
+through the app's /_dash-update-component route (as the browser does, with
+the layout's initial values and its first input marked as changed), so the
+numbers include Dash's own serialization. Per callback it reports:
+
+  cold ms    first call after every cache was reset
+  warm ms    median of --repeat further calls (steady-state tick)
+  peak KB    tracemalloc peak of one warm call
+  bytes      size of the JSON response
+
+Synthetic samples are written to a scratch database (--db, dropped and
+refilled per dataset) and synthetic Datasets/ tables to a temp directory.
+Results are compared with the stored baseline (default
+benchmarks/baselines/bench_callbacks.json, written with --save-baseline) and
+the exit status is 1 when a callback regressed beyond the tolerances.
+Baselines are only comparable on the same machine and MongoDB.
+"""
+import argparse
+import datetime
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+import plotly.utils
+
+DASHBOARD_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "dashboard")
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines", "bench_callbacks.json")
+# Users the tabs ask for by default (end-user tab, patient selector), so every panel has data
+PINNED_USERS = ['U01', '123', '456', '789']
+DEPARTMENTS = ['eng', 'sales', 'hr', 'ops']
+FEATURE_ROWS_PER_USER = 20
+INSERT_BATCH = 10_000
+TIME_FLOOR_MS = 2.0  # Timing differences below this are noise
+
+# ---- synthetic data ----
+
+def user_ids(n):
+    return (PINNED_USERS + [f"U{i:05d}" for i in range(n)])[:n]
+
+def synthetic_samples(users, samples, days, seed=0):
+    """samples rows per user at random times over the last `days` days, in time order."""
+    rng = np.random.default_rng(seed)
+    n = len(users) * samples
+    now = pd.Timestamp.now()
+    posture_class = rng.integers(0, 4, n)
+    df = pd.DataFrame({
+        'timestamp': now - pd.to_timedelta(rng.uniform(0, days * 86400, n), unit='s'),
+        'user_id': np.repeat(users, samples),
+        'stress_level': rng.integers(1, 11, n),
+        'hrv': rng.integers(50, 100, n),
+        'gsr': rng.uniform(0.5, 2.0, n).round(2),
+        'Posture_Class': posture_class,
+        'posture_score': np.array([95, 75, 50, 25])[posture_class],
+        'AccX': rng.normal(0.2, 0.1, n), 'AccY': rng.normal(-0.9, 0.1, n), 'AccZ': rng.normal(0.3, 0.1, n),
+        'GyroX': rng.normal(5, 2, n), 'GyroY': rng.normal(3, 2, n), 'GyroZ': rng.normal(2, 2, n),
+        'FSR_Left': rng.integers(0, 3000, n), 'FSR_Right': rng.integers(0, 3000, n), 'FSR_Back': rng.integers(0, 3000, n),
+        'Limit_Back_Up': rng.integers(0, 2, n), 'Limit_Back_Down': rng.integers(0, 2, n),
+        'Limit_Left': rng.integers(0, 2, n), 'Limit_Right': rng.integers(0, 2, n),
+    })
+    return df.sort_values('timestamp', kind='stable').reset_index(drop=True)
+
+def write_datasets(dataset_dir, samples, users):
+    features = samples.groupby('user_id').head(FEATURE_ROWS_PER_USER).rename(columns={'user_id': 'User_ID'})
+    features.drop(columns=['timestamp', 'stress_level', 'hrv', 'gsr', 'posture_score']).to_csv(
+        os.path.join(dataset_dir, 'posture_features.csv'), index=False)
+    pd.DataFrame({'User_ID': users, 'Department': [DEPARTMENTS[i % len(DEPARTMENTS)] for i in range(len(users))]}).to_csv(
+        os.path.join(dataset_dir, 'user_departments.csv'), index=False)
+
+def load_database(db, samples):
+    db.drop_collection('sensor_data')
+    db.drop_collection('alerts')
+    collection = db['sensor_data']
+    for start in range(0, len(samples), INSERT_BATCH):
+        docs = samples.iloc[start:start + INSERT_BATCH].to_dict('records')
+        collection.insert_many(docs, ordered=False)
+
+# ---- dashboard under test ----
+
+def import_dashboard(mongo_uri, db_name, dataset_dir):
+    os.environ.setdefault('NEUROCHAIR_CACHE_DIR', tempfile.mkdtemp(prefix='bench-cache-'))
+    sys.path.insert(0, DASHBOARD_DIR)
+    import database
+    import data_loader
+    database.MONGO_URI = mongo_uri
+    database.DB_NAME = db_name
+    data_loader.DATASET_PATH = dataset_dir
+
+def reset_caches():
+    """Drop every in-process and shared cache, so the next call is cold."""
+    import alert_store
+    import clinical_summary
+    import org_cube
+    import pressure_map
+    from cache import shared_cache
+    shared_cache.clear()
+    clinical_summary.invalidate()
+    clinical_summary.range_cache.clear()
+    pressure_map.engine = pressure_map.PressureMapEngine()
+    # In production the cube and the alert store refresh in background threads;
+    # here they are loaded up front and left without the threads, so ticks are repeatable
+    org_cube._cube = org_cube.refreshed(org_cube.OrgCube())
+    alert_store._store = alert_store.AlertStore()
+    alert_store._store.load()
+
+def build_app():
+    import auth
+    import dash
+    from dash import dcc, html
+    from components.end_user_tab import render_end_user_tab, register_end_user_callbacks
+    from components.therapist_tab import render_therapist_tab, register_therapist_callbacks
+    from components.emergency_tab import render_emergency_tab, register_emergency_callbacks
+    from components.employer_tab import render_employer_tab, register_employer_callbacks
+    from refresh import create_intervals, LIVE_STORE_ID
+
+    app = dash.Dash(__name__, suppress_callback_exceptions=True)
+    auth.init_app(app.server)
+    app.layout = html.Div([
+        dcc.Store(id=LIVE_STORE_ID),
+        render_end_user_tab(), render_therapist_tab(), render_emergency_tab(), render_employer_tab(),
+        *create_intervals(),
+    ])
+    register_end_user_callbacks(app)
+    register_therapist_callbacks(app)
+    register_emergency_callbacks(app)
+    register_employer_callbacks(app)
+    return app
+
+def login(client, user, role='admin'):
+    """Log a test client in, as app.py's login does (signed session cookie)."""
+    with client.session_transaction() as session:
+        session['user'], session['role'] = user, role
+
+def _layout_values(layout):
+    values = {}
+    stack = [layout]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, (list, tuple)):
+            stack.extend(node)
+            continue
+        if not hasattr(node, 'to_plotly_json'):
+            continue
+        if getattr(node, 'id', None) is not None and isinstance(node.id, str):
+            values[node.id] = node
+        stack.append(getattr(node, 'children', None))
+    return values
+
+def _dependency(spec, components):
+    if spec['id'].startswith('{'):  # Pattern-matching (ALL) input: no matching components yet
+        return []
+    component = components.get(spec['id'])
+    value = getattr(component, spec['property'], None) if component is not None else None
+    return {'id': spec['id'], 'property': spec['property'], 'value': value}
+
+def callback_requests(app):
+    """(name, request body) for each server-side callback, with layout values as inputs."""
+    components = _layout_values(app.layout)
+    requests = []
+    for key, entry in app.callback_map.items():
+        if 'callback' not in entry:
+            continue  # Clientside
+        outputs = [{'id': o.component_id, 'property': o.component_property} for o in entry['output']] \
+            if isinstance(entry['output'], list) else {'id': entry['output'].component_id,
+                                                       'property': entry['output'].component_property}
+        inputs = [_dependency(s, components) for s in entry['inputs']]
+        changed = next((f"{s['id']}.{s['property']}" for s in entry['inputs'] if not s['id'].startswith('{')), None)
+        body = {'output': key, 'outputs': outputs, 'inputs': inputs,
+                'state': [_dependency(s, components) for s in entry['state']],
+                'changedPropIds': [changed] if changed else []}
+        func = entry['callback']
+        name = f"{func.__module__.split('.')[-1]}.{func.__name__}"
+        requests.append((name, json.dumps(body, cls=plotly.utils.PlotlyJSONEncoder)))
+    return requests
+
+def call(client, body):
+    t0 = time.perf_counter()
+    response = client.post('/_dash-update-component', data=body, content_type='application/json')
+    ms = (time.perf_counter() - t0) * 1000
+    if response.status_code not in (200, 204):
+        raise RuntimeError(f"HTTP {response.status_code}: {response.get_data(as_text=True)[:200]}")
+    return ms, len(response.get_data())
+
+def measure(client, body, repeat):
+    cold_ms, size = call(client, body)
+    warm = [call(client, body)[0] for _ in range(repeat)]
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    call(client, body)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {'cold_ms': round(cold_ms, 2), 'warm_ms': round(statistics.median(warm), 2),
+            'peak_kb': round(peak / 1024, 1), 'bytes': size}
+
+# ---- baselines ----
+
+def compare(results, baseline, time_tolerance, tolerance):
+    regressions = []
+    for key, r in results.items():
+        base = baseline.get(key)
+        if base is None:
+            continue
+        if r['warm_ms'] > base['warm_ms'] * (1 + time_tolerance) and r['warm_ms'] - base['warm_ms'] > TIME_FLOOR_MS:
+            regressions.append(f"{key}: warm {base['warm_ms']} -> {r['warm_ms']} ms")
+        if r['cold_ms'] > base['cold_ms'] * (1 + time_tolerance) and r['cold_ms'] - base['cold_ms'] > TIME_FLOOR_MS:
+            regressions.append(f"{key}: cold {base['cold_ms']} -> {r['cold_ms']} ms")
+        for metric in ('peak_kb', 'bytes'):
+            if r[metric] > base[metric] * (1 + tolerance):
+                regressions.append(f"{key}: {metric} {base[metric]} -> {r[metric]}")
+    return regressions
+
+def run(users_list, samples_list, days, mongo_uri, db_name, repeat):
+    dataset_dir = tempfile.mkdtemp(prefix='bench-datasets-')
+    import_dashboard(mongo_uri, db_name, dataset_dir)
+    import database
+    app = build_app()
+    client = app.server.test_client()
+    login(client, 'U01')  # admin: every tab's callbacks run
+    requests = callback_requests(app)
+    db = database.get_db()
+
+    results = {}
+    print(f"{'users':>6} {'samples':>8} {'callback':<40} {'cold ms':>9} {'warm ms':>9} {'peak KB':>9} {'bytes':>9}")
+    for n_users in users_list:
+        for samples_per_user in samples_list:
+            users = user_ids(n_users)
+            samples = synthetic_samples(users, samples_per_user, days)
+            write_datasets(dataset_dir, samples, users)
+            load_database(db, samples)
+            reset_caches()
+            for name, body in requests:
+                r = measure(client, body, repeat)
+                results[f"{name}|users={n_users}|samples={samples_per_user}"] = r
+                print(f"{n_users:>6} {samples_per_user:>8} {name:<40} {r['cold_ms']:>9.1f} {r['warm_ms']:>9.1f} "
+                      f"{r['peak_kb']:>9.1f} {r['bytes']:>9}")
+    db.drop_collection('sensor_data')
+    db.drop_collection('alerts')
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, nargs="+", default=[1, 100, 10_000])
+    parser.add_argument("--samples", type=int, nargs="+", default=[10, 100], help="History length, samples per user")
+    parser.add_argument("--days", type=float, default=30, help="Days the history is spread over")
+    parser.add_argument("--mongo-uri", default=os.getenv("MONGO_URI", "mongodb://localhost:27017"))
+    parser.add_argument("--db", default="neurochair_bench", help="Scratch database (dropped and refilled)")
+    parser.add_argument("--repeat", type=int, default=5, help="Warm calls per callback")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="Store these results as the new baseline")
+    parser.add_argument("--time-tolerance", type=float, default=0.5, help="Allowed relative slowdown")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Allowed relative growth of peak KB and bytes")
+    args = parser.parse_args()
+
+    results = run(args.users, args.samples, args.days, args.mongo_uri, args.db, args.repeat)
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, 'w') as f:
+            json.dump({'created': datetime.datetime.now().isoformat(timespec='seconds'), 'results': results}, f, indent=1)
+        print(f"Baseline saved to {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f)['results'], args.time_tolerance, args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        print(f"{len(regressions)} regressions against {args.baseline}")
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,73 @@
+"""
+Benchmark: payload size and build/serialize time of long time-series charts,
+raw go.Scatter vs LTTB / min-max downsampling (dashboard/downsample.py).
+
+    python benchmarks/bench_downsample.py [--days 30 90] [--hz 1] [--html-dir out/]
+
+Browser render time can't be measured server-side; with --html-dir each variant
+is written as a standalone HTML page that reports its own render time in the
+page title and console when opened.
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+from plotly.io.json import to_json_plotly
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "dashboard"))
+from downsample import time_series_trace, DEFAULT_CHART_WIDTH  # noqa: E402
+
+RENDER_TIMER_JS = """
+var t0 = performance.now();
+var gd = document.getElementById('{plot_id}');
+requestAnimationFrame(function () {
+    var ms = (performance.now() - t0).toFixed(1);
+    document.title = 'render ' + ms + ' ms';
+    console.log('render ms', ms);
+});
+"""
+
+def synthetic_series(days, hz):
+    n = int(days * 86400 * hz)
+    x = pd.date_range(end=pd.Timestamp.now(), periods=n, freq=pd.Timedelta(seconds=1 / hz)).values
+    rng = np.random.default_rng(0)
+    y = 5 + np.cumsum(rng.normal(0, 0.01, n)) + rng.normal(0, 0.5, n)
+    y[rng.integers(0, n, 20)] += 4  # Spikes that should survive downsampling
+    return x, y
+
+def build(x, y, variant):
+    fig = go.Figure()
+    if variant == 'raw':
+        fig.add_trace(go.Scatter(x=x, y=y, line={'width': 1.5}))
+    else:
+        fig.add_trace(time_series_trace(x, y, method=variant, line={'width': 1.5}))
+    return fig
+
+def run(days_list, hz, html_dir):
+    print(f"{'days':>5} {'points':>10} {'variant':>8} {'out pts':>8} {'trace':>10} {'bytes':>12} {'build+json ms':>14}")
+    for days in days_list:
+        x, y = synthetic_series(days, hz)
+        for variant in ('raw', 'lttb', 'minmax'):
+            t0 = time.perf_counter()
+            fig = build(x, y, variant)
+            payload = to_json_plotly(fig)
+            ms = (time.perf_counter() - t0) * 1000
+            trace = fig.data[0]
+            print(f"{days:>5} {len(x):>10} {variant:>8} {len(trace.x):>8} {trace.type:>10} {len(payload):>12} {ms:>14.1f}")
+            if html_dir:
+                os.makedirs(html_dir, exist_ok=True)
+                path = os.path.join(html_dir, f"trend_{days}d_{variant}.html")
+                fig.write_html(path, include_plotlyjs='cdn', post_script=RENDER_TIMER_JS,
+                               default_width=DEFAULT_CHART_WIDTH)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--days", type=int, nargs="+", default=[30, 90])
+    parser.add_argument("--hz", type=float, default=1.0, help="Samples per second in the synthetic series")
+    parser.add_argument("--html-dir", default=None, help="Write per-variant HTML pages with a render timer")
+    args = parser.parse_args()
+    run(args.days, args.hz, args.html_dir)
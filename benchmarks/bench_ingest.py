@@ -0,0 +1,301 @@
+"""
+Benchmark: MQTT ingestion throughput, per-stage latency and memory of
+analytics/data_processor.py, per ingestion mode, without the docker-compose stack.
+
+    python benchmarks/bench_ingest.py [--messages 20000] [--modes single batch]
+                                      [--transport direct|mqtt] [--sink memory|mongo]
+                                      [--source Datasets/posture_raw_dataset.csv] [--launch]
+                                      [--envelope 500]
+
+Transports:
+  direct  messages are handed to Ingestor.on_message in-process (no broker)
+  mqtt    messages go through a real broker (--broker host:port); with --launch
+          a local mosquitto is started on a free port for the run; the
+          consumer is data_processor's persistent-session client (QoS 1,
+          acks after the insert), so throughput includes the ack round trip
+Sinks:
+  memory  in-process stand-in for the sensor_data collection, optionally
+          charging --sink-latency-ms per insert call to model the round trip
+  mongo   a real collection (--mongo-uri, scratch database neurochair_bench);
+          with --launch a local mongod is started in a temp directory
+
+With --envelope N, samples are packed into gateway envelopes (analytics/
+envelope.py) of N samples each, as gateway.py would publish them, and
+throughput is reported in samples/s; stage latencies are then per envelope.
+
+Messages are synthetic chair samples, or rows of a recorded CSV/Parquet file
+(--source) cycled to --messages. Reported per mode: messages/s, mean/p50/p99
+latency of the decode, enrich (timestamp, topic, posture scoring) and store
+stages, broker latency (mqtt transport), process max RSS and, with
+--trace-memory, the tracemalloc peak of the run.
+"""
+import argparse
+import json
+import os
+import resource
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections import defaultdict
+
+import numpy as np
+import pandas as pd
+from paho.mqtt.packettypes import PacketTypes
+from paho.mqtt.properties import Properties
+
+ANALYTICS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "analytics")
+sys.path.insert(0, ANALYTICS_DIR)
+import data_processor  # noqa: E402
+import envelope  # noqa: E402
+from data_processor import STAGES, Ingestor  # noqa: E402
+
+SENT_FIELD = 'bench-sent'  # MQTT v5 user property carrying the publish time (mqtt transport)
+
+# ---- messages ----
+
+def synthetic_messages(n, users=10, seed=0):
+    rng = np.random.default_rng(seed)
+    messages = []
+    for i in range(n):
+        user = i % users
+        messages.append((f"neurochair/sensors/NFC{user:02d}", {
+            'User_ID': f"U{user + 1:02d}", 'NFC_ID': f"NFC{user:02d}",
+            'stress_level': int(rng.integers(1, 11)), 'hrv': int(rng.integers(50, 100)),
+            'gsr': round(float(rng.uniform(0.5, 2.0)), 2),
+            'AccX': float(rng.normal(0.2, 0.1)), 'AccY': float(rng.normal(-0.9, 0.1)), 'AccZ': float(rng.normal(0.3, 0.1)),
+            'GyroX': float(rng.normal(5, 2)), 'GyroY': float(rng.normal(3, 2)), 'GyroZ': float(rng.normal(2, 2)),
+            'FSR_Left': int(rng.integers(0, 3000)), 'FSR_Right': int(rng.integers(0, 3000)),
+            'FSR_Back': int(rng.integers(0, 3000)),
+            'Limit_Back_Up': 0, 'Limit_Back_Down': 1, 'Limit_Left': 0, 'Limit_Right': 0,
+        }))
+    return messages
+
+def recorded_messages(path, n):
+    df = pd.read_parquet(path) if path.endswith('.parquet') else pd.read_csv(path)
+    records = [{k: v for k, v in r.items() if v == v} for r in df.to_dict('records')]
+    device = lambda r: r.get('NFC_ID') or r.get('User_ID') or r.get('user_id')  # noqa: E731
+    return [(f"neurochair/sensors/{device(r)}", r) for r in (records[i % len(records)] for i in range(n))]
+
+# ---- sinks ----
+
+class MemoryCollection:
+    """Counts inserted documents; latency_ms is charged per insert call."""
+    def __init__(self, latency_ms=0.0):
+        self.latency = latency_ms / 1000
+        self.count = 0
+        self.calls = 0
+        self.last = None
+
+    def _charge(self):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def insert_one(self, doc):
+        self._charge()
+        self.count += 1
+        self.last = doc
+
+    def insert_many(self, docs, ordered=True):
+        self._charge()
+        self.count += len(docs)
+        self.last = docs[-1]
+
+class MongoCollection:
+    """A real collection, emptied before each mode."""
+    def __init__(self, uri):
+        from pymongo import MongoClient
+        self.collection = MongoClient(uri, serverSelectionTimeoutMS=5000)['neurochair_bench']['sensor_data']
+        self.collection.drop()
+
+    def __getattr__(self, name):
+        return getattr(self.collection, name)
+
+    @property
+    def count(self):
+        return self.collection.estimated_document_count()
+
+# ---- transports ----
+
+def _mqtt_client(client_id, protocol=4):
+    import paho.mqtt.client as mqtt
+    return mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id=client_id, protocol=protocol)
+
+class _Message:
+    """QoS 0 message as paho hands it to on_message (no ack)."""
+    def __init__(self, topic, payload):
+        self.topic = topic
+        self.payload = payload
+        self.mid = 0
+        self.qos = 0
+        self.dup = False
+
+def envelopes(payloads, size):
+    """payloads packed into envelopes of size samples, from devices spread over a one-second window."""
+    packed = []
+    for start in range(0, len(payloads), size):
+        chunk = payloads[start:start + size]
+        samples = [(topic, i / len(chunk), json.loads(payload)) for i, (topic, payload) in enumerate(chunk)]
+        packed.append((envelope.TOPIC_PREFIX + 'bench', envelope.encode(samples, 'bench', 1.0)))
+    return packed
+
+def run_direct(ingestor, payloads):
+    for topic, payload in payloads:
+        ingestor.on_message(None, None, _Message(topic, payload))
+    ingestor.flush()
+    return []
+
+def run_mqtt(ingestor, payloads, samples, host, port, timeout=120):
+    broker_latency = []
+    on_message = ingestor.on_message
+
+    def timed_on_message(client, userdata, msg):
+        sent = msg.properties.UserProperty[0][1] if getattr(msg.properties, 'UserProperty', None) else None
+        if sent is not None:
+            broker_latency.append(time.time() - float(sent))
+        on_message(client, userdata, msg)
+
+    subscribed = threading.Event()
+    consumer = data_processor.create_client(ingestor, f"bench-ingest-{os.getpid()}")
+    consumer.on_connect = lambda c, u, f, rc, p=None: (ingestor.on_connect(c, u, f, rc, p), subscribed.set())
+    consumer.on_message = timed_on_message
+    data_processor.connect(consumer, host, port)
+    consumer.loop_start()
+    publisher = _mqtt_client(f"bench-publisher-{os.getpid()}", protocol=5)
+    publisher.connect(host, port, 60)
+    publisher.loop_start()
+    try:
+        subscribed.wait(10)
+        time.sleep(0.5)  # Let the SUBACK settle before publishing
+        for topic, payload in payloads:
+            properties = Properties(PacketTypes.PUBLISH)
+            properties.UserProperty = (SENT_FIELD, str(time.time()))
+            publisher.publish(topic, payload, qos=1, properties=properties)
+        deadline = time.time() + timeout
+        while ingestor.stored + len(ingestor._buffer) < samples and time.time() < deadline:
+            time.sleep(0.01)
+        ingestor.flush()
+    finally:
+        publisher.loop_stop()
+        publisher.disconnect()
+        consumer.loop_stop()
+        consumer.disconnect()
+    return broker_latency
+
+# ---- local services ----
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def launch(binary, args, port, workdir):
+    if shutil.which(binary) is None:
+        sys.exit(f"--launch needs {binary} on PATH")
+    proc = subprocess.Popen([binary] + args, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, cwd=workdir)
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.5).close()
+            return proc
+        except OSError:
+            time.sleep(0.2)
+    proc.kill()
+    sys.exit(f"{binary} did not start on port {port}")
+
+# ---- driver ----
+
+def _ms(values):
+    if not values:
+        return '-'
+    a = np.asarray(values) * 1000
+    return f"{a.mean():.3f}/{np.percentile(a, 50):.3f}/{np.percentile(a, 99):.3f}"
+
+def bench_mode(mode, payloads, samples, make_sink, transport, broker, batch_size, scorer, trace_memory):
+    sink = make_sink()
+    timings = defaultdict(list)
+    ingestor = Ingestor(sink, mode=mode, batch_size=batch_size, scorer=scorer, log_messages=False, timings=timings)
+    if mode == 'batch':
+        ingestor.start_flusher()
+    if trace_memory:
+        tracemalloc.start()
+    t0 = time.perf_counter()
+    if transport == 'direct':
+        broker_latency = run_direct(ingestor, payloads)
+    else:
+        broker_latency = run_mqtt(ingestor, payloads, samples, broker[0], broker[1])
+    seconds = time.perf_counter() - t0
+    peak = f"{tracemalloc.get_traced_memory()[1] / 1024:.0f}" if trace_memory else '-'
+    tracemalloc.stop()
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # ru_maxrss is KB on Linux
+    stored = sink.count
+    print(f"{mode:>7} {stored:>8} {stored / seconds:>10,.0f} " +
+          " ".join(f"{_ms(timings[s]):>22}" for s in STAGES) +
+          f" {_ms(broker_latency):>22} {peak:>9} {max_rss:>11.0f}")
+
+def run(args):
+    payloads = recorded_messages(args.source, args.messages) if args.source else synthetic_messages(args.messages)
+    payloads = [(topic, json.dumps(data).encode()) for topic, data in payloads]
+    samples = len(payloads)
+    if args.envelope:
+        payloads = envelopes(payloads, args.envelope)
+    scorer = data_processor.load_scorer() if args.score else None
+
+    services = []
+    workdir = tempfile.mkdtemp(prefix='bench-ingest-')
+    try:
+        broker = None
+        if args.transport == 'mqtt':
+            if args.launch:
+                port = _free_port()
+                services.append(launch('mosquitto', ['-p', str(port)], port, workdir))
+                broker = ('127.0.0.1', port)
+            else:
+                host, _, port = args.broker.partition(':')
+                broker = (host, int(port or 1883))
+        if args.sink == 'mongo':
+            uri = args.mongo_uri
+            if args.launch:
+                port = _free_port()
+                os.makedirs(os.path.join(workdir, 'db'))
+                services.append(launch('mongod', ['--dbpath', os.path.join(workdir, 'db'), '--port', str(port),
+                                                  '--bind_ip', '127.0.0.1'], port, workdir))
+                uri = f"mongodb://127.0.0.1:{port}"
+            make_sink = lambda: MongoCollection(uri)  # noqa: E731
+        else:
+            make_sink = lambda: MemoryCollection(args.sink_latency_ms)  # noqa: E731
+
+        print(f"{samples} samples in {len(payloads)} messages, transport={args.transport}, sink={args.sink}, "
+              f"scoring={'on' if scorer else 'off'}; latencies mean/p50/p99 ms")
+        print(f"{'mode':>7} {'stored':>8} {'samples/s':>10} " + " ".join(f"{s:>22}" for s in STAGES) +
+              f" {'broker':>22} {'peak KB':>9} {'max RSS MB':>11}")
+        for mode in args.modes:
+            bench_mode(mode, payloads, samples, make_sink, args.transport, broker, args.batch_size, scorer, args.trace_memory)
+    finally:
+        for proc in services:
+            proc.terminate()
+            proc.wait(10)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=20_000)
+    parser.add_argument("--modes", nargs="+", choices=["single", "batch"], default=["single", "batch"])
+    parser.add_argument("--batch-size", type=int, default=data_processor.BATCH_SIZE)
+    parser.add_argument("--envelope", type=int, default=0, help="Samples per gateway envelope (0: one message per sample)")
+    parser.add_argument("--transport", choices=["direct", "mqtt"], default="direct")
+    parser.add_argument("--sink", choices=["memory", "mongo"], default="memory")
+    parser.add_argument("--sink-latency-ms", type=float, default=0.0, help="memory sink: simulated round trip per insert call")
+    parser.add_argument("--source", default=None, help="Recorded CSV/Parquet to replay instead of synthetic samples")
+    parser.add_argument("--score", action="store_true", help="Score posture with the latest model, as data_processor does")
+    parser.add_argument("--broker", default="localhost:1883")
+    parser.add_argument("--mongo-uri", default="mongodb://localhost:27017")
+    parser.add_argument("--launch", action="store_true", help="Start mosquitto / mongod locally for the run")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="Report the tracemalloc peak (slows ingestion, so throughput drops)")
+    run(parser.parse_args())
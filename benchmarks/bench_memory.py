@@ -0,0 +1,113 @@
+"""
+Benchmark: memory per sample of sensor frames and ingestion buffers, before and
+after the compact dtypes of dashboard/schema.py.
+
+    python benchmarks/bench_memory.py [--rows 100000] [--users 100] [--columns]
+                                      [--features Datasets/posture_features.csv]
+
+Reported in bytes per sample (deep pandas memory usage, index included):
+
+  features   the features table as data_loader.load_features_frame holds it
+             (default: synthetic rows written to a temp CSV; --features reads
+             a real posture_features.csv)
+  docs       a frame built from sensor_data documents (data_loader.docs_to_frame)
+  pickled    the same frames as stored in the shared filesystem cache
+  buffer     documents held in data_processor's batch buffer (tracemalloc),
+             with and without interned IDs
+
+--columns adds the per-column breakdown of each frame.
+"""
+import argparse
+import datetime
+import json
+import os
+import pickle
+import sys
+import tempfile
+import tracemalloc
+
+import pandas as pd
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, "..", "dashboard"))
+sys.path.insert(0, os.path.join(BENCH_DIR, "..", "analytics"))
+import data_loader  # noqa: E402
+import schema  # noqa: E402
+from bench_ingest import synthetic_messages  # noqa: E402
+from data_processor import compact_document, decode, enrich  # noqa: E402
+
+def synthetic_docs(rows, users):
+    start = datetime.datetime(2024, 1, 1, 8)
+    docs = []
+    for i, (topic, data) in enumerate(synthetic_messages(rows, users=users)):
+        data.update(timestamp=start + datetime.timedelta(seconds=i), topic=topic, Posture_Class=i % 4,
+                    posture_score=data_loader.POSTURE_SCORES[i % 4], user_id=data.pop('User_ID'))
+        docs.append(data)
+    return docs
+
+def features_frames(path, rows, users):
+    """(as pandas infers it, compact) for a features CSV; synthetic when path is None."""
+    tmp = None
+    if path is None:
+        docs = synthetic_docs(rows, users)
+        frame = pd.DataFrame(docs).drop(columns=['timestamp', 'topic', 'posture_score'])
+        tmp = tempfile.NamedTemporaryFile(suffix='.csv', delete=False)
+        frame.rename(columns={'user_id': 'User_ID'}).to_csv(tmp.name, index=False)
+        path = tmp.name
+    try:
+        before = pd.read_csv(path)
+        after = schema.compact(pd.read_csv(path, dtype=schema.READ_DTYPES))
+    finally:
+        if tmp is not None:
+            os.remove(tmp.name)
+    return before, after
+
+def buffer_bytes(docs, compact):
+    """tracemalloc bytes per document for decoded, enriched documents held in a list."""
+    payloads = [(d['topic'], json.dumps({k: v for k, v in d.items() if k not in ('timestamp', 'topic')}).encode())
+                for d in docs]
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    buffer = []
+    for topic, payload in payloads:
+        doc = enrich(decode(payload), topic)
+        buffer.append(compact_document(doc) if compact else doc)
+    used = tracemalloc.get_traced_memory()[0] - base
+    tracemalloc.stop()
+    return used / len(buffer)
+
+def _row(name, before, after):
+    print(f"{name:<28} {before:>10.1f} {after:>10.1f} {before / after if after else 0:>7.2f}x")
+
+def _columns(before, after):
+    b, a = schema.bytes_per_sample(before), schema.bytes_per_sample(after)
+    for column in b:
+        if column != 'total':
+            print(f"  {column:<26} {b[column]:>10.1f} {a.get(column, 0.0):>10.1f}  "
+                  f"{before[column].dtype if column in before else ''} -> {after[column].dtype if column in after else ''}")
+
+def run(args):
+    docs = synthetic_docs(args.rows, args.users)
+    features = features_frames(args.features, args.rows, args.users)
+    frames = {'features': features,
+              'docs': (data_loader.docs_to_frame(docs, compact=False), data_loader.docs_to_frame(docs))}
+    print(f"{args.rows} samples, {args.users} users; bytes per sample")
+    print(f"{'':<28} {'before':>10} {'after':>10} {'ratio':>8}")
+    for name, (before, after) in frames.items():
+        n = len(before)
+        _row(f"{name} ({n} rows)", schema.bytes_per_sample(before)['total'], schema.bytes_per_sample(after)['total'])
+        _row(f"{name} pickled", len(pickle.dumps(before, pickle.HIGHEST_PROTOCOL)) / n,
+             len(pickle.dumps(after, pickle.HIGHEST_PROTOCOL)) / n)
+        if args.columns:
+            _columns(before, after)
+    sample = docs[:args.buffer_docs]
+    _row(f"buffer ({len(sample)} docs)", buffer_bytes(sample, False), buffer_bytes(sample, True))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--features", default=None, help="posture_features.csv to measure instead of synthetic rows")
+    parser.add_argument("--buffer-docs", type=int, default=10_000, help="Documents in the ingestion buffer measurement")
+    parser.add_argument("--columns", action="store_true", help="Per-column breakdown")
+    run(parser.parse_args())
@@ -0,0 +1,46 @@
+"""
+Benchmark: posture classifier training time, hold-out accuracy and batch
+scoring throughput (analytics/posture_model.py).
+
+    python benchmarks/bench_posture_model.py [--rows 10000 1000000] [--chunk-rows 4096 65536]
+
+Training uses Datasets/posture_features.csv. Scoring runs on synthetic feature
+matrices of the requested sizes, so throughput doesn't depend on dataset size.
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "analytics"))
+from posture_model import MODEL_FEATURES, train  # noqa: E402
+from preprocess import FEATURES_FILE, FILTERED_FILE  # noqa: E402
+
+DATASETS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Datasets")
+
+def run(rows_list, chunk_rows_list):
+    t0 = time.perf_counter()
+    model = train(os.path.join(DATASETS, FEATURES_FILE), os.path.join(DATASETS, FILTERED_FILE))
+    train_s = time.perf_counter() - t0
+    print(f"train: {train_s:.1f} s, {model.metadata['train_rows']} rows, "
+          f"hold-out accuracy {model.metadata['test_accuracy']:.3f}")
+
+    rng = np.random.default_rng(0)
+    print(f"{'rows':>10} {'chunk':>8} {'ms':>10} {'rows/s':>14}")
+    for rows in rows_list:
+        X = rng.normal(size=(rows, len(MODEL_FEATURES))).astype(np.float32)
+        for chunk_rows in chunk_rows_list:
+            model.predict(X[:chunk_rows], chunk_rows)  # Warm-up
+            t0 = time.perf_counter()
+            model.predict(X, chunk_rows)
+            seconds = time.perf_counter() - t0
+            print(f"{rows:>10} {chunk_rows:>8} {seconds * 1000:>10.1f} {rows / seconds:>14,.0f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 1_000_000])
+    parser.add_argument("--chunk-rows", type=int, nargs="+", default=[4096, 65536])
+    args = parser.parse_args()
+    run(args.rows, args.chunk_rows)
@@ -0,0 +1,150 @@
+"""
+Benchmark: dashboard startup, eager vs lazy tab loading (DASH_LAZY_STARTUP).
+
+    python benchmarks/bench_startup.py [--modes eager lazy] [--server dev|gunicorn]
+                                       [--runs 3] [--workers 1] [--top 10]
+
+Per mode it reports:
+
+  import ms     `import app` under python -X importtime, and the packages
+                with the largest self import time
+  port ms       process spawn -> server accepting connections
+  login ms      spawn -> GET / answered (the login page can paint)
+  deps ms       spawn -> GET /_dash-dependencies answered (the renderer has
+                the callback graph; in lazy mode this waits for the tabs)
+  tab ms        spawn -> first tab rendered by render_tab_content (first
+                dashboard paint after login)
+
+Servers are started on a free local port from dashboard/, with the Flask dev
+server (--server dev) or gunicorn with gunicorn.conf.py (--server gunicorn).
+Tabs that query MongoDB render with empty data when it is unreachable, so no
+database is needed; medians over --runs are printed.
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict
+
+DASHBOARD_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "dashboard")
+TIMEOUT = 120
+
+def _env(mode, **extra):
+    env = dict(os.environ, DASH_LAZY_STARTUP="1" if mode == "lazy" else "0", DASH_DEBUG="0", **extra)
+    env.setdefault("MONGO_URI", "mongodb://127.0.0.1:1/neurochair")  # Fail fast without a database
+    return env
+
+# ---- import time ----
+
+def import_profile(mode):
+    """(total ms of `import app`, {top-level package: self ms})"""
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app"], cwd=DASHBOARD_DIR,
+                          env=_env(mode), capture_output=True, text=True, timeout=TIMEOUT)
+    total, packages = None, defaultdict(float)
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        packages[name.strip().split(".")[0]] += int(self_us) / 1000
+        if name.strip() == "app":
+            total = int(cumulative_us) / 1000
+    if total is None:
+        sys.exit(f"import app failed:\n{proc.stderr[-2000:]}")
+    return total, packages
+
+# ---- server ----
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def _spawn(mode, server, port, workers):
+    if server == "gunicorn":
+        cmd = ["gunicorn", "-c", "gunicorn.conf.py", "wsgi:server"]
+    else:
+        cmd = [sys.executable, "-c", f"import app; app.app.run(host='127.0.0.1', port={port}, debug=False)"]
+    env = _env(mode, PORT=str(port), GUNICORN_WORKERS=str(workers))
+    return subprocess.Popen(cmd, cwd=DASHBOARD_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+def _until(check, deadline):
+    while time.time() < deadline:
+        try:
+            if check():
+                return
+        except (OSError, urllib.error.URLError):
+            pass
+        time.sleep(0.01)
+    raise TimeoutError
+
+def _get(url):
+    with urllib.request.urlopen(url, timeout=TIMEOUT) as response:
+        return response.status == 200
+
+def _first_tab(url):
+    body = json.dumps({
+        'output': 'tab-content.children', 'outputs': {'id': 'tab-content', 'property': 'children'},
+        'inputs': [{'id': 'tabs', 'property': 'active_tab', 'value': 'end-user'}],
+        'changedPropIds': ['tabs.active_tab'],
+    }).encode()
+    request = urllib.request.Request(url, data=body, headers={'Content-Type': 'application/json'})
+    with urllib.request.urlopen(request, timeout=TIMEOUT) as response:
+        return response.status == 200
+
+def startup_run(mode, server, workers):
+    port = _free_port()
+    base = f"http://127.0.0.1:{port}"
+    t0 = time.time()
+    proc = _spawn(mode, server, port, workers)
+    deadline = t0 + TIMEOUT
+    times = {}
+    try:
+        _until(lambda: socket.create_connection(('127.0.0.1', port), timeout=0.5).close() or True, deadline)
+        times['port'] = time.time() - t0
+        _until(lambda: _get(base + "/"), deadline)
+        times['login'] = time.time() - t0
+        _until(lambda: _get(base + "/_dash-dependencies"), deadline)
+        times['deps'] = time.time() - t0
+        _until(lambda: _first_tab(base + "/_dash-update-component"), deadline)
+        times['tab'] = time.time() - t0
+    except TimeoutError:
+        print(f"{mode}: server did not come up within {TIMEOUT}s")
+    finally:
+        proc.terminate()
+        proc.wait(30)
+    return times
+
+def run(args):
+    print(f"server={args.server}, runs={args.runs}; medians in ms")
+    print(f"{'mode':>6} {'import':>8} {'port':>8} {'login':>8} {'deps':>8} {'tab':>8}")
+    profiles = {}
+    for mode in args.modes:
+        imports, steps = [], defaultdict(list)
+        for _ in range(args.runs):
+            total, profiles[mode] = import_profile(mode)
+            imports.append(total)
+            for step, seconds in startup_run(mode, args.server, args.workers).items():
+                steps[step].append(seconds * 1000)
+        cells = [f"{statistics.median(steps[s]):>8.0f}" if steps[s] else f"{'-':>8}"
+                 for s in ('port', 'login', 'deps', 'tab')]
+        print(f"{mode:>6} {statistics.median(imports):>8.0f} " + " ".join(cells))
+    for mode, packages in profiles.items():
+        top = sorted(packages.items(), key=lambda item: -item[1])[:args.top]
+        print(f"\n{mode}: largest self import time (last run)")
+        for name, ms in top:
+            print(f"  {name:<30} {ms:>8.1f} ms")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modes", nargs="+", choices=["eager", "lazy"], default=["eager", "lazy"])
+    parser.add_argument("--server", choices=["dev", "gunicorn"], default="dev")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--workers", type=int, default=1, help="gunicorn workers")
+    parser.add_argument("--top", type=int, default=10, help="Packages listed per mode")
+    run(parser.parse_args())
@@ -0,0 +1,128 @@
+"""
+Benchmark: end-user tab latency with many concurrently logged-in users, with
+and without background prewarming (dashboard/active_users.py).
+
+    python benchmarks/bench_users.py [--users 1000] [--samples 20] [--days 7] [--seconds 20]
+                                     [--clients 8] [--interval 2.0] [--render-delay 0.3]
+                                     [--mongo-uri mongodb://localhost:27017]
+
+Users log in at a steady rate over the first half of the run. --render-delay
+seconds after its login (page load) a user's first render calls all three
+end-user callbacks; from then on the user ticks update_dashboard once per
+--interval seconds (the live refresh cadence) logged in as themselves (signed
+session cookie). --clients threads call the app's /_dash-update-component route. The
+run is done twice on the same data, prewarming off then on, each after every
+cache was reset. Per run it reports p50 / p99 / max of first renders (all
+three callbacks) and of live ticks, the share of ticks under 100 ms and the
+per-user cache partition stats of the process.
+
+Data is written like bench_callbacks.py does: a scratch database (--db,
+dropped and refilled) and synthetic Datasets/ tables in a temp directory.
+"""
+import argparse
+import heapq
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+import bench_callbacks  # noqa: E402
+
+TICK_CALLBACK = 'end_user_tab.update_dashboard'
+RENDER_CALLBACKS = ('end_user_tab.update_dashboard', 'end_user_tab.update_hourly', 'end_user_tab.update_weekly')
+TARGET_MS = 100
+
+def _client_loop(app, schedule, requests, args, deadline, renders, ticks):
+    """Play (login time, user) events: login, first render, then live ticks until deadline."""
+    clients = {}  # user -> test client holding the user's session cookie
+    events = [(at, 'login', user) for at, user in schedule]
+    heapq.heapify(events)
+    while events:
+        at, kind, user = heapq.heappop(events)
+        if at >= deadline:
+            return
+        time.sleep(max(0.0, at - time.monotonic()))
+        if kind == 'login':
+            client = clients[user] = app.server.test_client()
+            bench_callbacks.login(client, user, 'user')
+            heapq.heappush(events, (at + args.render_delay, 'render', user))
+        elif kind == 'render':
+            renders.append(sum(bench_callbacks.call(clients[user], requests[name])[0]
+                               for name in RENDER_CALLBACKS))
+            heapq.heappush(events, (at + args.interval, 'tick', user))
+        else:
+            ticks.append(bench_callbacks.call(clients[user], requests[TICK_CALLBACK])[0])
+            heapq.heappush(events, (at + args.interval, 'tick', user))
+
+def run_users(app, users, requests, args):
+    start = time.monotonic()
+    login_gap = args.seconds / 2 / len(users)
+    schedule = [(start + i * login_gap, user) for i, user in enumerate(users)]
+    renders, ticks = [], []
+    deadline = start + args.seconds
+    threads = [threading.Thread(target=_client_loop,
+                                args=(app, schedule[i::args.clients], requests, args, deadline, renders, ticks))
+               for i in range(args.clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return renders, ticks
+
+def _percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+def _summary(values):
+    if not values:
+        return f"{'-':>7} {'-':>8} {'-':>8} {'-':>8}"
+    return f"{len(values):>7} {statistics.median(values):>8.1f} {_percentile(values, 99):>8.1f} {max(values):>8.1f}"
+
+def run(args):
+    dataset_dir = tempfile.mkdtemp(prefix='bench-datasets-')
+    bench_callbacks.import_dashboard(args.mongo_uri, args.db, dataset_dir)
+    import active_users
+    import database
+    from cache import shared_cache
+    active_users.PREWARM = False
+    app = bench_callbacks.build_app()
+    requests = dict(bench_callbacks.callback_requests(app))
+
+    users = bench_callbacks.user_ids(args.users)
+    samples = bench_callbacks.synthetic_samples(users, args.samples, args.days)
+    bench_callbacks.write_datasets(dataset_dir, samples, users)
+    db = database.get_db()
+    bench_callbacks.load_database(db, samples)
+
+    print(f"{args.users} users logging in over {args.seconds / 2:.0f}s, {args.clients} clients, "
+          f"one tick per user every {args.interval}s")
+    print(f"{'prewarm':<8} {'':<7} {'calls':>7} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for prewarm in (False, True):
+        bench_callbacks.reset_caches()
+        active_users._active.clear()
+        active_users.PREWARM = prewarm
+        renders, ticks = run_users(app, users, requests, args)
+        under = sum(ms < TARGET_MS for ms in ticks) / len(ticks) if ticks else 0.0
+        label = 'on' if prewarm else 'off'
+        print(f"{label:<8} {'render':<7} {_summary(renders)}")
+        print(f"{label:<8} {'tick':<7} {_summary(ticks)}  {under:.1%} under {TARGET_MS} ms")
+        print(f"{'':<8} partitions {shared_cache.partitions.stats()}")
+    db.drop_collection('sensor_data')
+    db.drop_collection('alerts')
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--samples", type=int, default=20, help="History length, samples per user")
+    parser.add_argument("--days", type=float, default=7, help="Days the history is spread over")
+    parser.add_argument("--seconds", type=float, default=20, help="Length of each run")
+    parser.add_argument("--clients", type=int, default=8, help="Concurrent client threads")
+    parser.add_argument("--interval", type=float, default=2.0, help="Seconds between live ticks of a user")
+    parser.add_argument("--render-delay", type=float, default=0.3, help="Seconds from login to first render")
+    parser.add_argument("--mongo-uri", default=os.getenv("MONGO_URI", "mongodb://localhost:27017"))
+    parser.add_argument("--db", default="neurochair_bench", help="Scratch database (dropped and refilled)")
+    run(parser.parse_args())
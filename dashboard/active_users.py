@@ -0,0 +1,96 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import auth
+
+# Users with an active dashboard session, and background prewarming of their
+# per-user cache entries (cache.py partitions).
+# End-user callbacks resolve their user from the signed session through
+# session_user(), which also marks the user active in this worker; only a
+# callback marks a user, so a user stops being active ACTIVE_SECONDS after
+# their ticks stop. Each worker process runs one prewarm thread (started on
+# first use, so after gunicorn forks, and ended when no user is active) that
+# sweeps the active users, most recently seen first, and recomputes the
+# registered entries that expire within PREWARM_AHEAD seconds and were read
+# since they were last stored (cache.py was_read) -- i.e. the entries the
+# user's ticks actually use in this worker. Ticks then find their entries
+# cached instead of computing them on the request path. Workers prewarming
+# the same entry compute it once: the cache's lock file and the entry's
+# expiry on disk tell the others it is being or has been refreshed.
+ACTIVE_SECONDS = int(os.getenv("ACTIVE_USER_SECONDS", 30))
+PREWARM = os.getenv("DASH_PREWARM", "1") == "1"
+PREWARM_INTERVAL = float(os.getenv("PREWARM_INTERVAL_SECONDS", 1.0))
+PREWARM_AHEAD = float(os.getenv("PREWARM_AHEAD_SECONDS", 2.0))  # > interval, so entries never lapse
+RETRY_SECONDS = 30  # A failing warmer is not retried for a user before this
+
+_active = OrderedDict()  # user -> last seen (time.time()), least recent first
+_warmers = []  # (warm(user_id, *args, ahead=...), args)
+_failed = {}  # (warmer index, user) -> retry after
+_lock = threading.Lock()
+_thread_pid = None
+
+def register_warmer(warm, *args):
+    """Prewarm warm(user_id, *args, ahead=seconds) for every active user."""
+    _warmers.append((warm, args))
+
+def touch(user):
+    """Mark user as active in this worker (and start its prewarm thread)."""
+    with _lock:
+        _active[user] = time.time()
+        _active.move_to_end(user)
+    if PREWARM:
+        _start()
+
+def session_user():
+    """The signed-session user of an end-user callback, marked active."""
+    user = auth.require_tab('end-user')['user']
+    touch(user)
+    return user
+
+def active_users(now=None):
+    """Users seen within ACTIVE_SECONDS, most recent first."""
+    cutoff = (now or time.time()) - ACTIVE_SECONDS
+    with _lock:
+        while _active and next(iter(_active.values())) < cutoff:
+            _active.popitem(last=False)
+        return list(reversed(_active))
+
+def prewarm(user, ahead=PREWARM_AHEAD):
+    """Refresh the user's registered entries that expire within ahead seconds; returns how many."""
+    refreshed = 0
+    for i, (warm, args) in enumerate(_warmers):
+        if _failed.get((i, user), 0) > time.time():
+            continue
+        try:
+            refreshed += bool(warm(user, *args, ahead=ahead))
+            _failed.pop((i, user), None)
+        except Exception as e:
+            print(f"Prewarm of {getattr(warm, '__qualname__', warm)} for {user} failed: {e}")
+            _failed[(i, user)] = time.time() + RETRY_SECONDS
+    return refreshed
+
+def _sweep():
+    global _thread_pid
+    while True:
+        started = time.monotonic()
+        users = active_users()
+        if not users:
+            with _lock:
+                if not _active:
+                    _thread_pid = None  # The next touch() starts a new thread
+                    return
+        for user in users:
+            prewarm(user)
+        time.sleep(max(0.0, PREWARM_INTERVAL - (time.monotonic() - started)))
+
+def _start():
+    global _thread_pid
+    if _thread_pid == os.getpid():
+        return
+    with _lock:
+        if _thread_pid == os.getpid():
+            return
+        _thread_pid = os.getpid()
+    threading.Thread(target=_sweep, name="user-prewarm", daemon=True).start()
@@ -0,0 +1,288 @@
+import datetime
+import os
+import threading
+import time
+from collections import Counter, defaultdict, deque
+
+from pymongo.errors import PyMongoError
+
+import database
+from live_stream import broadcaster, _to_json
+from temporal_profile import ALERT_STRESS_LEVEL
+
+# Alert state for the Emergency tab.
+# Open alerts live in an in-memory index (by id, severity and user) so counts and
+# Acknowledge/Escalate are dict operations; every transition
+# (triggered -> acknowledged -> resolved) is persisted to the Mongo `alerts`
+# collection and pushed to live clients. Every worker evaluates the same
+# samples, so writes are conditional: a trigger only inserts a missing alert,
+# and acknowledge/escalate/resolve only update an alert still in the state they
+# start from. The loser of a race applies the stored document instead. Daily counts and response times are
+# updated on each transition instead of recomputed. `version` changes on every
+# transition, so the tab only redraws when something actually happened.
+SYNC_SECONDS = float(os.getenv("ALERT_SYNC_SECONDS", 2))
+HISTORY_DAYS = 7  # Days of response-time / resolution stats kept
+MONITOR_WINDOW = datetime.timedelta(minutes=10)  # Chairs with a sample this recent count as monitored
+LOG_SIZE = 50
+RECOVERY_STRESS_LEVEL = 6
+
+SEVERITIES = ('critical', 'warning')
+TRIGGERED, ACKNOWLEDGED, RESOLVED = 'triggered', 'acknowledged', 'resolved'
+
+# Alert type -> (severity, sample field, trigger condition, recovery condition)
+RULES = {
+    'High Stress': ('critical', 'stress_level', lambda v: v >= ALERT_STRESS_LEVEL, lambda v: v < RECOVERY_STRESS_LEVEL),
+    'Poor Posture': ('warning', 'Posture_Class', lambda v: v >= 3, lambda v: v <= 1),
+}
+
+def _new_day_stats():
+    return {'triggered': 0, 'resolved': 0, 'response_sum': 0.0, 'response_n': 0, 'types': Counter(), 'hours': Counter()}
+
+class AlertStore:
+    """
+    Indexed open alerts plus incrementally maintained daily stats.
+    """
+    def __init__(self):
+        self._open = {}  # alert id -> alert
+        self._by_severity = {s: {} for s in SEVERITIES}  # severity -> {alert id: alert}
+        self._by_user = defaultdict(dict)  # user id -> {alert type: alert}
+        self._resolved = {}  # alert id -> day resolved, for the last HISTORY_DAYS
+        self._daily = defaultdict(_new_day_stats)  # date -> counts / response times
+        self._last_seen = {}  # user id -> timestamp of their latest sample
+        self.log = deque(maxlen=LOG_SIZE)  # (time, message, level), newest last
+        self.version = 0
+        self.ready = False  # True once loaded from Mongo
+        self._sample_watermark = None
+        self._alert_watermark = None
+        self._lock = threading.Lock()
+
+    # ---- state transitions ----
+
+    def _index(self, alert):
+        self._open[alert['_id']] = alert
+        self._by_severity[alert['severity']][alert['_id']] = alert
+        self._by_user[alert['user_id']][alert['type']] = alert
+
+    def _unindex(self, alert):
+        self._open.pop(alert['_id'], None)
+        self._by_severity[alert['severity']].pop(alert['_id'], None)
+        self._by_user[alert['user_id']].pop(alert['type'], None)
+        if not self._by_user[alert['user_id']]:
+            del self._by_user[alert['user_id']]
+
+    def _trim(self):
+        oldest = datetime.date.today() - datetime.timedelta(days=HISTORY_DAYS - 1)
+        for day in [d for d in self._daily if d < oldest]:
+            del self._daily[day]
+        for alert_id in [a for a, d in self._resolved.items() if d < oldest]:
+            del self._resolved[alert_id]
+
+    def _apply(self, alert):
+        """
+        Apply an alert's new state to the indexes and stats. Idempotent, so the
+        same document can arrive from a local action and from Mongo sync.
+        Returns True if anything changed. Caller holds the lock.
+        """
+        old = self._open.get(alert['_id'])
+        if old is None and alert['_id'] in self._resolved:
+            return False
+        if old is not None and (old['updated_at'] > alert['updated_at'] or
+                                (old['status'], old['severity'], old.get('escalated')) ==
+                                (alert['status'], alert['severity'], alert.get('escalated'))):
+            return False
+
+        who = f"{alert['type']} ({alert['user_id']})"
+        if old is None:
+            stats = self._daily[alert['triggered_at'].date()]
+            stats['triggered'] += 1
+            stats['types'][alert['type']] += 1
+            stats['hours'][alert['triggered_at'].hour] += 1
+            self.log.append((alert['triggered_at'], f"Alert triggered - {who}", 'critical' if alert['severity'] == 'critical' else 'warning'))
+        if alert.get('acknowledged_at') and (old is None or not old.get('acknowledged_at')):
+            stats = self._daily[alert['acknowledged_at'].date()]
+            stats['response_sum'] += (alert['acknowledged_at'] - alert['triggered_at']).total_seconds()
+            stats['response_n'] += 1
+            self.log.append((alert['acknowledged_at'], f"Alert acknowledged - {who}", 'success'))
+        if alert.get('escalated') and (old is None or not old.get('escalated')):
+            self.log.append((alert['updated_at'], f"Alert escalated - {who}", 'critical'))
+
+        if old is not None:
+            self._unindex(old)
+        if alert['status'] == RESOLVED:
+            day = alert['resolved_at'].date()
+            self._resolved[alert['_id']] = day
+            self._daily[day]['resolved'] += 1
+            self.log.append((alert['resolved_at'], f"Alert resolved - {who}", 'success'))
+        else:
+            self._index(alert)
+        self._trim()
+        self.version += 1
+        return True
+
+    def _commit(self, alert, persist):
+        """
+        Persist a transition with persist(), then apply and push the stored
+        document. That is another process's state when it got there first.
+        """
+        try:
+            stored = persist() or alert
+        except PyMongoError as e:
+            print(f"Alert persist failed: {e}")
+            stored = alert
+        with self._lock:
+            changed = self._apply(stored)
+        if changed:
+            broadcaster.publish('alert', _to_json(stored))
+        return changed
+
+    def _transition(self, alert, condition, **changes):
+        """Update an open alert's fields, if Mongo still has it matching condition."""
+        return self._commit(dict(alert, **changes), lambda: database.update_alert(alert['_id'], condition, changes))
+
+    def trigger(self, user_id, alert_type, value, at, sample_id):
+        """Open an alert for a user unless one of the same type is already open."""
+        if alert_type in self._by_user.get(user_id, {}):
+            return None
+        severity = RULES[alert_type][0]
+        alert = {
+            # Derived from the triggering sample, so every server process
+            # evaluating the same stream creates the same alert
+            '_id': f"{user_id}:{alert_type}:{sample_id}",
+            'user_id': user_id, 'type': alert_type, 'severity': severity, 'value': value,
+            'status': TRIGGERED, 'escalated': False,
+            'triggered_at': at, 'acknowledged_at': None, 'resolved_at': None,
+            'updated_at': datetime.datetime.now(),
+        }
+        self._commit(alert, lambda: database.insert_alert(alert))
+        return alert
+
+    def acknowledge(self, alert_id):
+        alert = self._open.get(alert_id)
+        if alert is None or alert['status'] != TRIGGERED:
+            return False
+        now = datetime.datetime.now()
+        return self._transition(alert, {'status': TRIGGERED}, status=ACKNOWLEDGED, acknowledged_at=now, updated_at=now)
+
+    def acknowledge_all(self):
+        return sum(self.acknowledge(alert_id) for alert_id in list(self._open))
+
+    def escalate(self, alert_id):
+        alert = self._open.get(alert_id)
+        if alert is None or alert.get('escalated'):
+            return False
+        return self._transition(alert, {'escalated': False, 'status': {'$ne': RESOLVED}},
+                                severity='critical', escalated=True, updated_at=datetime.datetime.now())
+
+    def resolve(self, alert_id, at=None):
+        alert = self._open.get(alert_id)
+        if alert is None:
+            return False
+        now = datetime.datetime.now()
+        return self._transition(alert, {'status': {'$ne': RESOLVED}}, status=RESOLVED, resolved_at=at or now, updated_at=now)
+
+    # ---- feeding from Mongo ----
+
+    def evaluate(self, sample):
+        """Check one sensor sample against the alert rules."""
+        user_id = sample.get('user_id') or sample.get('User_ID')
+        at = sample.get('timestamp') or datetime.datetime.now()
+        if user_id is None:
+            return
+        self._last_seen[user_id] = at
+        for alert_type, (severity, field, triggered, recovered) in RULES.items():
+            value = sample.get(field)
+            if value is None:
+                continue
+            current = self._by_user.get(user_id, {}).get(alert_type)
+            if current is None and triggered(value):
+                self.trigger(user_id, alert_type, value, at, sample['_id'])
+            elif current is not None and recovered(value):
+                self.resolve(current['_id'], at)
+
+    def load(self):
+        """Rebuild open alerts and recent stats from Mongo."""
+        now = datetime.datetime.now()
+        start = datetime.datetime.combine(datetime.date.today() - datetime.timedelta(days=HISTORY_DAYS - 1), datetime.time())
+        docs = database.get_open_alerts() + database.get_alerts_since(start)
+        with self._lock:
+            for doc in sorted(docs, key=lambda d: d['updated_at']):
+                self._apply(doc)
+        latest = database.get_sensor_data_after(None)
+        self._sample_watermark = latest[0]['_id'] if latest else None
+        self._alert_watermark = now
+        self.ready = True
+
+    def sync(self):
+        """Pull alert changes made by other server processes, then evaluate new samples."""
+        changes = database.get_alerts_updated_since(self._alert_watermark)
+        with self._lock:
+            for doc in changes:
+                if self._apply(doc):
+                    broadcaster.publish('alert', _to_json(doc))
+                self._alert_watermark = max(self._alert_watermark, doc['updated_at'])
+        while True:
+            docs = database.get_sensor_data_after(self._sample_watermark)
+            if self._sample_watermark is None:
+                self._sample_watermark = docs[0]['_id'] if docs else None
+                return
+            for doc in docs:
+                self.evaluate(doc)
+                self._sample_watermark = doc['_id']
+            if len(docs) < 500:
+                return
+
+    # ---- queries ----
+
+    def open_alerts(self, limit=20):
+        """Open alerts, critical first, newest first within a severity."""
+        alerts = list(self._by_severity['critical'].values())
+        alerts.sort(key=lambda a: a['triggered_at'], reverse=True)
+        if len(alerts) < limit:
+            rest = sorted(self._by_severity['warning'].values(), key=lambda a: a['triggered_at'], reverse=True)
+            alerts += rest
+        return alerts[:limit]
+
+    def stats(self):
+        now = datetime.datetime.now()
+        today = self._daily.get(now.date(), _new_day_stats())
+        week = [self._daily.get(now.date() - datetime.timedelta(days=i), _new_day_stats()) for i in range(HISTORY_DAYS - 1, -1, -1)]
+        return {
+            'monitored': sum(1 for t in self._last_seen.values() if now - t <= MONITOR_WINDOW),
+            'active': len(self._open),
+            'critical': len(self._by_severity['critical']),
+            'triggered_today': today['triggered'],
+            'resolved_today': today['resolved'],
+            'avg_response_min': today['response_sum'] / today['response_n'] / 60 if today['response_n'] else None,
+            'types_today': dict(today['types']),
+            'hourly_today': [today['hours'][h] for h in range(24)],  # Alerts triggered per hour of day
+            'response_trend': [(now.date() - datetime.timedelta(days=HISTORY_DAYS - 1 - i),
+                                d['response_sum'] / d['response_n'] / 60 if d['response_n'] else None)
+                               for i, d in enumerate(week)],
+        }
+
+_store = None
+_store_lock = threading.Lock()
+
+def _run(store):
+    while True:
+        try:
+            if not store.ready:
+                store.load()
+            else:
+                store.sync()
+        except PyMongoError as e:
+            print(f"Alert store sync failed: {e}")
+            time.sleep(5)
+        time.sleep(SYNC_SECONDS)
+
+def get_alert_store():
+    """
+    Process-wide alert store; the first call starts its background sync thread
+    (after gunicorn has forked, since callbacks only run in workers).
+    """
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = AlertStore()
+            threading.Thread(target=_run, args=(_store,), name="alert-store-sync", daemon=True).start()
+    return _store
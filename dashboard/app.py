@@ -1,14 +1,35 @@
 import dash
+import importlib
+import os
+import threading
 from dash import dcc, html, callback_context
 import dash_bootstrap_components as dbc
-from dash.dependencies import Input, Output, State
-from datetime import datetime
+from dash.dependencies import Input, Output, State, ClientsideFunction
+from flask import request
 
-# Import components
-from components.end_user_tab import render_end_user_tab, register_end_user_callbacks
-from components.therapist_tab import render_therapist_tab, register_therapist_callbacks
-from components.emergency_tab import render_emergency_tab, register_emergency_callbacks
-from components.employer_tab import render_employer_tab, register_employer_callbacks
+import auth
+from refresh import create_intervals, live_inputs, LIVE_STORE_ID, LIVE_CONNECTED_MS, REFRESH_INTERVALS
+from live_stream import register_live_stream
+from callback_metrics import register_callback_metrics
+
+# Tab modules (pandas/plotly and the dataset helpers) are imported on first use.
+# By default they load while this module is imported, so gunicorn's preload_app
+# shares them with every worker. With DASH_LAZY_STARTUP=1 the server answers
+# immediately with the login page while a background thread imports the tabs,
+# registers their callbacks and warms the dataset cache; Dash's dependency and
+# callback requests wait for the tabs (up to TABS_READY_TIMEOUT seconds) so the
+# browser never sees a partial callback graph.
+LAZY_STARTUP = os.getenv("DASH_LAZY_STARTUP", "0") == "1"
+TABS_READY_TIMEOUT = 120
+DEPENDENCY_PATHS = ("/_dash-dependencies", "/_dash-update-component")
+
+# tab_id -> (module, render function, register function)
+TAB_MODULES = {
+    "end-user": ("components.end_user_tab", "render_end_user_tab", "register_end_user_callbacks"),
+    "therapist": ("components.therapist_tab", "render_therapist_tab", "register_therapist_callbacks"),
+    "emergency": ("components.emergency_tab", "render_emergency_tab", "register_emergency_callbacks"),
+    "employer": ("components.employer_tab", "render_employer_tab", "register_employer_callbacks"),
+}
 
 # Initialize app with Bootstrap theme + custom CSS
 app = dash.Dash(
@@ -18,6 +39,17 @@ app = dash.Dash(
     meta_tags=[{"name": "viewport", "content": "width=device-width, initial-scale=1"}]
 )
 server = app.server
+auth.init_app(server)  # Signed session cookie with the logged-in user
+tabs_ready = threading.Event()
+
+def _deferred_view(module, name):
+    # Flask view that imports its module on the first request
+    def view(**kwargs):
+        return getattr(importlib.import_module(module), name)(**kwargs)
+    return view
+
+register_live_stream(server)
+server.add_url_rule('/export', 'export', _deferred_view('export', 'export'))
 
 # Professional Header Component
 def create_header():
@@ -73,12 +105,12 @@ login_layout = dbc.Container([
 ], fluid=True, style={'background': '#f3f3f3'})
 
 # Main Dashboard Layout
-def dashboard_layout():
+def dashboard_layout(account):
     return dbc.Container([
         create_header(),
         
         dbc.Tabs(
-            [dbc.Tab(label=tab["label"], tab_id=tab["tab_id"]) for tab in TABS],
+            [dbc.Tab(label=tab["label"], tab_id=tab["tab_id"]) for tab in TABS if auth.can_open(tab["tab_id"], account)],
             id="tabs",
             active_tab="end-user"
         ),
@@ -99,13 +131,18 @@ def dashboard_layout():
         dbc.Input(id="username-box", style={"display": "none"}, value=""),
         dbc.Input(id="password-box", style={"display": "none"}, value=""),
         
-        dcc.Interval(id='interval-component', interval=2000, n_intervals=0)
+        # Per-panel refresh cadences (live / hourly / daily)
+        *create_intervals()
     ], fluid=True, className="p-3")
 
 # App Root Layout
 app.layout = html.Div([
     dcc.Location(id='url', refresh=False),
-    dcc.Store(id='session-store', storage_type='session'),  # Stores user session
+    # Display copy of the logged-in account; callbacks use the signed session (auth.py)
+    dcc.Store(id='session-store', storage_type='session'),
+    # Push channel state, written by assets/live_stream.js
+    dcc.Store(id=LIVE_STORE_ID),
+    dcc.Store(id='live-status', data={'connected': False}),
     html.Div(id='page-content')
 ])
 
@@ -124,46 +161,89 @@ def manage_login(login_clicks, logout_clicks, username, password, current_path):
     button_id = ctx.triggered[0]['prop_id'].split('.')[0]
     
     if button_id == 'login-btn':
-        if username == 'U01' and password == '1234':  # Hardcoded Demo User
-            return '/dashboard', {'user': 'U01', 'role': 'user'}, ""
+        account = auth.authenticate(username, password)
+        if account:
+            auth.login(account)
+            return '/dashboard', account, ""
         else:
             return dash.no_update, dash.no_update, dbc.Alert("Invalid credentials", color="danger")
             
     elif button_id == 'logout-btn':
+        auth.logout()
         return '/login', None, ""
     
     return current_path, dash.no_update, ""
 
 @app.callback(Output('page-content', 'children'), [Input('url', 'pathname'), Input('session-store', 'data')])
 def display_page(pathname, session_data):
-    if session_data and session_data.get('user'):
-        if pathname == '/login':
-            return dashboard_layout() # Redirect to dashboard if logged in
-        return dashboard_layout()
+    account = auth.current_user()
+    if account:
+        return dashboard_layout(account)
     else:
         return login_layout
 
 @app.callback(Output("tab-content", "children"), Input("tabs", "active_tab"))
 def render_tab_content(active_tab):
-    if active_tab == "end-user":
-        return render_end_user_tab()
-    elif active_tab == "therapist":
-        return render_therapist_tab()
-    elif active_tab == "emergency":
-        return render_emergency_tab()
-    elif active_tab == "employer":
-        return render_employer_tab()
-    return html.P("Tab not found")
-
-@app.callback(Output("current-time", "children"), Input("interval-component", "n_intervals"))
-def update_time(n):
-    return datetime.now().strftime("%H:%M:%S")
-
-# Register callbacks for all tabs
-register_end_user_callbacks(app)
-register_therapist_callbacks(app)
-register_emergency_callbacks(app)
-register_employer_callbacks(app)
+    if active_tab not in TAB_MODULES:
+        return html.P("Tab not found")
+    if not auth.can_open(active_tab, auth.current_user()):
+        return html.P("Not authorized")
+    module, render, _ = TAB_MODULES[active_tab]
+    return getattr(importlib.import_module(module), render)()
+
+# Footer clock is formatted in the browser (assets/clientside.js)
+app.clientside_callback(
+    ClientsideFunction(namespace='neurochair', function_name='currentTime'),
+    Output("current-time", "children"),
+    live_inputs()
+)
+
+# Slow interval polling down while the push channel is connected
+app.clientside_callback(
+    f"""
+    function(status) {{
+        return (status && status.connected) ? {LIVE_CONNECTED_MS} : {REFRESH_INTERVALS['live'][1]};
+    }}
+    """,
+    Output('interval-component', 'interval'),
+    Input('live-status', 'data')
+)
+
+def load_tabs():
+    """
+    Import the tab modules and register their callbacks.
+    """
+    for module, _, register in TAB_MODULES.values():
+        getattr(importlib.import_module(module), register)(app)
+    tabs_ready.set()
+
+def _background_startup():
+    try:
+        load_tabs()
+    finally:
+        tabs_ready.set()  # On failure, let waiting requests through rather than hang them
+    import data_loader  # pandas; kept off the import path of this module
+    data_loader.warm_up()
+    import database
+    database.ensure_indexes()
+
+@server.before_request
+def wait_for_tabs():
+    if not tabs_ready.is_set() and request.path.endswith(DEPENDENCY_PATHS):
+        tabs_ready.wait(TABS_READY_TIMEOUT)
+
+# Per-callback latency/size/error counters on /metrics; callback names are
+# resolved on first call, so tabs registered later are labelled too
+register_callback_metrics(app)
+
+if LAZY_STARTUP:
+    threading.Thread(target=_background_startup, name="tab-startup", daemon=True).start()
+else:
+    load_tabs()
 
 if __name__ == "__main__":
-    app.run(debug=True, host='0.0.0.0', port=8050)
+    # Development server; production runs gunicorn with wsgi.py
+    if not LAZY_STARTUP:
+        import database
+        database.ensure_indexes()
+    app.run(debug=os.getenv("DASH_DEBUG", "1") == "1", host='0.0.0.0', port=8050)
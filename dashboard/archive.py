@@ -0,0 +1,289 @@
+"""
+Archive tier for sensor_data.
+
+Raw samples stay in Mongo for SENSOR_HOT_DAYS days (a TTL index on timestamp
+expires them); a background job compacts every closed day into one Parquet
+file per user:
+
+    <archive>/<YYYY-MM-DD>/<user>.parquet    samples of that user and day, in time order
+    <archive>/<YYYY-MM-DD>/_day.json         written last: sample count of the day
+
+Known sensor fields are typed columns; any other field (or a value whose type
+does not fit its column) is kept in the JSON `extra` column, so documents read
+back are the documents that were stored. A day is re-compacted while it is still
+fully hot and Mongo holds more samples than the archive (late arrivals).
+
+Queries in database.py split at covered_until(): archived days older than the
+hot window are read from here, newer ones from Mongo. The TTL index is only
+created after the first full compaction pass, so existing history is archived
+before anything expires. Run the job as its own process (docker-compose service
+"archiver"); if it stops for longer than the hot window, expired days are lost.
+
+Usage:
+    python archive.py [--hot-days 30] [--interval-seconds 3600] [--once]
+"""
+import argparse
+import datetime
+import heapq
+import json
+import os
+import time
+import urllib.parse
+
+from bson import ObjectId
+
+HOT_DAYS = int(os.getenv("SENSOR_HOT_DAYS", 30))
+ARCHIVE_DIR = os.getenv("SENSOR_ARCHIVE_DIR")  # Default: <Datasets>/archive
+TTL_INDEX = "timestamp_ttl"
+MARKER = "_day.json"
+INTERVAL_SECONDS = 3600
+ROW_GROUP_ROWS = 10_000  # Rows buffered per user before a row group is written
+READ_BATCH_ROWS = 5_000
+
+USER_FIELDS = ('user_id', 'User_ID')
+STRING_FIELDS = USER_FIELDS + ('NFC_ID', 'topic', 'source')
+INT_FIELDS = ('stress_level', 'hrv', 'FSR_Left', 'FSR_Right', 'FSR_Back', 'Limit_Back_Up', 'Limit_Back_Down',
+              'Limit_Left', 'Limit_Right', 'Posture_Class', 'Predicted_Class')
+FLOAT_FIELDS = ('gsr', 'posture_score', 'AccX', 'AccY', 'AccZ', 'GyroX', 'GyroY', 'GyroZ')
+
+def archive_dir():
+    if ARCHIVE_DIR:
+        return ARCHIVE_DIR
+    import data_loader
+    return os.path.join(data_loader.dataset_path(), "archive")
+
+def _day_dir(day):
+    return os.path.join(archive_dir(), day.isoformat())
+
+def _user_file(day, user):
+    return os.path.join(_day_dir(day), urllib.parse.quote(str(user), safe='') + ".parquet")
+
+def _midnight(day):
+    return datetime.datetime.combine(day, datetime.time())
+
+def hot_start(now=None, hot_days=None):
+    """Start of the oldest day that the TTL index has not started to expire."""
+    today = (now or datetime.datetime.now()).date()
+    return _midnight(today - datetime.timedelta(days=(hot_days or HOT_DAYS) - 1))
+
+def read_marker(day):
+    try:
+        with open(os.path.join(_day_dir(day), MARKER)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def covered_until(start_time, now=None):
+    """
+    Where a query from start_time switches from the archive to Mongo: the end
+    of the run of compacted days from start_time's day that lie before
+    hot_start(), or start_time itself when its day is not archived.
+    """
+    day, limit = start_time.date(), hot_start(now).date()
+    while day < limit and read_marker(day) is not None:
+        day += datetime.timedelta(days=1)
+    return max(start_time, _midnight(day))
+
+# ---- writing ----
+
+def _schema():
+    import pyarrow as pa
+    return pa.schema([('_id', pa.binary(12)), ('timestamp', pa.timestamp('ms'))] +
+                     [(f, pa.string()) for f in STRING_FIELDS] +
+                     [(f, pa.int64()) for f in INT_FIELDS] +
+                     [(f, pa.float64()) for f in FLOAT_FIELDS] +
+                     [('extra', pa.string())])
+
+def _fits(field, value):
+    if field in STRING_FIELDS:
+        return isinstance(value, str)
+    if field in INT_FIELDS:
+        return isinstance(value, int) and not isinstance(value, bool)
+    if field in FLOAT_FIELDS:
+        return isinstance(value, float)
+    return False
+
+def _row(doc):
+    row = {'_id': doc['_id'].binary, 'timestamp': doc['timestamp']}
+    extra = {}
+    for field, value in doc.items():
+        if field in ('_id', 'timestamp') or value is None:
+            continue
+        if _fits(field, value):
+            row[field] = value
+        else:
+            extra[field] = value
+    row['extra'] = json.dumps(extra, default=str) if extra else None
+    return row
+
+def _user_of(doc):
+    return doc.get('user_id') or doc.get('User_ID') or 'unknown'
+
+class _DayWriter:
+    """One ParquetWriter per user of a day, written to temporary files."""
+    def __init__(self, day):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        self._pa, self._pq = pa, pq
+        self.day = day
+        self.schema = _schema()
+        self._writers = {}
+        self._rows = {}
+        self.samples = 0
+
+    def add(self, doc):
+        user = _user_of(doc)
+        rows = self._rows.setdefault(user, [])
+        rows.append(_row(doc))
+        self.samples += 1
+        if len(rows) >= ROW_GROUP_ROWS:
+            self._write(user)
+
+    def _write(self, user):
+        rows, self._rows[user] = self._rows[user], []
+        if not rows:
+            return
+        writer = self._writers.get(user)
+        if writer is None:
+            writer = self._writers[user] = self._pq.ParquetWriter(_user_file(self.day, user) + ".tmp", self.schema)
+        writer.write_table(self._pa.Table.from_pylist(rows, schema=self.schema))
+
+    def close(self):
+        """Publish the user files, drop files of users no longer present, then write the marker."""
+        for user in list(self._rows):
+            self._write(user)
+        for writer in self._writers.values():
+            writer.close()
+        published = set()
+        for user in self._writers:
+            path = _user_file(self.day, user)
+            os.replace(path + ".tmp", path)
+            published.add(os.path.basename(path))
+        for name in os.listdir(_day_dir(self.day)):
+            if name.endswith(".parquet") and name not in published:
+                os.remove(os.path.join(_day_dir(self.day), name))
+        marker = os.path.join(_day_dir(self.day), MARKER)
+        with open(marker + ".tmp", "w") as f:
+            json.dump({'day': self.day.isoformat(), 'samples': self.samples, 'users': len(published),
+                       'compacted_at': datetime.datetime.now().isoformat()}, f)
+        os.replace(marker + ".tmp", marker)
+
+def compact_day(collection, day, now=None, expiring=True):
+    """
+    Archive one closed day. Returns the number of samples written, 0 when the
+    archive is already up to date (or the day has started to expire).
+    expiring tells whether the TTL index exists yet.
+    """
+    start, end = _midnight(day), _midnight(day + datetime.timedelta(days=1))
+    query = {'timestamp': {'$gte': start, '$lt': end}}
+    count = collection.count_documents(query)
+    marker = read_marker(day)
+    if marker is not None and (count <= marker['samples'] or start < hot_start(now)):
+        return 0
+    if count == 0:
+        return 0
+    if expiring and start < hot_start(now):
+        print(f"Warning: archiving {day} after the TTL started expiring it; some samples may be lost")
+    os.makedirs(_day_dir(day), exist_ok=True)
+    writer = _DayWriter(day)
+    for doc in collection.find(query).sort('timestamp', 1).batch_size(READ_BATCH_ROWS):
+        writer.add(doc)
+    writer.close()
+    return writer.samples
+
+def compact(collection, now=None):
+    """Archive every closed day still in Mongo that is missing or stale in the archive."""
+    oldest = list(collection.find({}, {'timestamp': 1}).sort('timestamp', 1).limit(1))
+    if not oldest:
+        return 0
+    today = (now or datetime.datetime.now()).date()
+    expiring = TTL_INDEX in collection.index_information()
+    day, total = oldest[0]['timestamp'].date(), 0
+    while day < today:
+        written = compact_day(collection, day, now, expiring)
+        if written:
+            print(f"Archived {written} samples of {day}")
+        total += written
+        day += datetime.timedelta(days=1)
+    return total
+
+def ensure_ttl_index(collection, hot_days=None):
+    """TTL index on timestamp expiring samples after hot_days (updated in place if it changed)."""
+    seconds = (hot_days or HOT_DAYS) * 86400
+    index = collection.index_information().get(TTL_INDEX)
+    if index is None:
+        collection.create_index('timestamp', name=TTL_INDEX, expireAfterSeconds=seconds)
+    elif index.get('expireAfterSeconds') != seconds:
+        collection.database.command('collMod', collection.name,
+                                    index={'name': TTL_INDEX, 'expireAfterSeconds': seconds})
+
+# ---- reading ----
+
+def _doc(record, with_id):
+    extra = record.pop('extra', None)
+    doc = {k: v for k, v in record.items() if v is not None}
+    if extra:
+        doc.update(json.loads(extra))
+    if with_id and '_id' in doc:
+        doc['_id'] = ObjectId(doc['_id'])
+    else:
+        doc.pop('_id', None)
+    return doc
+
+def _read_file(path, start_time, end_time, columns, with_id, after_id):
+    import pyarrow.parquet as pq
+    parquet = pq.ParquetFile(path)
+    columns = [c for c in parquet.schema_arrow.names if columns is None or c in columns]
+    after = after_id.binary if after_id is not None else None
+    for batch in parquet.iter_batches(batch_size=READ_BATCH_ROWS, columns=columns):
+        for record in batch.to_pylist():
+            if start_time <= record['timestamp'] < end_time and (after is None or record['_id'] > after):
+                yield _doc(record, with_id)
+
+def iter_docs(start_time, end_time, fields=None, user_ids=None, with_ids=True, after_id=None):
+    """
+    Archived samples with start_time <= timestamp < end_time, oldest first,
+    shaped like sensor_data documents. fields limits the returned fields as a
+    Mongo projection would (timestamp and user fields are always included).
+    """
+    columns = None
+    if fields is not None:
+        columns = {'_id', 'timestamp', 'extra', *USER_FIELDS, *fields}
+    day = start_time.date()
+    while _midnight(day) < end_time:
+        directory = _day_dir(day)
+        if os.path.isdir(directory):
+            if user_ids is None:
+                paths = [os.path.join(directory, n) for n in sorted(os.listdir(directory)) if n.endswith(".parquet")]
+            else:
+                paths = [p for p in (_user_file(day, u) for u in user_ids) if os.path.exists(p)]
+            readers = [_read_file(p, start_time, end_time, columns, with_ids, after_id) for p in paths]
+            for doc in heapq.merge(*readers, key=lambda d: d['timestamp']):
+                if fields is not None:
+                    doc = {k: v for k, v in doc.items() if k in columns}
+                yield doc
+        day += datetime.timedelta(days=1)
+
+def run(hot_days, interval_seconds, once=False):
+    import database
+    if hot_days < 2:
+        raise SystemExit("--hot-days must be at least 2 (the current and the previous day stay hot)")
+    collection = database.get_sensor_data_collection()
+    while True:
+        written = compact(collection)
+        print(f"Compaction pass: {written} samples archived to {archive_dir()}")
+        if written:
+            database.bump_data_generation()  # Closed days moved tier; dashboard caches recompute them
+        ensure_ttl_index(collection, hot_days)  # Only after a full pass, so nothing unarchived expires
+        if once:
+            return
+        time.sleep(interval_seconds)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compact closed days of sensor_data into the Parquet archive.")
+    parser.add_argument("--hot-days", type=int, default=HOT_DAYS, help="Days kept in Mongo (TTL)")
+    parser.add_argument("--interval-seconds", type=float, default=INTERVAL_SECONDS)
+    parser.add_argument("--once", action="store_true", help="Run a single compaction pass")
+    args = parser.parse_args()
+    HOT_DAYS = args.hot_days
+    run(args.hot_days, args.interval_seconds, args.once)
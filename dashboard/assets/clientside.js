@@ -0,0 +1,130 @@
+// Presentation-only callbacks that run in the browser.
+// The server ships raw numbers (user-metrics store); formatting, threshold
+// coloring and goal percentages are derived here without a round trip.
+(function () {
+    var COLORS = {
+        blue: '#4e79a7', orange: '#f28e2c', red: '#e15759', green: '#59a14f'
+    };
+    var KPI_VALUE_STYLE = {fontSize: '32px', fontWeight: '300'};
+    var GOAL_PCT_STYLE = {fontSize: '11px', float: 'right'};
+
+    function pad(n) {
+        return (n < 10 ? '0' : '') + n;
+    }
+
+    function withColor(style, color) {
+        return Object.assign({}, style, {color: color});
+    }
+
+    function statusColor(status) {
+        return {success: COLORS.green, warning: COLORS.orange, danger: COLORS.red}[status] || COLORS.blue;
+    }
+
+    function isoDate(d) {
+        return d.getFullYear() + '-' + pad(d.getMonth() + 1) + '-' + pad(d.getDate());
+    }
+
+    function exportHrefs(scope, id, start, end) {
+        var base = '/export?scope=' + scope + '&id=' + encodeURIComponent(id) +
+            '&start=' + String(start).slice(0, 10) + '&end=' + String(end).slice(0, 10) + '&format=';
+        return [base + 'csv', base + 'parquet'];
+    }
+
+    function goalPercent(current, target) {
+        return target > 0 ? Math.min(100, (current / target) * 100) : 0;
+    }
+
+    function shifted(figure, value) {
+        // Drop the oldest point of the figure's series and append value
+        var trace = figure && figure.data && figure.data[0];
+        if (value === undefined || value === null || !trace || !Array.isArray(trace.y) || !trace.y.length) {
+            return window.dash_clientside.no_update;
+        }
+        var y = trace.y.slice(1).concat([value]);
+        return Object.assign({}, figure, {data: [Object.assign({}, trace, {y: y})]});
+    }
+
+    window.dash_clientside = window.dash_clientside || {};
+    window.dash_clientside.neurochair = {
+        // Footer clock
+        currentTime: function () {
+            var now = new Date();
+            return pad(now.getHours()) + ':' + pad(now.getMinutes()) + ':' + pad(now.getSeconds());
+        },
+
+        // End-user KPI values and threshold colors
+        kpis: function (m) {
+            if (!m) {
+                return window.dash_clientside.no_update;
+            }
+            var stress = m.stress_avg, posture = m.posture_avg, sitting = m.sitting_hours, breaks = m.breaks;
+            return [
+                stress + '/10',
+                withColor(KPI_VALUE_STYLE, statusColor(stress > 7 ? 'danger' : stress > 4 ? 'warning' : 'success')),
+                posture + '%',
+                withColor(KPI_VALUE_STYLE, statusColor(posture >= 80 ? 'success' : posture >= 50 ? 'warning' : 'danger')),
+                sitting + 'h',
+                withColor(KPI_VALUE_STYLE, statusColor(sitting > 4 ? 'warning' : 'success')),
+                String(breaks),
+                withColor(KPI_VALUE_STYLE, statusColor(breaks >= 4 ? 'success' : 'warning'))
+            ];
+        },
+
+        // Stress gauge: update value and bar color on the server-built figure
+        gauge: function (m, figure) {
+            if (!m || !figure) {
+                return window.dash_clientside.no_update;
+            }
+            var value = m.stress_avg;
+            var color = value <= 3 ? COLORS.green : value <= 6 ? COLORS.orange : COLORS.red;
+            var trace = Object.assign({}, figure.data[0], {value: value});
+            trace.gauge = Object.assign({}, trace.gauge, {bar: Object.assign({}, trace.gauge.bar, {color: color})});
+            return Object.assign({}, figure, {data: [trace]});
+        },
+
+        // Live vitals: shift a sample pushed over /stream into the HRV and GSR charts
+        liveSample: function (sample, hrv, gsr) {
+            if (!sample || sample.alert) {
+                return [window.dash_clientside.no_update, window.dash_clientside.no_update];
+            }
+            return [shifted(hrv, sample.hrv), shifted(gsr, sample.gsr)];
+        },
+
+        // Daily goals: percent labels and progress bars
+        goals: function (m, goals) {
+            if (!m || !goals) {
+                return window.dash_clientside.no_update;
+            }
+            var current = {
+                stress: Math.max(0, 10 - m.stress_avg),
+                posture: m.posture_avg,
+                sitting: Math.max(0, 6 - m.sitting_hours),
+                breaks: m.breaks
+            };
+            var labels = [], styles = [], values = [], colors = [];
+            goals.forEach(function (g) {
+                var pct = goalPercent(current[g.metric], g.target);
+                labels.push(Math.floor(pct) + '%');
+                styles.push(withColor(GOAL_PCT_STYLE, g.color));
+                values.push(pct);
+                colors.push(current[g.metric] >= g.target ? 'primary' : 'secondary');
+            });
+            return labels.concat(styles, values, colors);
+        },
+
+        // Clinical View export links for the selected patient and date range
+        patientExport: function (patient, start, end) {
+            if (!patient || !start || !end) {
+                return window.dash_clientside.no_update;
+            }
+            return exportHrefs('patient', patient, start, end);
+        },
+
+        // Employer report links for the selected department and 7D/30D/90D range
+        orgExport: function (dept, days) {
+            var end = new Date();
+            var start = new Date(end.getFullYear(), end.getMonth(), end.getDate() - (days - 1));
+            return exportHrefs('org', dept || 'all', isoDate(start), isoDate(end));
+        }
+    };
+})();
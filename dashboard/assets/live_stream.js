@@ -0,0 +1,87 @@
+// Live push channel: subscribes to /stream (Server-Sent Events) and writes
+// pushed samples/alerts into dcc.Stores so live callbacks fire on new data
+// instead of on a timer. While connected, live interval polling slows down.
+// The server streams the samples of the signed-session user; the session-store
+// copy of the login is only used to notice logins and logouts.
+(function () {
+    if (!window.EventSource) {
+        return;  // Polling fallback stays active
+    }
+
+    function rendererReady() {
+        // page-content is part of the root layout, so it exists once Dash has rendered
+        var clientside = window.dash_clientside;
+        return Boolean(clientside && clientside.set_props && document.getElementById('page-content'));
+    }
+
+    function setProps(id, props) {
+        if (rendererReady()) {
+            window.dash_clientside.set_props(id, props);
+            return true;
+        }
+        return false;
+    }
+
+    function loggedInUser() {
+        try {
+            var session = JSON.parse(window.sessionStorage.getItem('session-store'));
+            return session && session.user;
+        } catch (e) {
+            return null;
+        }
+    }
+
+    var source = null;
+    var user = null;
+    var connected = false;
+    var appliedConnected = null;
+
+    function syncStatus() {
+        if (appliedConnected !== connected && setProps('live-status', {data: {connected: connected}})) {
+            appliedConnected = connected;
+        }
+    }
+
+    function connect() {
+        user = loggedInUser();
+        if (!user) {
+            return;  // /stream needs a session; connect after login
+        }
+        source = new EventSource('/stream');
+        source.onopen = function () {
+            connected = true;
+            syncStatus();
+        };
+        source.onerror = function () {
+            // EventSource reconnects on its own; fall back to polling meanwhile
+            connected = false;
+            syncStatus();
+        };
+        source.addEventListener('sample', function (e) {
+            setProps('live-store', {data: JSON.parse(e.data)});
+        });
+        source.addEventListener('alert', function (e) {
+            setProps('live-store', {data: {alert: JSON.parse(e.data)}});
+        });
+    }
+
+    // Apply status once the renderer is up, and reconnect when the logged-in
+    // user changes so the server streams the new session's samples
+    setInterval(function () {
+        syncStatus();
+        if (loggedInUser() !== user) {
+            if (source) {
+                source.close();
+                source = null;
+            }
+            connected = false;
+            connect();
+        }
+    }, 1000);
+
+    if (document.readyState === 'loading') {
+        document.addEventListener('DOMContentLoaded', connect);
+    } else {
+        connect();
+    }
+})();
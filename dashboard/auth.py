@@ -0,0 +1,160 @@
+"""
+Dashboard logins.
+
+Accounts are read from Datasets/users.csv (User_ID,Role,Salt,Password_Hash;
+PBKDF2-SHA256, hex encoded) and re-read when the file changes. Without that
+file the dashboard runs in demo mode: every user known to the datasets
+(posture features or user_departments.csv) logs in with DEMO_PASSWORD and
+gets DEMO_ROLE ('user' by default, which opens only the end-user tab;
+docker-compose.yml sets 'admin' so a demo login can open every tab).
+
+The logged-in identity lives in Flask's signed session cookie (key from
+DASH_SECRET_KEY), never in browser-editable state: callbacks and routes read
+it with current_user(). Roles decide which tabs an account may open
+(TAB_ROLES) and whose samples it may read (can_view_patient).
+
+Usage:
+    python auth.py add U02 [--role therapist]    prompts for the password
+"""
+import argparse
+import csv
+import getpass
+import hashlib
+import hmac
+import os
+import secrets
+
+DEMO_PASSWORD = os.getenv("DEMO_PASSWORD", "1234")
+DEMO_ROLE = os.getenv("DEMO_ROLE", "user")
+USERS_FILE = os.getenv("USERS_FILE")  # Default: <Datasets>/users.csv
+SECRET_KEY = os.getenv("DASH_SECRET_KEY")  # Default: generated once into the shared cache directory
+SECRET_KEY_FILE = "secret.key"
+ITERATIONS = 200_000
+FIELDS = ['User_ID', 'Role', 'Salt', 'Password_Hash']
+
+ROLES = ('user', 'therapist', 'employer', 'admin')
+# Tab -> roles that may open it. Every account sees its own data on the end-user tab;
+# clinical and alert views show any patient, analytics the whole organization.
+TAB_ROLES = {
+    'end-user': ROLES,
+    'therapist': ('therapist', 'admin'),
+    'emergency': ('therapist', 'admin'),
+    'employer': ('employer', 'admin'),
+}
+# Roles that may read any patient's samples (others only their own)
+CLINICAL_ROLES = ('therapist', 'admin')
+
+_accounts = (None, {})  # (file mtime, User_ID -> row)
+
+def users_file():
+    if USERS_FILE:
+        return USERS_FILE
+    import data_loader
+    return os.path.join(data_loader.dataset_path(), "users.csv")
+
+def _secret_key():
+    if SECRET_KEY:
+        return SECRET_KEY
+    # Shared by every worker (cookies signed by one must verify in the others)
+    from cache import CACHE_DIR
+    path = os.path.join(CACHE_DIR, SECRET_KEY_FILE)
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    try:
+        fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o600)
+        with os.fdopen(fd, "w") as f:
+            f.write(secrets.token_hex(32))
+        print(f"DASH_SECRET_KEY not set; generated a session key in {path}")
+    except FileExistsError:
+        pass
+    with open(path) as f:
+        return f.read().strip()
+
+def init_app(server):
+    """Sign the Flask session cookie that carries the logged-in user."""
+    server.secret_key = _secret_key()
+    server.config.update(SESSION_COOKIE_HTTPONLY=True, SESSION_COOKIE_SAMESITE='Lax',
+                         SESSION_COOKIE_SECURE=os.getenv("SESSION_COOKIE_SECURE", "0") == "1")
+
+def hash_password(password, salt):
+    return hashlib.pbkdf2_hmac('sha256', password.encode(), bytes.fromhex(salt), ITERATIONS).hex()
+
+def load_accounts():
+    """User_ID -> account row, or None in demo mode (no users file)."""
+    global _accounts
+    path = users_file()
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    if _accounts[0] != mtime:
+        with open(path, newline='') as f:
+            _accounts = (mtime, {row['User_ID']: row for row in csv.DictReader(f)})
+    return _accounts[1]
+
+def authenticate(username, password):
+    """Session data ({'user', 'role'}) for valid credentials, else None."""
+    if not username or not password:
+        return None
+    accounts = load_accounts()
+    if accounts is None:
+        import data_loader
+        if hmac.compare_digest(password, DEMO_PASSWORD) and username in data_loader.known_users():
+            return {'user': username, 'role': DEMO_ROLE}
+        return None
+    account = accounts.get(username)
+    if account is None or not hmac.compare_digest(hash_password(password, account['Salt']), account['Password_Hash']):
+        return None
+    return {'user': username, 'role': account.get('Role') or 'user'}
+
+def login(account):
+    """Store an authenticated account ({'user', 'role'}) in the signed session."""
+    from flask import session
+    session.clear()
+    session['user'], session['role'] = account['user'], account['role']
+
+def logout():
+    from flask import session
+    session.clear()
+
+def current_user():
+    """{'user', 'role'} of the request's signed session, or None when not logged in."""
+    from flask import session
+    if not session.get('user'):
+        return None
+    return {'user': session['user'], 'role': session.get('role', 'user')}
+
+def can_open(tab, account):
+    return account is not None and account['role'] in TAB_ROLES.get(tab, ())
+
+def can_view_patient(account, patient):
+    return account is not None and (account['role'] in CLINICAL_ROLES or account['user'] == patient)
+
+def require_tab(tab):
+    """The session account in a callback of tab; stops the callback when it may not open the tab."""
+    from dash.exceptions import PreventUpdate
+    account = current_user()
+    if not can_open(tab, account):
+        raise PreventUpdate
+    return account
+
+def add_account(user_id, password, role='user'):
+    """Add or replace an account in the users file."""
+    accounts = dict(load_accounts() or {})
+    salt = secrets.token_hex(16)
+    accounts[user_id] = {'User_ID': user_id, 'Role': role, 'Salt': salt, 'Password_Hash': hash_password(password, salt)}
+    path = users_file()
+    with open(path + ".tmp", "w", newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDS)
+        writer.writeheader()
+        writer.writerows(accounts.values())
+    os.replace(path + ".tmp", path)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage dashboard accounts.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    add = commands.add_parser("add", help="Add or replace an account")
+    add.add_argument("user_id")
+    add.add_argument("--role", default="user", choices=ROLES)
+    args = parser.parse_args()
+    add_account(args.user_id, getpass.getpass(f"Password for {args.user_id}: "), args.role)
+    print(f"Saved {args.user_id} to {users_file()}")
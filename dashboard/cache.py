@@ -0,0 +1,385 @@
+import functools
+import hashlib
+import inspect
+import os
+import pickle
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+# Cross-process cache for dataset frames and computed snapshots.
+# Entries are pickled into CACHE_DIR so every worker process (and the preloading
+# master) shares them; a small in-process LRU in front avoids re-unpickling hot
+# entries on every tick.
+# Per-user entries (cached(per_user=True)) live in their own in-process tier
+# instead: one LRU partition per user with a byte budget, and whole users are
+# evicted least recently used first once all partitions exceed the total
+# budget, so thousands of users cannot push each other's (or the shared
+# frames') entries out. Evicted entries are also removed from CACHE_DIR.
+# A file's mtime is the time it may be deleted: its expiry for entries with a
+# ttl, otherwise IDLE_SECONDS after it was last written or read from disk. Every
+# SWEEP_SECONDS one process deletes the files past that time (and lock/temp
+# files left behind by crashed processes) in a background thread.
+CACHE_DIR = os.getenv("NEUROCHAIR_CACHE_DIR", os.path.join(tempfile.gettempdir(), "neurochair-cache"))
+LOCAL_ENTRIES = 64
+LOCK_TIMEOUT = 30  # Seconds to wait for another process computing the same entry
+USER_BUDGET_BYTES = int(os.getenv("CACHE_USER_BYTES", 256 * 1024))  # Pickled size per user partition
+USERS_BUDGET_BYTES = int(os.getenv("CACHE_USERS_BYTES", 64 * 1024 * 1024))  # All user partitions of a process
+IDLE_SECONDS = int(os.getenv("CACHE_IDLE_SECONDS", 86400))  # Unused entries without a ttl are deleted after this
+SWEEP_SECONDS = int(os.getenv("CACHE_SWEEP_SECONDS", 600))
+SWEEP_STAMP = "sweep.stamp"  # mtime = last sweep by any process
+
+def _digest(key):
+    return hashlib.sha1(repr(key).encode()).hexdigest()
+
+class UserPartitions:
+    """
+    In-process LRU partitions keyed by user. Sizes are the pickled sizes of
+    the entries; put() returns the digests it evicted. Each entry records
+    whether it was read since it was stored (was_read), so refresh-ahead
+    only recomputes entries that are still being used.
+    """
+    def __init__(self, user_bytes=USER_BUDGET_BYTES, total_bytes=USERS_BUDGET_BYTES):
+        self.user_bytes = user_bytes
+        self.total_bytes = total_bytes
+        self._users = OrderedDict()  # user -> OrderedDict(digest -> [expires_at, value, size, read])
+        self._sizes = {}  # user -> bytes
+        self.total = 0
+        self.evicted_users = 0
+        self.evicted_entries = 0
+
+    def get(self, user, digest, now):
+        entries = self._users.get(user)
+        entry = entries.get(digest) if entries is not None else None
+        if entry is None:
+            return False, None
+        if entry[0] is not None and entry[0] <= now:
+            self._drop(user, digest)
+            return False, None
+        self._users.move_to_end(user)
+        entries.move_to_end(digest)
+        entry[3] = True
+        return True, entry[1]
+
+    def expires_at(self, user, digest):
+        entry = self._users.get(user, {}).get(digest)
+        return entry[0] if entry is not None else None
+
+    def was_read(self, user, digest):
+        entry = self._users.get(user, {}).get(digest)
+        return entry is not None and entry[3]
+
+    def _drop(self, user, digest):
+        size = self._users[user].pop(digest)[2]
+        self._sizes[user] -= size
+        self.total -= size
+        if not self._users[user]:
+            del self._users[user], self._sizes[user]
+
+    def put(self, user, digest, expires_at, value, size, read=False):
+        if user in self._users and digest in self._users[user]:
+            self._drop(user, digest)
+        if size > self.user_bytes:
+            return []  # Larger than a whole partition: only kept in CACHE_DIR
+        entries = self._users.setdefault(user, OrderedDict())
+        entries[digest] = [expires_at, value, size, read]
+        self._sizes[user] = self._sizes.get(user, 0) + size
+        self.total += size
+        self._users.move_to_end(user)
+        evicted = []
+        while self._sizes[user] > self.user_bytes:
+            oldest = next(iter(entries))
+            self._drop(user, oldest)
+            evicted.append(oldest)
+            self.evicted_entries += 1
+        while self.total > self.total_bytes and len(self._users) > 1:
+            coldest = next(iter(self._users))
+            evicted.extend(self._users[coldest])
+            self.evicted_entries += len(self._users[coldest])
+            for digest_ in list(self._users[coldest]):
+                self._drop(coldest, digest_)
+            self.evicted_users += 1
+        return evicted
+
+    def clear(self):
+        self._users.clear()
+        self._sizes.clear()
+        self.total = 0
+
+    def stats(self):
+        return {'users': len(self._users), 'bytes': self.total, 'entries': sum(len(e) for e in self._users.values()),
+                'evicted_users': self.evicted_users, 'evicted_entries': self.evicted_entries}
+
+class SharedCache:
+    """
+    Filesystem-backed cache shared between processes, with per-entry TTL.
+    """
+    def __init__(self, directory=CACHE_DIR, local_entries=LOCAL_ENTRIES):
+        self.directory = directory
+        self.local_entries = local_entries
+        self._local = OrderedDict()  # digest -> (expires_at, value)
+        self.partitions = UserPartitions()
+        self._lock = threading.Lock()
+        self._sweeping = False
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, digest):
+        return os.path.join(self.directory, digest + ".pkl")
+
+    def _remember(self, digest, expires_at, value, partition=None, size=0, read=False):
+        with self._lock:
+            if partition is not None:
+                evicted = self.partitions.put(partition, digest, expires_at, value, size, read)
+            else:
+                self._local[digest] = (expires_at, value)
+                self._local.move_to_end(digest)
+                while len(self._local) > self.local_entries:
+                    self._local.popitem(last=False)
+                return
+        for old in evicted:
+            if old != digest:
+                self._remove_file(old)
+
+    def _remove_file(self, digest):
+        try:
+            os.remove(self._path(digest))
+        except OSError:
+            pass
+
+    def _lookup(self, digest, partition=None):
+        now = time.time()
+        with self._lock:
+            if partition is not None:
+                found, value = self.partitions.get(partition, digest, now)
+                if found:
+                    return True, value
+            else:
+                entry = self._local.get(digest)
+                if entry is not None:
+                    if entry[0] is None or entry[0] > now:
+                        self._local.move_to_end(digest)
+                        return True, entry[1]
+                    del self._local[digest]
+        try:
+            with open(self._path(digest), "rb") as f:
+                data = f.read()
+                deletable_at = os.fstat(f.fileno()).st_mtime
+            expires_at, value = pickle.loads(data)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return False, None
+        if expires_at is not None and expires_at <= now:
+            return False, None
+        if expires_at is None and deletable_at - now < IDLE_SECONDS / 2:
+            self._touch(digest, now)
+        self._remember(digest, expires_at, value, partition, len(data), read=True)
+        return True, value
+
+    def get(self, key, default=None, partition=None):
+        found, value = self._lookup(_digest(key), partition)
+        return value if found else default
+
+    def set(self, key, value, ttl=None, partition=None):
+        digest = _digest(key)
+        expires_at = time.time() + ttl if ttl else None
+        data = pickle.dumps((expires_at, value), protocol=pickle.HIGHEST_PROTOCOL)
+        # Write to a temp file then rename, so readers never see a partial entry
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            # mtime = when the file may be deleted; for ttl entries also read by expires_in()
+            deletable_at = expires_at if expires_at is not None else time.time() + IDLE_SECONDS
+            os.utime(tmp_path, (deletable_at, deletable_at))
+            os.replace(tmp_path, self._path(digest))
+        except OSError as e:
+            print(f"Cache write failed: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        self._remember(digest, expires_at, value, partition, len(data))
+        self._maybe_sweep()
+
+    def _touch(self, digest, now):
+        try:
+            os.utime(self._path(digest), (now + IDLE_SECONDS, now + IDLE_SECONDS))
+        except OSError:
+            pass
+
+    def sweep(self):
+        """
+        Delete entry files past their mtime and lock/temp files older than
+        LOCK_TIMEOUT. Entries this process holds in memory without a ttl are
+        touched first, so hot frames served from memory are not deleted.
+        Returns the number of files deleted.
+        """
+        now = time.time()
+        with self._lock:
+            held = [digest for digest, (expires_at, _) in self._local.items() if expires_at is None]
+        for digest in held:
+            self._touch(digest, now)
+        deleted = 0
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                mtime = os.path.getmtime(path)
+                if (name.endswith(".pkl") and mtime < now) or \
+                        (name.endswith((".lock", ".tmp")) and mtime < now - LOCK_TIMEOUT):
+                    os.remove(path)
+                    deleted += 1
+            except OSError:
+                pass  # Replaced or deleted by another process meanwhile
+        return deleted
+
+    def _maybe_sweep(self):
+        # At most one sweep per SWEEP_SECONDS across processes, off the request path
+        stamp = os.path.join(self.directory, SWEEP_STAMP)
+        try:
+            if time.time() - os.path.getmtime(stamp) < SWEEP_SECONDS:
+                return
+        except OSError:
+            pass
+        with self._lock:
+            if self._sweeping:
+                return
+            self._sweeping = True
+        try:
+            with open(stamp, "a"):
+                pass
+            os.utime(stamp)
+        except OSError as e:
+            print(f"Cache sweep skipped: {e}")
+            self._sweeping = False
+            return
+
+        def run():
+            try:
+                deleted = self.sweep()
+                if deleted:
+                    print(f"Cache sweep: deleted {deleted} expired files")
+            finally:
+                self._sweeping = False
+        threading.Thread(target=run, name="cache-sweep", daemon=True).start()
+
+    def expires_in(self, key, partition=None):
+        """
+        Seconds until the entry for key (stored with a ttl) expires, across
+        processes; 0 when it is missing or expired.
+        """
+        digest = _digest(key)
+        with self._lock:
+            expires_at = self.partitions.expires_at(partition, digest) if partition is not None else \
+                (self._local.get(digest) or (None,))[0]
+        try:
+            # Another process may have refreshed it since this one last read it
+            expires_at = max(expires_at or 0.0, os.path.getmtime(self._path(digest)))
+        except OSError:
+            pass
+        return max(0.0, (expires_at or 0.0) - time.time())
+
+    def was_read(self, key, partition):
+        """Whether this process read the partition's entry for key since it was stored."""
+        with self._lock:
+            return self.partitions.was_read(partition, _digest(key))
+
+    def refresh(self, key, compute, ttl=None, partition=None):
+        """
+        Recompute and store the entry for key unless another process is
+        already computing it. Returns whether it was recomputed.
+        """
+        lock_path = self._path(_digest(key)) + ".lock"
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return False
+        try:
+            self.set(key, compute(), ttl, partition)
+            return True
+        finally:
+            os.close(fd)
+            os.remove(lock_path)
+
+    def get_or_compute(self, key, compute, ttl=None, partition=None):
+        """
+        Return the cached value for key, computing it at most once across processes.
+        partition (a user id) stores the entry in that user's partition.
+        """
+        digest = _digest(key)
+        found, value = self._lookup(digest, partition)
+        if found:
+            return value
+        lock_path = self._path(digest) + ".lock"
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(lock_path) > LOCK_TIMEOUT:
+                    os.remove(lock_path)  # Left behind by a crashed process
+            except FileNotFoundError:
+                pass
+            if not os.path.exists(lock_path):
+                return self.get_or_compute(key, compute, ttl, partition)
+            # Another process is computing it; wait for its result
+            deadline = time.time() + LOCK_TIMEOUT
+            while os.path.exists(lock_path) and time.time() < deadline:
+                time.sleep(0.05)
+            found, value = self._lookup(digest, partition)
+            if found:
+                return value
+            fd = None
+        try:
+            value = compute()
+            self.set(key, value, ttl, partition)
+            return value
+        finally:
+            if fd is not None:
+                os.close(fd)
+                os.remove(lock_path)
+
+    def clear(self):
+        with self._lock:
+            self._local.clear()
+            self.partitions.clear()
+        for name in os.listdir(self.directory):
+            if name.endswith(".pkl"):
+                os.remove(os.path.join(self.directory, name))
+
+shared_cache = SharedCache()
+
+def cached(ttl=None, per_user=False):
+    """
+    Decorator: cache a function's result in the shared cache, keyed by its arguments.
+    per_user: the first argument is a user id and entries go to that user's
+    partition; the wrapper then also has warm(user_id, *args, ahead=seconds),
+    which recomputes the entry when it was read since it was stored and
+    expires within `ahead` seconds.
+    Arguments are bound to the signature (defaults applied) before keying, so
+    f(u, 7), f(u, days=7) and f(u) share one entry when 7 is the default.
+    """
+    def decorator(func):
+        signature = inspect.signature(func)
+
+        def bind(args, kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            return bound.arguments
+
+        def key_of(args, kwargs):
+            return (func.__module__, func.__qualname__, tuple(bind(args, kwargs).items()))
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            arguments = bind(args, kwargs)
+            key = (func.__module__, func.__qualname__, tuple(arguments.items()))
+            partition = next(iter(arguments.values())) if per_user else None
+            return shared_cache.get_or_compute(key, lambda: func(*args, **kwargs), ttl, partition)
+
+        def warm(user_id, *args, ahead=0.0):
+            key = key_of((user_id,) + args, {})
+            if not shared_cache.was_read(key, user_id) or shared_cache.expires_in(key, user_id) > ahead:
+                return False
+            return shared_cache.refresh(key, lambda: func(user_id, *args), ttl, user_id)
+
+        if per_user:
+            wrapper.warm = warm
+        return wrapper
+    return decorator
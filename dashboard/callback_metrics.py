@@ -0,0 +1,335 @@
+import cProfile
+import glob
+import hmac
+import io
+import ipaddress
+import json
+import os
+import pstats
+import tempfile
+import threading
+import time
+from collections import Counter, deque
+
+from flask import Response, abort, g, request
+
+from cache import CACHE_DIR
+
+# Per-callback request metrics for the Dash server.
+# Every POST to /_dash-update-component is timed in Flask request hooks, keyed by
+# the callback id (its outputs), so the numbers include Dash's serialization.
+# Each worker process keeps its own counters and writes a snapshot to METRICS_DIR
+# every few seconds; /metrics merges the snapshots of all live workers.
+# With CALLBACK_SLOW_MS set, callback requests run under cProfile and those over
+# the threshold are appended to SLOW_LOG with their top functions.
+# /metrics is operational data (callback names, traffic): it answers clients in
+# METRICS_NETWORKS (default loopback only) and requests carrying
+# "Authorization: Bearer $METRICS_TOKEN"; everyone else gets 403.
+# Modules with in-process caches add their stats to the snapshots with
+# register_cache_stats(); /metrics merges them over the workers too.
+METRICS_DIR = os.path.join(CACHE_DIR, "metrics")
+SNAPSHOT_SECONDS = 5
+STALE_SECONDS = 300  # Snapshots of workers silent for longer are dropped
+RESERVOIR = 1000  # Latest latencies kept per callback for percentiles
+SLOW_MS = float(os.getenv("CALLBACK_SLOW_MS", 0))  # 0 = profiling off
+SLOW_LOG = os.getenv("CALLBACK_SLOW_LOG", os.path.join(tempfile.gettempdir(), "neurochair-slow-callbacks.log"))
+SLOW_LOG_FUNCTIONS = 25
+CALLBACK_PATH = "/_dash-update-component"
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+METRICS_NETWORKS = [ipaddress.ip_network(n.strip())
+                    for n in os.getenv("METRICS_NETWORKS", "127.0.0.0/8,::1/128").split(",") if n.strip()]
+
+class CallbackStats:
+    """
+    Counters for one callback id.
+    """
+    def __init__(self, name):
+        self.name = name
+        self.count = 0
+        self.errors = 0  # 5xx responses
+        self.prevented = 0  # PreventUpdate (204)
+        self.slow = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.bytes_total = 0
+        self.bytes_max = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.latencies = deque(maxlen=RESERVOIR)
+        self.triggers = Counter()  # Changed input prop -> calls
+
+    def to_dict(self):
+        return {'name': self.name, 'count': self.count, 'errors': self.errors, 'prevented': self.prevented,
+                'slow': self.slow, 'total_ms': self.total_ms, 'max_ms': self.max_ms,
+                'bytes_total': self.bytes_total, 'bytes_max': self.bytes_max, 'in_flight': self.in_flight,
+                'max_in_flight': self.max_in_flight, 'latencies': list(self.latencies),
+                'triggers': dict(self.triggers)}
+
+class CallbackMetrics:
+    """
+    Thread-safe per-callback counters for this process.
+    """
+    def __init__(self):
+        self._stats = {}  # callback id -> CallbackStats
+        self._lock = threading.Lock()
+        self._last_snapshot = 0.0
+        self._caches = {}  # name -> stats function
+        self.started_at = time.time()
+
+    def register_cache(self, name, stats):
+        self._caches[name] = stats
+
+    def start(self, callback_id, name, trigger):
+        with self._lock:
+            stats = self._stats.get(callback_id)
+            if stats is None:
+                stats = self._stats[callback_id] = CallbackStats(name)
+            stats.in_flight += 1
+            stats.max_in_flight = max(stats.max_in_flight, stats.in_flight)
+            stats.triggers[trigger] += 1
+
+    def finish(self, callback_id, ms, status, size, slow):
+        with self._lock:
+            stats = self._stats[callback_id]
+            stats.in_flight -= 1
+            stats.count += 1
+            stats.errors += status >= 500
+            stats.prevented += status == 204
+            stats.slow += slow
+            stats.total_ms += ms
+            stats.max_ms = max(stats.max_ms, ms)
+            stats.bytes_total += size
+            stats.bytes_max = max(stats.bytes_max, size)
+            stats.latencies.append(ms)
+            due = time.time() - self._last_snapshot >= SNAPSHOT_SECONDS
+            if due:
+                self._last_snapshot = time.time()
+        if due:
+            self.write_snapshot()
+
+    def snapshot(self):
+        caches = {name: stats() for name, stats in list(self._caches.items())}
+        with self._lock:
+            return {'pid': os.getpid(), 'started_at': self.started_at, 'updated_at': time.time(),
+                    'callbacks': {cid: s.to_dict() for cid, s in self._stats.items()}, 'caches': caches}
+
+    def write_snapshot(self):
+        try:
+            os.makedirs(METRICS_DIR, exist_ok=True)
+            path = os.path.join(METRICS_DIR, f"{os.getpid()}.json")
+            with open(path + ".tmp", "w") as f:
+                json.dump(self.snapshot(), f)
+            os.replace(path + ".tmp", path)
+        except OSError as e:
+            print(f"Metrics snapshot failed: {e}")
+
+metrics = CallbackMetrics()
+
+def register_cache_stats(name, stats):
+    """
+    Report stats() on /metrics. It returns a dict whose dict values are caches
+    ({'entries', 'hits', 'misses', ...}, summed over workers) and whose other
+    values are reported at their maximum over workers.
+    """
+    metrics.register_cache(name, stats)
+
+def _worker_snapshots():
+    """Live snapshots of all workers; this process's counters are read directly."""
+    own = metrics.snapshot()
+    snapshots = [own]
+    for path in glob.glob(os.path.join(METRICS_DIR, "*.json")):
+        try:
+            if time.time() - os.path.getmtime(path) > STALE_SECONDS:
+                continue
+            with open(path) as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if snapshot['pid'] != own['pid']:
+            snapshots.append(snapshot)
+    return snapshots
+
+def _percentiles(values, qs):
+    # Linear interpolation, as numpy.percentile (numpy stays out of app startup)
+    values = sorted(values)
+    out = []
+    for q in qs:
+        pos = (len(values) - 1) * q / 100
+        lo = int(pos)
+        hi = min(lo + 1, len(values) - 1)
+        out.append(values[lo] + (values[hi] - values[lo]) * (pos - lo))
+    return out
+
+def summarize(snapshots):
+    """Merge worker snapshots into per-callback totals with latency percentiles."""
+    merged = {}
+    for snapshot in snapshots:
+        for cid, s in snapshot['callbacks'].items():
+            m = merged.setdefault(cid, {'name': s['name'], 'count': 0, 'errors': 0, 'prevented': 0, 'slow': 0,
+                                        'total_ms': 0.0, 'max_ms': 0.0, 'bytes_total': 0, 'bytes_max': 0,
+                                        'in_flight': 0, 'max_in_flight': 0, 'latencies': [], 'triggers': Counter()})
+            for key in ('count', 'errors', 'prevented', 'slow', 'total_ms', 'bytes_total', 'in_flight'):
+                m[key] += s[key]
+            for key in ('max_ms', 'bytes_max', 'max_in_flight'):
+                m[key] = max(m[key], s[key])
+            m['latencies'].extend(s['latencies'])
+            m['triggers'].update(s['triggers'])
+    out = {}
+    for cid, m in merged.items():
+        latencies = m.pop('latencies')
+        p50, p95, p99 = _percentiles(latencies, (50, 95, 99)) if latencies else (None, None, None)
+        out[cid] = dict(m, triggers=dict(m['triggers']),
+                        mean_ms=m['total_ms'] / m['count'] if m['count'] else None,
+                        p50_ms=p50, p95_ms=p95, p99_ms=p99,
+                        mean_bytes=m['bytes_total'] / m['count'] if m['count'] else None)
+    return out
+
+def summarize_caches(snapshots):
+    """Merge the workers' cache stats: counters summed and hit rates recomputed."""
+    merged = {}
+    for snapshot in snapshots:
+        for name, stats in snapshot.get('caches', {}).items():
+            m = merged.setdefault(name, {})
+            for key, value in stats.items():
+                if isinstance(value, dict):
+                    cache = m.setdefault(key, {'entries': 0, 'hits': 0, 'misses': 0})
+                    for counter in cache:
+                        cache[counter] += value.get(counter, 0)
+                elif value is not None:
+                    m[key] = value if m.get(key) is None else max(m[key], value)
+    for stats in merged.values():
+        for cache in stats.values():
+            if isinstance(cache, dict):
+                lookups = cache['hits'] + cache['misses']
+                cache['hit_rate'] = cache['hits'] / lookups if lookups else None
+    return merged
+
+def _trigger_name(prop_id):
+    # Pattern-matching ids ({"index": ..., "type": "alert-ack"}.n_clicks) are counted per type
+    component, _, prop = prop_id.rpartition('.')
+    if component.startswith('{'):
+        try:
+            component = json.loads(component).get('type', component)
+        except ValueError:
+            pass
+    return f"{component}.{prop}" if component else prop_id
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"')
+
+def _prometheus(summary, workers, caches=None):
+    lines = [f"neurochair_metrics_workers {workers}"]
+    for name, stats in sorted((caches or {}).items()):
+        for key, cache in stats.items():
+            if not isinstance(cache, dict):
+                continue
+            labels = f'cache="{_label(name + "." + key)}"'
+            lines += [f"neurochair_cache_entries{{{labels}}} {cache['entries']}",
+                      f"neurochair_cache_hits_total{{{labels}}} {cache['hits']}",
+                      f"neurochair_cache_misses_total{{{labels}}} {cache['misses']}"]
+    series = [('callback_requests_total', 'count'), ('callback_errors_total', 'errors'),
+              ('callback_prevented_total', 'prevented'), ('callback_slow_total', 'slow'),
+              ('callback_latency_ms_sum', 'total_ms'), ('callback_response_bytes_sum', 'bytes_total'),
+              ('callback_in_flight', 'in_flight'), ('callback_max_in_flight', 'max_in_flight')]
+    for cid, s in sorted(summary.items(), key=lambda item: item[1]['name']):
+        labels = f'callback="{_label(s["name"])}"'
+        for metric, key in series:
+            lines.append(f"neurochair_{metric}{{{labels}}} {s[key]}")
+        for q, key in (('0.5', 'p50_ms'), ('0.95', 'p95_ms'), ('0.99', 'p99_ms')):
+            if s[key] is not None:
+                lines.append(f'neurochair_callback_latency_ms{{{labels},quantile="{q}"}} {s[key]:.3f}')
+        for trigger, n in s['triggers'].items():
+            lines.append(f'neurochair_callback_triggers_total{{{labels},trigger="{_label(trigger)}"}} {n}')
+    return "\n".join(lines) + "\n"
+
+def _write_slow_log(name, ms, trigger, profiler):
+    out = io.StringIO()
+    pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(SLOW_LOG_FUNCTIONS)
+    header = f"=== {time.strftime('%Y-%m-%d %H:%M:%S')} pid={os.getpid()} {name} {ms:.1f} ms (trigger: {trigger})\n"
+    try:
+        with open(SLOW_LOG, "a") as f:
+            f.write(header + out.getvalue() + "\n")
+    except OSError as e:
+        print(f"Slow callback log failed: {e}")
+
+def metrics_allowed():
+    """Whether the current request may read /metrics (token or allowed network)."""
+    header = request.headers.get("Authorization", "")
+    if METRICS_TOKEN and hmac.compare_digest(header, f"Bearer {METRICS_TOKEN}"):
+        return True
+    try:
+        address = ipaddress.ip_address(request.remote_addr or "")
+    except ValueError:
+        return False
+    return any(address in network for network in METRICS_NETWORKS)
+
+def register_callback_metrics(app):
+    """
+    Time every callback request on app.server and add the /metrics route:
+    /metrics (JSON, all workers), /metrics?scope=worker, /metrics?format=prometheus
+    """
+    server = app.server
+    names = {}
+
+    def callback_name(callback_id):
+        # Readable name from the registered function, e.g. end_user_tab.update_dashboard
+        if callback_id not in names:
+            func = app.callback_map.get(callback_id, {}).get('callback')
+            names[callback_id] = (f"{func.__module__.split('.')[-1]}.{func.__name__}" if func is not None
+                                  else callback_id)
+        return names[callback_id]
+
+    @server.before_request
+    def start_timer():
+        if request.method != "POST" or not request.path.endswith(CALLBACK_PATH):
+            return
+        body = request.get_json(silent=True) or {}
+        callback_id = body.get('output')
+        if callback_id is None:
+            return
+        changed = body.get('changedPropIds') or ['initial']
+        g.callback = (callback_id, callback_name(callback_id), _trigger_name(changed[0]))
+        g.callback_status, g.callback_size = 500, 0
+        metrics.start(*g.callback)
+        g.callback_profiler = None
+        if SLOW_MS:
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+                g.callback_profiler = profiler
+            except ValueError:
+                pass  # Another profiler is active on this interpreter
+        g.callback_started = time.perf_counter()
+
+    @server.after_request
+    def record_response(response):
+        if 'callback' in g:
+            g.callback_status = response.status_code
+            g.callback_size = response.calculate_content_length() or 0
+        return response
+
+    @server.teardown_request
+    def finish_timer(exc):
+        if 'callback' not in g:
+            return
+        ms = (time.perf_counter() - g.callback_started) * 1000
+        profiler = g.callback_profiler
+        if profiler is not None:
+            profiler.disable()
+        slow = bool(SLOW_MS) and ms >= SLOW_MS
+        callback_id, name, trigger = g.callback
+        metrics.finish(callback_id, ms, 500 if exc is not None else g.callback_status, g.callback_size, slow)
+        if slow and profiler is not None:
+            _write_slow_log(name, ms, trigger, profiler)
+
+    @server.route("/metrics")
+    def callback_metrics():
+        if not metrics_allowed():
+            abort(403)
+        snapshots = [metrics.snapshot()] if request.args.get('scope') == 'worker' else _worker_snapshots()
+        summary, caches = summarize(snapshots), summarize_caches(snapshots)
+        if request.args.get('format') == 'prometheus':
+            return Response(_prometheus(summary, len(snapshots), caches), mimetype="text/plain; version=0.0.4")
+        return Response(json.dumps({'workers': [s['pid'] for s in snapshots], 'slow_ms': SLOW_MS or None,
+                                    'callbacks': summary, 'caches': caches}, default=float),
+                        mimetype="application/json")
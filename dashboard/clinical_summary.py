@@ -0,0 +1,237 @@
+import datetime
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+from pymongo.errors import PyMongoError
+
+import data_loader
+import database
+from callback_metrics import register_cache_stats
+from temporal_profile import ALERT_STRESS_LEVEL
+
+# Clinical View summaries (averages, sessions, improvement, compliance, risk,
+# daily trends) for a patient and date range.
+# Work is split per (patient, day): closed days only change through late
+# ingest, replay or archive compaction, which bump the data generation in
+# Mongo (database.bump_data_generation). Day aggregates are cached under
+# (patient, day, data generation) until evicted, so a bump recomputes closed
+# days within GENERATION_SECONDS in every worker; today's aggregate also
+# expires after TODAY_TTL. Range summaries are combined from day aggregates and
+# cached under (patient, start, end, generations, today's aggregate), so they
+# follow both. Hit rates are served on /metrics (cache_stats).
+DAY_CACHE_ENTRIES = 5000  # ~ 50 patients x 100 days
+RANGE_CACHE_ENTRIES = 256
+TODAY_TTL = 60  # Seconds before today's aggregate is recomputed
+GENERATION_SECONDS = 10  # Seconds between reads of the data generation
+SESSION_GAP = 15 * 60  # Seconds without samples that end a sitting session
+LONG_SITTING = 2 * 3600  # Sessions longer than this are reported as events
+POOR_POSTURE_EVENT = 10 * 60  # Minimum poor-posture run reported as an event
+RECENT_SESSIONS = 12
+RECENT_EVENTS = 5
+
+class SummaryCache:
+    """
+    Thread-safe LRU with optional per-entry TTL and hit/miss counters.
+    """
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (expires_at or None, value)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return (found, value)."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (entry[0] is None or entry[0] > time.time()):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True, entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return False, None
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._entries[key] = (time.time() + ttl if ttl else None, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self, predicate=None):
+        with self._lock:
+            for key in [k for k in self._entries if predicate is None or predicate(k)]:
+                del self._entries[key]
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {'entries': len(self._entries), 'max_entries': self.max_entries, 'hits': self.hits,
+                'misses': self.misses, 'hit_rate': self.hits / lookups if lookups else None}
+
+day_cache = SummaryCache(DAY_CACHE_ENTRIES)
+range_cache = SummaryCache(RANGE_CACHE_ENTRIES)
+_generation = 0
+_data_generation = (0.0, 0)  # (time read, generation)
+
+def data_generation():
+    """The data generation in Mongo, re-read at most every GENERATION_SECONDS."""
+    global _data_generation
+    read_at, generation = _data_generation
+    if time.time() - read_at >= GENERATION_SECONDS:
+        try:
+            generation = database.get_data_generation()
+        except PyMongoError as e:
+            print(f"Data generation read failed: {e}")  # Keep the last one; retried next time
+        if generation != _data_generation[1]:
+            day_cache.clear(lambda key: key[2] != generation)  # Superseded days, never read again
+        _data_generation = (time.time(), generation)
+    return generation
+
+def invalidate(patient=None):
+    """Drop cached aggregates (for one patient or all) after historical data changed."""
+    global _generation
+    _generation += 1
+    day_cache.clear(lambda key: patient is None or key[0] == patient)
+
+def cache_stats():
+    return {'day': day_cache.stats(), 'range': range_cache.stats(), 'generation': _generation,
+            'data_generation': _data_generation[1]}
+
+register_cache_stats('clinical_summary', cache_stats)
+
+# ---- per-day aggregates ----
+
+def _runs(mask):
+    """(start, end) index pairs of consecutive True runs."""
+    edges = np.diff(np.concatenate([[0], mask.astype(np.int8), [0]]))
+    return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1) - 1
+
+def _day_aggregate(day, df):
+    agg = {'day': day, 'samples': len(df), 'stress_sum': 0.0, 'stress_n': 0, 'posture_sum': 0.0, 'posture_n': 0,
+           'sessions': [], 'events': []}
+    if df.empty:
+        return agg
+    df = df.sort_values('timestamp')
+    ts = df['timestamp'].to_numpy()
+    seconds = ts.astype('datetime64[s]').astype(np.int64)
+    stress = df['stress_level'].to_numpy(dtype=np.float64) if 'stress_level' in df else np.full(len(df), np.nan)
+    posture = df['posture_score'].to_numpy(dtype=np.float64) if 'posture_score' in df else np.full(len(df), np.nan)
+    agg.update(stress_sum=float(np.nansum(stress)), stress_n=int((~np.isnan(stress)).sum()),
+               posture_sum=float(np.nansum(posture)), posture_n=int((~np.isnan(posture)).sum()))
+
+    # Sitting sessions: samples separated by less than SESSION_GAP
+    starts = np.concatenate([[0], np.flatnonzero(np.diff(seconds) > SESSION_GAP) + 1])
+    ends = np.concatenate([starts[1:] - 1, [len(df) - 1]])
+    with np.errstate(invalid='ignore'):
+        for s, e in zip(starts, ends):
+            agg['sessions'].append({'start': ts[s], 'seconds': int(seconds[e] - seconds[s]),
+                                    'stress': np.nanmean(stress[s:e + 1]) if (~np.isnan(stress[s:e + 1])).any() else None,
+                                    'posture': np.nanmean(posture[s:e + 1]) if (~np.isnan(posture[s:e + 1])).any() else None})
+
+    # Events: high-stress runs, long poor-posture runs, long sessions
+    for s, e in zip(*_runs(stress >= ALERT_STRESS_LEVEL)):
+        agg['events'].append({'start': ts[s], 'type': 'High Stress', 'seconds': int(seconds[e] - seconds[s]), 'level': 'critical'})
+    if 'Posture_Class' in df:
+        for s, e in zip(*_runs(df['Posture_Class'].to_numpy() == 3)):
+            if seconds[e] - seconds[s] >= POOR_POSTURE_EVENT:
+                agg['events'].append({'start': ts[s], 'type': 'Poor Posture', 'seconds': int(seconds[e] - seconds[s]), 'level': 'warning'})
+    for session in agg['sessions']:
+        if session['seconds'] >= LONG_SITTING:
+            agg['events'].append({'start': session['start'], 'type': 'Long Sitting', 'seconds': session['seconds'], 'level': 'warning'})
+    return agg
+
+def _load_days(patient, days, today, generation):
+    """Compute and cache aggregates for several days with one query over their span."""
+    start = datetime.datetime.combine(min(days), datetime.time())
+    end = datetime.datetime.combine(max(days) + datetime.timedelta(days=1), datetime.time())
+    docs = database.get_metric_samples(start, ['stress_level', 'Posture_Class', 'posture_score'], [patient], end_time=end)
+    df = data_loader.docs_to_frame(docs)
+    by_day = dict(tuple(df.groupby(df['timestamp'].dt.date))) if not df.empty else {}
+    now = time.time()
+    out = {}
+    for day in days:
+        agg = _day_aggregate(day, by_day.get(day, df.iloc[0:0]))
+        agg['computed_at'] = now
+        day_cache.set((patient, day, generation), agg, ttl=TODAY_TTL if day >= today else None)
+        out[day] = agg
+    return out
+
+def get_days(patient, days, today=None):
+    """Aggregates for patient-days; closed days are cached until the data generation moves."""
+    today = today or datetime.date.today()
+    generation = data_generation()
+    out, missing = {}, []
+    for day in days:
+        found, agg = day_cache.get((patient, day, generation))
+        if found:
+            out[day] = agg
+        else:
+            missing.append(day)
+    if missing:
+        out.update(_load_days(patient, missing, today, generation))
+    return [out[day] for day in days]
+
+# ---- range summaries ----
+
+def _ratio(num, den):
+    return num / den if den else None
+
+def _combine(days):
+    stress_n = sum(d['stress_n'] for d in days)
+    posture_n = sum(d['posture_n'] for d in days)
+    if stress_n == 0 and posture_n == 0:
+        return None
+    stress = _ratio(sum(d['stress_sum'] for d in days), stress_n)
+    posture = _ratio(sum(d['posture_sum'] for d in days), posture_n)
+    sessions = [s for d in days for s in d['sessions']]
+    events = [e for d in days for e in d['events']]
+
+    # Improvement: posture in the second half of the range vs the first half
+    half = len(days) // 2
+    early = _ratio(sum(d['posture_sum'] for d in days[:half]), sum(d['posture_n'] for d in days[:half]))
+    late = _ratio(sum(d['posture_sum'] for d in days[half:]), sum(d['posture_n'] for d in days[half:]))
+    improvement = (late - early) / early * 100 if early and late is not None else None
+
+    critical = sum(e['level'] == 'critical' for e in events)
+    risk = 'High' if (stress or 0) >= 7 or critical >= 3 else 'Medium' if (stress or 0) >= 4 or critical else 'Low'
+    return {
+        'stress_avg': stress,
+        'posture_avg': posture,
+        'sessions': len(sessions),
+        'improvement_pct': improvement,
+        'compliance_pct': 100 * sum(1 for d in days if d['sessions']) / len(days),  # Days with chair use
+        'risk': risk,
+        'recent_sessions': sessions[::-1][:RECENT_SESSIONS],
+        'recent_events': sorted(events, key=lambda e: e['start'], reverse=True)[:RECENT_EVENTS],
+        'daily_dates': [d['day'] for d in days],
+        'daily_stress': [_ratio(d['stress_sum'], d['stress_n']) for d in days],
+        'daily_posture': [_ratio(d['posture_sum'], d['posture_n']) for d in days],
+    }
+
+def get_summary(patient, start_date, end_date):
+    """
+    Summary for a patient over [start_date, end_date], or None without data.
+    Database errors are not cached, so the next refresh retries.
+    """
+    today = datetime.date.today()
+    end_date = min(end_date, today)
+    if end_date < start_date:
+        return None
+    try:
+        # Today's aggregate stamps the key, so open ranges follow new data
+        today_stamp = get_days(patient, [today], today)[0]['computed_at'] if end_date >= today else None
+        key = (patient, start_date, end_date, _generation, data_generation(), today_stamp)
+        found, summary = range_cache.get(key)
+        if found:
+            return summary
+        days = get_days(patient, [start_date + datetime.timedelta(days=i) for i in range((end_date - start_date).days + 1)], today)
+        summary = _combine(days)
+        range_cache.set(key, summary)
+        return summary
+    except Exception as e:
+        print(f"Clinical summary query failed: {e}")
+        return None
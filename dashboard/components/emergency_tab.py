@@ -1,13 +1,22 @@
 from dash import html, dcc
 import dash_bootstrap_components as dbc
 import plotly.graph_objects as go
-from dash.dependencies import Input, Output
+from dash import callback_context
+from dash.dependencies import Input, Output, State, ALL
+from dash.exceptions import PreventUpdate
 import datetime
+import auth
+from refresh import live_inputs
+import temporal_profile
+from alert_store import get_alert_store
 
 COLORS = {'blue': '#4e79a7', 'orange': '#f28e2c', 'red': '#e15759', 'green': '#59a14f', 'teal': '#76b7b2'}
+CLAYOUT = {'paper_bgcolor': 'white', 'plot_bgcolor': 'white', 'font': {'size': 10, 'color': '#555'}, 'margin': {'l': 30, 'r': 20, 't': 20, 'b': 30}}
 
 def render_emergency_tab():
     return dbc.Container([
+        dcc.Store(id='alert-version', data=-1),
+        
         # Header
         dbc.Row([
             dbc.Col([
@@ -52,7 +61,7 @@ def render_emergency_tab():
                     dbc.CardBody([
                         dbc.Button("Broadcast Alert", color="danger", className="w-100 mb-2"),
                         dbc.Button("Contact All Responders", color="warning", className="w-100 mb-2"),
-                        dbc.Button("Acknowledge All", outline=True, color="secondary", className="w-100 mb-2"),
+                        dbc.Button("Acknowledge All", id='ack-all', outline=True, color="secondary", className="w-100 mb-2"),
                         html.Hr(),
                         dbc.Button("Alert Settings", outline=True, color="secondary", className="w-100 mb-2"),
                         dbc.Button("View Reports", outline=True, color="secondary", className="w-100"),
@@ -104,102 +113,116 @@ def create_stat_card(div_id, label):
     return dbc.Card([dbc.CardBody([html.Div(id=div_id)], className="py-2")])
 
 def register_emergency_callbacks(app):
+    # Alert store version: bumps on new samples/pushed alerts and on button
+    # actions; everything below redraws only when it changes
+    @app.callback(
+        Output('alert-version', 'data'),
+        [*live_inputs(), Input({'type': 'alert-ack', 'index': ALL}, 'n_clicks'),
+         Input({'type': 'alert-escalate', 'index': ALL}, 'n_clicks'), Input('ack-all', 'n_clicks')],
+        [State('alert-version', 'data')]
+    )
+    def sync_alert_state(sample, n, acks, escalations, ack_all, version):
+        auth.require_tab('emergency')
+        store = get_alert_store()
+        trigger = callback_context.triggered[0] if callback_context.triggered else None
+        if trigger and trigger['value']:
+            button = callback_context.triggered_id
+            if button == 'ack-all':
+                store.acknowledge_all()
+            elif isinstance(button, dict) and button['type'] == 'alert-ack':
+                store.acknowledge(button['index'])
+            elif isinstance(button, dict) and button['type'] == 'alert-escalate':
+                store.escalate(button['index'])
+        current = store.version if store.ready else None
+        if current == version:
+            raise PreventUpdate
+        return current
+
+    # Stats, active alerts and log from the alert store
     @app.callback(
         [Output('em-monitored', 'children'), Output('em-active', 'children'),
          Output('em-critical', 'children'), Output('em-resolved', 'children'),
          Output('em-response', 'children'), Output('em-uptime', 'children'),
          Output('alerts-container', 'children'), Output('alert-badge', 'children'),
-         Output('alerts-timeline', 'figure'), Output('alerts-type', 'figure'),
-         Output('response-trend', 'figure'), Output('notif-log', 'children'),
-         Output('responder-status', 'children')],
-        [Input('interval-component', 'n_intervals')]
+         Output('notif-log', 'children'), Output('responder-status', 'children')],
+        [Input('alert-version', 'data')]
     )
-    def update(n):
+    def update(version):
+        auth.require_tab('emergency')
         now = datetime.datetime.now()
+        store = get_alert_store()
         
-        # Stats
+        # Responder Status
+        responders = html.Div([html.Table([
+            html.Tbody([
+                html.Tr([html.Td("Dr. Smith"), html.Td(html.Span("Online", className="status-pill normal"))]),
+                html.Tr([html.Td("Nurse Johnson"), html.Td(html.Span("Online", className="status-pill normal"))]),
+                html.Tr([html.Td("HR Manager"), html.Td(html.Span("Away", className="status-pill warning"))]),
+            ])
+        ], className="data-table")])
+        
+        if not store.ready:
+            return (*demo_stats(), [demo_alert(now)], "1", demo_log(now), responders)
+        
+        s = store.stats()
+        response = f"{s['avg_response_min']:.1f}m" if s['avg_response_min'] is not None else "-"
         stats = [
-            create_stat_content("54", "MONITORED", COLORS['blue']),
-            create_stat_content("1", "ACTIVE ALERTS", COLORS['red']),
-            create_stat_content("1", "CRITICAL", COLORS['red']),
-            create_stat_content("12", "RESOLVED TODAY", COLORS['green']),
-            create_stat_content("2.3m", "AVG RESPONSE", COLORS['orange']),
+            create_stat_content(str(s['monitored']), "MONITORED", COLORS['blue']),
+            create_stat_content(str(s['active']), "ACTIVE ALERTS", COLORS['red'] if s['active'] else COLORS['green']),
+            create_stat_content(str(s['critical']), "CRITICAL", COLORS['red'] if s['critical'] else COLORS['green']),
+            create_stat_content(str(s['resolved_today']), "RESOLVED TODAY", COLORS['green']),
+            create_stat_content(response, "AVG RESPONSE", COLORS['orange']),
             create_stat_content("99.9%", "UPTIME", COLORS['green']),
         ]
         
-        # Active Alert
-        alert = dbc.Card([
-            dbc.CardHeader([
-                html.Span("CRITICAL", className="status-pill critical", style={'marginRight': '12px'}),
-                html.Span("Sustained High Stress", style={'fontWeight': '600'}),
-                html.Span(now.strftime("%H:%M:%S"), style={'float': 'right', 'color': '#888', 'fontSize': '11px'})
-            ], style={'background': 'rgba(225,87,89,0.08)', 'borderBottom': f'2px solid {COLORS["red"]}'}),
-            dbc.CardBody([
-                dbc.Row([
-                    dbc.Col([
-                        html.Div("John Doe", style={'fontWeight': '600', 'fontSize': '14px'}),
-                        html.Div("Office - Floor 3, Desk 42", style={'fontSize': '12px', 'color': '#888'}),
-                        html.Div("Employee ID: 12345", style={'fontSize': '11px', 'color': '#aaa'})
-                    ], md=3),
-                    dbc.Col([
-                        html.Table([
-                            html.Tr([html.Td("Stress Level:", style={'color': '#888', 'fontSize': '11px'}), 
-                                    html.Td("9.5/10", style={'fontWeight': '600', 'color': COLORS['red']})]),
-                            html.Tr([html.Td("Duration:", style={'color': '#888', 'fontSize': '11px'}), 
-                                    html.Td("18 min", style={'fontWeight': '600'})]),
-                            html.Tr([html.Td("Heart Rate:", style={'color': '#888', 'fontSize': '11px'}), 
-                                    html.Td("95 bpm", style={'fontWeight': '600', 'color': COLORS['orange']})]),
-                        ], style={'fontSize': '12px'})
-                    ], md=3),
-                    dbc.Col([
-                        html.Div("Emergency Contact:", style={'fontSize': '10px', 'color': '#888', 'textTransform': 'uppercase'}),
-                        html.Div("Jane Doe (Spouse)", style={'fontSize': '12px'}),
-                        html.Div("+1 555-123-4567", style={'fontSize': '12px', 'color': COLORS['blue']})
-                    ], md=3),
-                    dbc.Col([
-                        dbc.Button("Acknowledge", color="success", size="sm", className="w-100 mb-2"),
-                        dbc.Button("Contact", color="primary", size="sm", className="w-100 mb-2"),
-                        dbc.Button("Escalate", color="danger", outline=True, size="sm", className="w-100"),
-                    ], md=3)
-                ])
-            ])
-        ], style={'border': f'1px solid {COLORS["red"]}', 'marginBottom': '12px'})
+        alerts = [create_alert_card(a, now) for a in store.open_alerts()]
+        if not alerts:
+            alerts = [html.Div("No active alerts", className="text-muted", style={'fontSize': '12px'})]
         
-        # Charts
-        CLAYOUT = {'paper_bgcolor': 'white', 'plot_bgcolor': 'white', 'font': {'size': 10, 'color': '#555'}, 'margin': {'l': 30, 'r': 20, 't': 20, 'b': 30}}
+        logs = [create_log_entry(t.strftime("%H:%M:%S"), message, level) for t, message, level in reversed(store.log)]
         
+        return (*stats, alerts, str(s['active']), logs, responders)
+
+    # Alerts triggered today by hour: from the alert store's running stats
+    @app.callback(Output('alerts-timeline', 'figure'), [Input('alert-version', 'data')])
+    def update_alert_timeline(version):
+        auth.require_tab('emergency')
         hours = [f"{h}:00" for h in range(8, 20)]
         alerts = [0, 0, 1, 2, 1, 0, 1, 3, 2, 1, 0, 1]
+        store = get_alert_store()
+        if store.ready:
+            hours = [f"{h}:00" for h in range(24)]
+            alerts = store.stats()['hourly_today']
         timeline = go.Figure(go.Bar(x=hours, y=alerts, marker_color=[COLORS['red'] if a > 1 else COLORS['orange'] if a == 1 else '#ddd' for a in alerts]))
         timeline.update_layout(**CLAYOUT, yaxis={'gridcolor': '#eee'})
+        return timeline
+
+    # Alerts by type and response time trend: from the alert store's running stats
+    @app.callback(
+        [Output('alerts-type', 'figure'), Output('response-trend', 'figure')],
+        [Input('alert-version', 'data')]
+    )
+    def update_alert_stats(version):
+        auth.require_tab('emergency')
+        type_labels = ['High Stress', 'Poor Posture', 'Long Sitting', 'Other']
+        type_counts = [5, 3, 2, 2]
+        days = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+        response = [3.1, 2.8, 2.5, 2.3, 2.0, 2.2, 2.3]
+        store = get_alert_store()
+        if store.ready:
+            s = store.stats()
+            type_counts = [s['types_today'].get(t, 0) for t in type_labels[:-1]]
+            type_counts.append(sum(s['types_today'].values()) - sum(type_counts))
+            days = [temporal_profile.DAYS[d.weekday()] for d, _ in s['response_trend']]
+            response = [None if r is None else round(r, 1) for _, r in s['response_trend']]
         
-        types = go.Figure(go.Pie(values=[5, 3, 2, 2], labels=['High Stress', 'Poor Posture', 'Long Sitting', 'Other'],
+        types = go.Figure(go.Pie(values=type_counts, labels=type_labels,
                                 marker={'colors': [COLORS['red'], COLORS['orange'], COLORS['blue'], '#ddd']}, hole=0.5, textinfo='percent', textfont={'size': 9}))
         types.update_layout(**CLAYOUT, showlegend=True, legend={'font': {'size': 9}})
         
-        days = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
-        response = [3.1, 2.8, 2.5, 2.3, 2.0, 2.2, 2.3]
         resp_fig = go.Figure(go.Scatter(x=days, y=response, mode='lines+markers', line={'color': COLORS['teal'], 'width': 2}, fill='tozeroy', fillcolor='rgba(118,183,178,0.1)'))
         resp_fig.update_layout(**CLAYOUT, yaxis={'title': 'min', 'gridcolor': '#eee'})
-        
-        # Notification log
-        logs = [
-            create_log_entry(now.strftime("%H:%M:%S"), "SMS sent to emergency contact", "success"),
-            create_log_entry((now - datetime.timedelta(minutes=2)).strftime("%H:%M:%S"), "Alert triggered - High stress detected", "warning"),
-            create_log_entry((now - datetime.timedelta(minutes=5)).strftime("%H:%M:%S"), "Threshold exceeded (9.5/10)", "critical"),
-            create_log_entry((now - datetime.timedelta(hours=1)).strftime("%H:%M:%S"), "Previous alert resolved", "success"),
-        ]
-        
-        # Responder Status
-        responders = html.Div([html.Table([
-            html.Tbody([
-                html.Tr([html.Td("Dr. Smith"), html.Td(html.Span("Online", className="status-pill normal"))]),
-                html.Tr([html.Td("Nurse Johnson"), html.Td(html.Span("Online", className="status-pill normal"))]),
-                html.Tr([html.Td("HR Manager"), html.Td(html.Span("Away", className="status-pill warning"))]),
-            ])
-        ], className="data-table")])
-        
-        return (*stats, [alert], "1", timeline, types, resp_fig, logs, responders)
+        return types, resp_fig
 
 def create_stat_content(value, label, color):
     return html.Div([
@@ -213,3 +236,97 @@ def create_log_entry(time, message, level):
         html.Span(f"[{time}]", style={'color': '#999', 'marginRight': '12px', 'fontFamily': 'monospace', 'fontSize': '11px'}),
         html.Span(message, style={'fontSize': '12px'})
     ], className=f"alert-item {level}", style={'borderColor': border_colors.get(level, '#ddd')})
+
+def create_alert_card(alert, now):
+    critical = alert['severity'] == 'critical'
+    color = COLORS['red'] if critical else COLORS['orange']
+    minutes = int((now - alert['triggered_at']).total_seconds() // 60)
+    value = f"{alert['value']}/10" if alert['type'] == 'High Stress' else f"Class {alert['value']}"
+    acknowledged = alert['status'] == 'acknowledged'
+    return dbc.Card([
+        dbc.CardHeader([
+            html.Span(alert['severity'].upper(), className=f"status-pill {alert['severity']}", style={'marginRight': '12px'}),
+            html.Span(alert['type'], style={'fontWeight': '600'}),
+            html.Span(alert['triggered_at'].strftime("%H:%M:%S"), style={'float': 'right', 'color': '#888', 'fontSize': '11px'})
+        ], style={'background': 'rgba(225,87,89,0.08)' if critical else 'rgba(242,142,44,0.08)', 'borderBottom': f'2px solid {color}'}),
+        dbc.CardBody([
+            dbc.Row([
+                dbc.Col([
+                    html.Div(f"User {alert['user_id']}", style={'fontWeight': '600', 'fontSize': '14px'}),
+                    html.Div("Escalated" if alert.get('escalated') else "", style={'fontSize': '12px', 'color': COLORS['red']}),
+                ], md=4),
+                dbc.Col([
+                    html.Table([
+                        html.Tr([html.Td("Reading:", style={'color': '#888', 'fontSize': '11px'}),
+                                html.Td(value, style={'fontWeight': '600', 'color': color})]),
+                        html.Tr([html.Td("Duration:", style={'color': '#888', 'fontSize': '11px'}),
+                                html.Td(f"{minutes} min", style={'fontWeight': '600'})]),
+                        html.Tr([html.Td("Status:", style={'color': '#888', 'fontSize': '11px'}),
+                                html.Td(alert['status'].capitalize(), style={'fontWeight': '600'})]),
+                    ], style={'fontSize': '12px'})
+                ], md=5),
+                dbc.Col([
+                    dbc.Button("Acknowledge", id={'type': 'alert-ack', 'index': alert['_id']}, color="success", size="sm",
+                               className="w-100 mb-2", disabled=acknowledged),
+                    dbc.Button("Escalate", id={'type': 'alert-escalate', 'index': alert['_id']}, color="danger", outline=True,
+                               size="sm", className="w-100", disabled=bool(alert.get('escalated'))),
+                ], md=3)
+            ])
+        ])
+    ], style={'border': f'1px solid {color}', 'marginBottom': '12px'})
+
+def demo_stats():
+    return [
+        create_stat_content("54", "MONITORED", COLORS['blue']),
+        create_stat_content("1", "ACTIVE ALERTS", COLORS['red']),
+        create_stat_content("1", "CRITICAL", COLORS['red']),
+        create_stat_content("12", "RESOLVED TODAY", COLORS['green']),
+        create_stat_content("2.3m", "AVG RESPONSE", COLORS['orange']),
+        create_stat_content("99.9%", "UPTIME", COLORS['green']),
+    ]
+
+def demo_alert(now):
+    return dbc.Card([
+        dbc.CardHeader([
+            html.Span("CRITICAL", className="status-pill critical", style={'marginRight': '12px'}),
+            html.Span("Sustained High Stress", style={'fontWeight': '600'}),
+            html.Span(now.strftime("%H:%M:%S"), style={'float': 'right', 'color': '#888', 'fontSize': '11px'})
+        ], style={'background': 'rgba(225,87,89,0.08)', 'borderBottom': f'2px solid {COLORS["red"]}'}),
+        dbc.CardBody([
+            dbc.Row([
+                dbc.Col([
+                    html.Div("John Doe", style={'fontWeight': '600', 'fontSize': '14px'}),
+                    html.Div("Office - Floor 3, Desk 42", style={'fontSize': '12px', 'color': '#888'}),
+                    html.Div("Employee ID: 12345", style={'fontSize': '11px', 'color': '#aaa'})
+                ], md=3),
+                dbc.Col([
+                    html.Table([
+                        html.Tr([html.Td("Stress Level:", style={'color': '#888', 'fontSize': '11px'}), 
+                                html.Td("9.5/10", style={'fontWeight': '600', 'color': COLORS['red']})]),
+                        html.Tr([html.Td("Duration:", style={'color': '#888', 'fontSize': '11px'}), 
+                                html.Td("18 min", style={'fontWeight': '600'})]),
+                        html.Tr([html.Td("Heart Rate:", style={'color': '#888', 'fontSize': '11px'}), 
+                                html.Td("95 bpm", style={'fontWeight': '600', 'color': COLORS['orange']})]),
+                    ], style={'fontSize': '12px'})
+                ], md=3),
+                dbc.Col([
+                    html.Div("Emergency Contact:", style={'fontSize': '10px', 'color': '#888', 'textTransform': 'uppercase'}),
+                    html.Div("Jane Doe (Spouse)", style={'fontSize': '12px'}),
+                    html.Div("+1 555-123-4567", style={'fontSize': '12px', 'color': COLORS['blue']})
+                ], md=3),
+                dbc.Col([
+                    dbc.Button("Acknowledge", color="success", size="sm", className="w-100 mb-2"),
+                    dbc.Button("Contact", color="primary", size="sm", className="w-100 mb-2"),
+                    dbc.Button("Escalate", color="danger", outline=True, size="sm", className="w-100"),
+                ], md=3)
+            ])
+        ])
+    ], style={'border': f'1px solid {COLORS["red"]}', 'marginBottom': '12px'})
+
+def demo_log(now):
+    return [
+        create_log_entry(now.strftime("%H:%M:%S"), "SMS sent to emergency contact", "success"),
+        create_log_entry((now - datetime.timedelta(minutes=2)).strftime("%H:%M:%S"), "Alert triggered - High stress detected", "warning"),
+        create_log_entry((now - datetime.timedelta(minutes=5)).strftime("%H:%M:%S"), "Threshold exceeded (9.5/10)", "critical"),
+        create_log_entry((now - datetime.timedelta(hours=1)).strftime("%H:%M:%S"), "Previous alert resolved", "success"),
+    ]
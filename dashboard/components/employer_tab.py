@@ -1,12 +1,19 @@
-from dash import html, dcc
+from dash import html, dcc, callback_context
 import dash_bootstrap_components as dbc
 import plotly.graph_objects as go
 import pandas as pd
-from dash.dependencies import Input, Output
+from dash.dependencies import Input, Output, ClientsideFunction
 import numpy as np
+import auth
+import data_loader
+from refresh import refresh_input
+from downsample import time_series_trace
+import org_cube
+from alert_store import get_alert_store
 
 COLORS = {'blue': '#4e79a7', 'orange': '#f28e2c', 'red': '#e15759', 'green': '#59a14f', 'teal': '#76b7b2', 'purple': '#b07aa1'}
 LAYOUT = {'paper_bgcolor': 'white', 'plot_bgcolor': 'white', 'font': {'family': 'Helvetica Neue', 'size': 11, 'color': '#555'}, 'margin': {'l': 40, 'r': 20, 't': 30, 'b': 30}}
+RANGES = [7, 30, 90]  # Days selectable with the 7D/30D/90D buttons
 
 def render_employer_tab():
     return dbc.Container([
@@ -18,12 +25,9 @@ def render_employer_tab():
             ], lg=6),
             dbc.Col([
                 dbc.Row([
-                    dbc.Col([dcc.Dropdown(id='dept-filter', options=[
-                        {'label': 'All Departments', 'value': 'all'},
-                        {'label': 'Engineering', 'value': 'eng'},
-                        {'label': 'Sales', 'value': 'sales'},
-                        {'label': 'HR', 'value': 'hr'},
-                    ], value='all', style={'fontSize': '12px'})], width=4),
+                    dbc.Col([dcc.Dropdown(id='dept-filter', options=department_options(),
+                                          value='all', style={'fontSize': '12px'})], width=4),
+                    dcc.Store(id='emp-range', data=30),
                     dbc.Col([
                         dbc.ButtonGroup([
                             dbc.Button("7D", outline=True, color="secondary", size="sm", id="btn-7d"),
@@ -31,7 +35,10 @@ def render_employer_tab():
                             dbc.Button("90D", outline=True, color="secondary", size="sm", id="btn-90d"),
                         ])
                     ], width=4),
-                    dbc.Col([dbc.Button("Download Report", size="sm", outline=True, color="secondary")], width=4)
+                    dbc.Col([dbc.DropdownMenu([
+                        dbc.DropdownMenuItem("CSV", id='report-csv', href='', external_link=True),
+                        dbc.DropdownMenuItem("Parquet", id='report-parquet', href='', external_link=True),
+                    ], label="Download Report", size="sm", color="secondary")], width=4)
                 ])
             ], lg=6)
         ], className="mb-3 align-items-center"),
@@ -113,22 +120,54 @@ def render_employer_tab():
         ]),
     ], fluid=True)
 
+def department_options():
+    """All Departments plus every department of user_departments.csv and the cube."""
+    names = set(data_loader.load_user_departments().values()) | set(org_cube.get_org_cube().department_names())
+    return [{'label': 'All Departments', 'value': 'all'}] + [{'label': name, 'value': name} for name in sorted(names)]
+
 def create_kpi(div_id, label):
     return dbc.Card([dbc.CardBody([html.Div(id=div_id)], className="py-2")])
 
+def org_summary(dept, days):
+    """Cube aggregates for the selection, or None (no data / below k-anonymity)."""
+    return org_cube.get_org_cube().summary(dept or 'all', days or 30)
+
 def register_employer_callbacks(app):
+    # Report links (streamed by the /export route) for the selected department and range
+    app.clientside_callback(
+        ClientsideFunction(namespace='neurochair', function_name='orgExport'),
+        [Output('report-csv', 'href'), Output('report-parquet', 'href')],
+        Input('dept-filter', 'value'), Input('emp-range', 'data')
+    )
+
+    # 7D/30D/90D selection
+    @app.callback(
+        [Output('emp-range', 'data')] +
+        [Output(f'btn-{d}d', prop) for d in RANGES for prop in ('color', 'outline')],
+        [Input(f'btn-{d}d', 'n_clicks') for d in RANGES],
+        prevent_initial_call=True
+    )
+    def select_range(*clicks):
+        button_id = callback_context.triggered[0]['prop_id'].split('.')[0]
+        days = int(button_id[len('btn-'):-1])
+        styles = []
+        for d in RANGES:
+            styles += ["primary", False] if d == days else ["secondary", True]
+        return [days] + styles
+
+    # Organization KPIs and distributions: hourly aggregates
     @app.callback(
         [Output('emp-wellness', 'children'), Output('emp-stress', 'children'),
          Output('emp-posture', 'children'), Output('emp-sitting', 'children'),
          Output('emp-active', 'children'), Output('emp-alerts', 'children'),
-         Output('org-gauge', 'figure'), Output('wellness-trend', 'figure'),
-         Output('dept-chart', 'figure'), Output('hour-chart', 'figure'),
-         Output('scatter-chart', 'figure'), Output('posture-dist', 'figure'),
-         Output('dept-rankings', 'children'), Output('key-insights', 'children'),
-         Output('action-items', 'children')],
-        [Input('interval-component', 'n_intervals')]
+         Output('org-gauge', 'figure'), Output('scatter-chart', 'figure'),
+         Output('posture-dist', 'figure')],
+        [refresh_input('hourly'), Input('dept-filter', 'value'), Input('emp-range', 'data')]
     )
-    def update(n):
+    def update(n, dept, days):
+        auth.require_tab('employer')
+        summary = org_summary(dept, days)
+        
         # KPIs
         kpis = [
             create_kpi_content("78", "/100", "WELLNESS SCORE", "+5%", COLORS['blue']),
@@ -138,27 +177,79 @@ def register_employer_callbacks(app):
             create_kpi_content("54", "/60", "ACTIVE USERS", "", COLORS['purple']),
             create_kpi_content("3", "", "ALERTS TODAY", "-2", COLORS['red']),
         ]
+        org_stress = 5.2
+        if summary and summary['stress'] is not None:
+            org_stress = round(summary['stress'], 1)
+            kpis[:5] = [
+                create_kpi_content(str(int(round(summary['wellness']))), "/100", "WELLNESS SCORE", "", COLORS['blue']),
+                create_kpi_content(str(org_stress), "/10", "AVG STRESS", "", COLORS['teal']),
+                create_kpi_content(str(int(round(summary['good_posture_pct'] or 0))), "%", "GOOD POSTURE", "", COLORS['green']),
+                create_kpi_content(f"{summary['avg_sitting_hours']:.1f}", "h", "AVG SITTING", "", COLORS['orange']),
+                create_kpi_content(str(summary['active_users']), "", "ACTIVE USERS", "", COLORS['purple']),
+            ]
+        store = get_alert_store()
+        if store.ready:
+            # Organization-wide, like the Alerts tab
+            kpis[5] = create_kpi_content(str(store.stats()['triggered_today']), "", "ALERTS TODAY", "", COLORS['red'])
         
         # Gauge
-        gauge = go.Figure(go.Indicator(mode="gauge+number", value=5.2, number={'suffix': '/10', 'font': {'size': 28}},
+        gauge = go.Figure(go.Indicator(mode="gauge+number", value=org_stress, number={'suffix': '/10', 'font': {'size': 28}},
             gauge={'axis': {'range': [0, 10]}, 'bar': {'color': COLORS['orange'], 'thickness': 0.6}, 'bgcolor': '#f5f5f5',
                    'steps': [{'range': [0, 3], 'color': 'rgba(89,161,79,0.15)'}, {'range': [3, 7], 'color': 'rgba(242,142,44,0.15)'}, {'range': [7, 10], 'color': 'rgba(225,87,89,0.15)'}]}))
         gauge.update_layout(**LAYOUT)
         
+        # Scatter
+        sitting = np.random.uniform(3, 8, 50)
+        posture = 95 - sitting * 5 + np.random.normal(0, 8, 50)
+        scatter = go.Figure(go.Scatter(x=sitting, y=posture, mode='markers',
+            marker={'color': sitting, 'colorscale': [[0, COLORS['green']], [0.5, COLORS['orange']], [1, COLORS['red']]], 'size': 7}))
+        scatter.update_layout(**LAYOUT, xaxis={'title': 'Sitting (hrs)', 'gridcolor': '#eee'}, yaxis={'title': 'Posture %', 'gridcolor': '#eee'})
+        
+        # Posture Distribution
+        categories = ['Excellent', 'Good', 'Fair', 'Poor']
+        values = [15, 35, 30, 20]
+        if summary and sum(summary['posture_counts']):
+            values = summary['posture_counts']
+        dist_colors = [COLORS['green'], COLORS['blue'], COLORS['orange'], COLORS['red']]
+        dist = go.Figure(go.Pie(values=values, labels=categories, marker={'colors': dist_colors}, hole=0.5, textinfo='percent', textfont={'size': 10}))
+        dist.update_layout(**LAYOUT, showlegend=True, legend={'font': {'size': 9}})
+        
+        return (*kpis, gauge, scatter, dist)
+
+    # Trends, department comparison and insights: daily charts
+    @app.callback(
+        [Output('wellness-trend', 'figure'), Output('dept-chart', 'figure'),
+         Output('hour-chart', 'figure'), Output('dept-rankings', 'children'),
+         Output('key-insights', 'children'), Output('action-items', 'children')],
+        [refresh_input('daily'), Input('dept-filter', 'value'), Input('emp-range', 'data')]
+    )
+    def update_trends(n, dept, days):
+        auth.require_tab('employer')
+        summary = org_summary(dept, days)
+        dept_scores = org_cube.get_org_cube().department_scores(days or 30)
+        
         # Wellness Trend
-        dates = pd.date_range(end=pd.Timestamp.now(), periods=30)
-        wellness = np.linspace(70, 78, 30) + np.random.normal(0, 2, 30)
-        stress = np.linspace(6, 5.2, 30) + np.random.normal(0, 0.5, 30)
+        if summary:
+            dates = pd.to_datetime(summary['daily_dates'])
+            wellness, stress = summary['daily_wellness'], summary['daily_stress']
+        else:
+            dates = pd.date_range(end=pd.Timestamp.now(), periods=30)
+            wellness = np.linspace(70, 78, 30) + np.random.normal(0, 2, 30)
+            stress = np.linspace(6, 5.2, 30) + np.random.normal(0, 0.5, 30)
         
         trend = go.Figure()
-        trend.add_trace(go.Scatter(x=dates, y=wellness, name='Wellness', fill='tozeroy', line={'color': COLORS['blue'], 'width': 2}, fillcolor='rgba(78,121,167,0.1)'))
-        trend.add_trace(go.Scatter(x=dates, y=stress*10, name='Stress (x10)', line={'color': COLORS['red'], 'width': 2, 'dash': 'dot'}))
+        trend.add_trace(time_series_trace(dates, wellness, name='Wellness', fill='tozeroy', line={'color': COLORS['blue'], 'width': 2}, fillcolor='rgba(78,121,167,0.1)'))
+        trend.add_trace(time_series_trace(dates, stress*10, name='Stress (x10)', line={'color': COLORS['red'], 'width': 2, 'dash': 'dot'}))
         trend.update_layout(**LAYOUT, showlegend=True, legend={'orientation': 'h', 'y': 1.15, 'font': {'size': 9}}, yaxis={'range': [0, 100], 'gridcolor': '#eee'}, xaxis={'gridcolor': '#eee'})
         
         # Department Chart
         depts = ['Engineering', 'Sales', 'HR', 'Marketing', 'Finance']
         scores = [72, 65, 85, 78, 70]
-        dept_colors = [COLORS['blue'], COLORS['orange'], COLORS['green'], COLORS['teal'], COLORS['purple']]
+        if dept_scores:
+            depts = list(dept_scores)
+            scores = [int(round(v)) for v in dept_scores.values()]
+        palette = [COLORS['blue'], COLORS['orange'], COLORS['green'], COLORS['teal'], COLORS['purple']]
+        dept_colors = [palette[i % len(palette)] for i in range(len(depts))]
         
         dept = go.Figure(go.Bar(x=depts, y=scores, marker_color=dept_colors, text=[f'{s}%' for s in scores], textposition='outside', textfont={'size': 10}))
         dept.add_hline(y=75, line_dash="dash", line_color=COLORS['green'], annotation_text="Goal", annotation_font_size=9)
@@ -167,34 +258,33 @@ def register_employer_callbacks(app):
         # Hour Chart
         hours = [f"{h}:00" for h in range(9, 18)]
         hour_stress = [3.2, 4.1, 5.2, 6.1, 5.8, 4.2, 3.5, 4.8, 5.9]
-        colors = [COLORS['green'] if s < 4 else COLORS['orange'] if s < 6 else COLORS['red'] for s in hour_stress]
+        if summary:
+            # Hour-of-day means from the cube's hourly stress sums (no sample scan)
+            hour_stress = [None if np.isnan(v) else round(float(v), 1) for v in summary['hourly_stress'][9:18]]
+        colors = [COLORS['green'] if s is not None and s < 4 else COLORS['orange'] if s is not None and s < 6 else COLORS['red'] for s in hour_stress]
         hour = go.Figure(go.Bar(x=hours, y=hour_stress, marker_color=colors))
         hour.update_layout(**LAYOUT, yaxis={'range': [0, 8], 'gridcolor': '#eee'})
         
-        # Scatter
-        sitting = np.random.uniform(3, 8, 50)
-        posture = 95 - sitting * 5 + np.random.normal(0, 8, 50)
-        scatter = go.Figure(go.Scatter(x=sitting, y=posture, mode='markers',
-            marker={'color': sitting, 'colorscale': [[0, COLORS['green']], [0.5, COLORS['orange']], [1, COLORS['red']]], 'size': 7}))
-        scatter.update_layout(**LAYOUT, xaxis={'title': 'Sitting (hrs)', 'gridcolor': '#eee'}, yaxis={'title': 'Posture %', 'gridcolor': '#eee'})
-        
-        # Posture Distribution
-        categories = ['Excellent', 'Good', 'Fair', 'Poor']
-        values = [15, 35, 30, 20]
-        dist_colors = [COLORS['green'], COLORS['blue'], COLORS['orange'], COLORS['red']]
-        dist = go.Figure(go.Pie(values=values, labels=categories, marker={'colors': dist_colors}, hole=0.5, textinfo='percent', textfont={'size': 10}))
-        dist.update_layout(**LAYOUT, showlegend=True, legend={'font': {'size': 9}})
-        
         # Rankings
-        rankings = html.Div([html.Table([
-            html.Tbody([
-                html.Tr([html.Td("1"), html.Td("HR"), html.Td("85%", style={'color': COLORS['green'], 'fontWeight': '600'}), html.Td("▲", style={'color': COLORS['green']})]),
-                html.Tr([html.Td("2"), html.Td("Marketing"), html.Td("78%", style={'color': COLORS['blue']})]),
-                html.Tr([html.Td("3"), html.Td("Engineering"), html.Td("72%", style={'color': COLORS['blue']})]),
-                html.Tr([html.Td("4"), html.Td("Finance"), html.Td("70%", style={'color': COLORS['orange']})]),
-                html.Tr([html.Td("5"), html.Td("Sales"), html.Td("65%", style={'color': COLORS['orange']}), html.Td("▼", style={'color': COLORS['red']})]),
-            ])
-        ], className="data-table")])
+        if dept_scores:
+            ranked = sorted(dept_scores.items(), key=lambda item: item[1], reverse=True)
+            rankings = html.Div([html.Table([
+                html.Tbody([
+                    html.Tr([html.Td(str(i + 1)), html.Td(name),
+                             html.Td(f"{int(round(score))}%", style={'color': COLORS['green'] if score >= 75 else COLORS['blue'] if score >= 70 else COLORS['orange']})])
+                    for i, (name, score) in enumerate(ranked)
+                ])
+            ], className="data-table")])
+        else:
+            rankings = html.Div([html.Table([
+                html.Tbody([
+                    html.Tr([html.Td("1"), html.Td("HR"), html.Td("85%", style={'color': COLORS['green'], 'fontWeight': '600'}), html.Td("▲", style={'color': COLORS['green']})]),
+                    html.Tr([html.Td("2"), html.Td("Marketing"), html.Td("78%", style={'color': COLORS['blue']})]),
+                    html.Tr([html.Td("3"), html.Td("Engineering"), html.Td("72%", style={'color': COLORS['blue']})]),
+                    html.Tr([html.Td("4"), html.Td("Finance"), html.Td("70%", style={'color': COLORS['orange']})]),
+                    html.Tr([html.Td("5"), html.Td("Sales"), html.Td("65%", style={'color': COLORS['orange']}), html.Td("▼", style={'color': COLORS['red']})]),
+                ])
+            ], className="data-table")])
         
         # Insights
         insights = html.Div([
@@ -211,7 +301,7 @@ def register_employer_callbacks(app):
             html.Div([html.Strong("Completed"), html.Br(), "Standing desk pilot program launched"], className="alert-item success"),
         ])
         
-        return (*kpis, gauge, trend, dept, hour, scatter, dist, rankings, insights, actions)
+        return (trend, dept, hour, rankings, insights, actions)
 
 def create_kpi_content(value, suffix, label, change, color):
     return html.Div([
@@ -2,9 +2,12 @@ from dash import html, dcc
 import dash_bootstrap_components as dbc
 import plotly.graph_objects as go
 import pandas as pd
-from dash.dependencies import Input, Output
+from dash.dependencies import Input, Output, State, ClientsideFunction
 import numpy as np
+import active_users
 import data_loader
+import temporal_profile
+from refresh import refresh_input, LIVE_STORE_ID
 
 # Tableau Colors
 COLORS = {
@@ -12,6 +15,24 @@ COLORS = {
     'green': '#59a14f', 'teal': '#76b7b2', 'purple': '#b07aa1', 'gray': '#79706e'
 }
 
+# Daily goals; percentages are computed clientside from the user-metrics store
+GOALS = [
+    {"name": "Stress below 5", "metric": "stress", "target": 5, "color": COLORS['red']},
+    {"name": "Posture above 70%", "metric": "posture", "target": 70, "color": COLORS['blue']},
+    {"name": "Sitting under 6h", "metric": "sitting", "target": 6, "color": COLORS['orange']},
+    {"name": "Take 4+ breaks", "metric": "breaks", "target": 4, "color": COLORS['green']},
+]
+
+KPIS = [
+    ("stress-kpi", "CURRENT STRESS", "Avg from history"),
+    ("posture-kpi", "POSTURE SCORE", "Based on usage"),
+    ("sitting-kpi", "SITTING TIME", "Today"),
+    ("breaks-kpi", "BREAKS TAKEN", "Target: 4+"),
+]
+
+# Activity timeline: hours with at least this many sitting minutes show as sitting
+SITTING_HOUR_MINUTES = 45
+
 LAYOUT = {
     'paper_bgcolor': 'white', 'plot_bgcolor': 'white',
     'font': {'family': 'Helvetica Neue, Arial', 'size': 11, 'color': '#555'},
@@ -20,12 +41,14 @@ LAYOUT = {
 
 def render_end_user_tab():
     return dbc.Container([
+        # Raw metrics from the server; KPIs, gauge and goals are styled clientside
+        dcc.Store(id='user-metrics'),
+        dcc.Store(id='goals-config', data=GOALS),
+        
         # Row 1: Key Metrics (4 KPIs)
         dbc.Row([
-            dbc.Col([create_kpi_card("stress-kpi", "CURRENT STRESS")], lg=3, md=6, className="mb-3"),
-            dbc.Col([create_kpi_card("posture-kpi", "POSTURE SCORE")], lg=3, md=6, className="mb-3"),
-            dbc.Col([create_kpi_card("sitting-kpi", "SITTING TIME")], lg=3, md=6, className="mb-3"),
-            dbc.Col([create_kpi_card("breaks-kpi", "BREAKS TAKEN")], lg=3, md=6, className="mb-3"),
+            dbc.Col([create_kpi_card(div_id, label, trend)], lg=3, md=6, className="mb-3")
+            for div_id, label, trend in KPIS
         ]),
         
         # Row 2: Main Charts
@@ -34,7 +57,7 @@ def render_end_user_tab():
             dbc.Col([
                 dbc.Card([
                     dbc.CardHeader("STRESS LEVEL"),
-                    dbc.CardBody([dcc.Graph(id='stress-gauge', style={'height': '180px'}, config={'displayModeBar': False})])
+                    dbc.CardBody([dcc.Graph(id='stress-gauge', figure=create_gauge(0), style={'height': '180px'}, config={'displayModeBar': False})])
                 ], className="mb-3"),
                 dbc.Card([
                     dbc.CardHeader("HEART RATE VARIABILITY"),
@@ -95,7 +118,7 @@ def render_end_user_tab():
             dbc.Col([
                 dbc.Card([
                     dbc.CardHeader("DAILY GOALS PROGRESS"),
-                    dbc.CardBody([html.Div(id='goals-progress')])
+                    dbc.CardBody([create_goals_progress()])
                 ])
             ], lg=4, className="mb-3"),
             
@@ -109,55 +132,74 @@ def render_end_user_tab():
         ]),
     ], fluid=True)
 
-def create_kpi_card(div_id, label):
+def create_kpi_card(div_id, label, trend):
     return dbc.Card([
         dbc.CardBody([
-            html.Div(id=div_id, className="kpi-metric")
+            html.Div([
+                html.Div([
+                    html.Div(id=f"{div_id}-value", style={'fontSize': '32px', 'fontWeight': '300', 'color': COLORS['blue']}),
+                    html.Div(label, style={'fontSize': '10px', 'color': '#888', 'textTransform': 'uppercase', 'letterSpacing': '0.5px'}),
+                    html.Div(trend, style={'fontSize': '11px', 'color': '#999', 'marginTop': '4px'})
+                ], className="text-center")
+            ], id=div_id, className="kpi-metric")
         ])
     ])
 
+# Profiles drawn by the weekly chart (window days, metric)
+WEEKLY_PROFILES = [(7, 'stress_level'), (7, 'posture_score')]
+
+# Figure dicts built once per process by create_*_chart; see _from_template
+_FIGURE_TEMPLATES = {}
+
+def _from_template(create, series, data):
+    """
+    create(data) as a figure dict. Only the trace's x/y depend on the data, so
+    they are set on a copy of a figure built once, which skips plotly's
+    validation of every property on each tick.
+    """
+    template = _FIGURE_TEMPLATES.get(create)
+    if template is None:
+        template = _FIGURE_TEMPLATES[create] = create([{}]).to_plotly_json()
+    if not data:
+        return dict(template, data=[])
+    x, y = series(data)
+    return dict(template, data=[dict(template['data'][0], x=x, y=y)])
+
 def register_end_user_callbacks(app):
+    # Database-backed entries of the tab, kept warm for users with an active session.
+    # Stats and history (STATS_TTL) are cheap to compute from the shared features
+    # table; refreshing them ahead would cost more than it saves.
+    for loader in (data_loader.get_sitting_summary, data_loader.get_hourly_activity, data_loader.get_daily_sitting):
+        active_users.register_warmer(loader.warm)
+    for days, metric in WEEKLY_PROFILES:
+        active_users.register_warmer(temporal_profile.warm_user_profile, days, metric)
+
+    # Live vitals: refreshed every live tick (slower while /stream is connected,
+    # see app.py). Only raw numbers go to the client.
     @app.callback(
-        [Output('stress-kpi', 'children'), Output('posture-kpi', 'children'),
-         Output('sitting-kpi', 'children'), Output('breaks-kpi', 'children'),
-         Output('stress-gauge', 'figure'), Output('hrv-chart', 'figure'),
-         Output('weekly-chart', 'figure'), Output('activity-timeline', 'figure'),
-         Output('posture-pie', 'figure'), Output('gsr-chart', 'figure'),
-         Output('notifications-list', 'children'), Output('goals-progress', 'children'),
+        [Output('user-metrics', 'data'), Output('hrv-chart', 'figure'),
+         Output('gsr-chart', 'figure'),
+         Output('notifications-list', 'children'),
          Output('recommendations-list', 'children'), Output('alert-count', 'children')],
-        [Input('interval-component', 'n_intervals')]
+        [refresh_input('live')]
     )
     def update_dashboard(n):
-        # Fetch actual data from Data Loader (U01)
-        stats = data_loader.get_user_stats("U01")
-        history = data_loader.get_recent_history("U01")
+        # Fetch actual data from Data Loader for the logged-in user (signed session)
+        user = active_users.session_user()
+        stats = data_loader.get_user_stats(user)
+        history = data_loader.get_recent_history(user)
         
         stress = stats['stress_avg']
         posture = stats['posture_avg']
         sitting = stats['sitting_hours']
         breaks = stats['breaks']
         
-        # KPIs With Data from CSV
-        stress_kpi = create_kpi_content(f"{stress}/10", "CURRENT STRESS", 
-                                        "danger" if stress > 7 else "warning" if stress > 4 else "success",
-                                        "Avg from history")
-        posture_kpi = create_kpi_content(f"{posture}%", "POSTURE SCORE",
-                                         "success" if posture >= 80 else "warning" if posture >= 50 else "danger",
-                                         "Based on usage")
-        sitting_kpi = create_kpi_content(f"{sitting}h", "SITTING TIME",
-                                         "warning" if sitting > 4 else "success",
-                                         f"Today")
-        breaks_kpi = create_kpi_content(str(breaks), "BREAKS TAKEN",
-                                        "success" if breaks >= 4 else "warning",
-                                        f"Target: 4+")
+        metrics = {'stress_avg': stress, 'posture_avg': posture,
+                   'sitting_hours': sitting, 'breaks': breaks}
         
         # Charts using History Data
-        stress_gauge = create_gauge(stress)
-        hrv_fig = create_hrv_chart(history)
-        weekly_fig = create_weekly_chart(history)
-        activity_fig = create_activity_timeline()
-        posture_pie = create_posture_pie(posture)
-        gsr_fig = create_gsr_chart(history)
+        hrv_fig = _from_template(create_hrv_chart, _hrv_series, history)
+        gsr_fig = _from_template(create_gsr_chart, _gsr_series, history)
         
         # Notifications
         alerts = []
@@ -172,23 +214,65 @@ def register_end_user_callbacks(app):
         if not alerts:
             alerts.append(create_alert("Status Normal", "Your metrics are within healthy ranges", "success"))
         
-        # Goals
-        goals = create_goals_progress(stress, posture, sitting, breaks)
-        
         # Recommendations
         recs = create_recommendations(stress, posture, sitting)
         
-        return (stress_kpi, posture_kpi, sitting_kpi, breaks_kpi,
-                stress_gauge, hrv_fig, weekly_fig, activity_fig, posture_pie, gsr_fig,
-                alerts, goals, recs, str(alert_count))
+        return (metrics, hrv_fig, gsr_fig,
+                alerts, recs, str(alert_count))
 
-def create_kpi_content(value, label, status, trend):
-    color_map = {'success': COLORS['green'], 'warning': COLORS['orange'], 'danger': COLORS['red']}
-    return html.Div([
-        html.Div(value, style={'fontSize': '32px', 'fontWeight': '300', 'color': color_map.get(status, COLORS['blue'])}),
-        html.Div(label, style={'fontSize': '10px', 'color': '#888', 'textTransform': 'uppercase', 'letterSpacing': '0.5px'}),
-        html.Div(trend, style={'fontSize': '11px', 'color': '#999', 'marginTop': '4px'})
-    ], className="text-center")
+    # Samples pushed over /stream go straight into the charts, without a round trip
+    app.clientside_callback(
+        ClientsideFunction(namespace='neurochair', function_name='liveSample'),
+        [Output('hrv-chart', 'figure', allow_duplicate=True), Output('gsr-chart', 'figure', allow_duplicate=True)],
+        Input(LIVE_STORE_ID, 'data'), State('hrv-chart', 'figure'), State('gsr-chart', 'figure'),
+        prevent_initial_call=True
+    )
+
+    # KPI values and threshold colors
+    kpi_outputs = []
+    for div_id, _, _ in KPIS:
+        kpi_outputs += [Output(f"{div_id}-value", 'children'), Output(f"{div_id}-value", 'style')]
+    app.clientside_callback(
+        ClientsideFunction(namespace='neurochair', function_name='kpis'),
+        kpi_outputs,
+        Input('user-metrics', 'data')
+    )
+
+    # Stress gauge value and bar color
+    app.clientside_callback(
+        ClientsideFunction(namespace='neurochair', function_name='gauge'),
+        Output('stress-gauge', 'figure'),
+        Input('user-metrics', 'data'), State('stress-gauge', 'figure')
+    )
+
+    # Goal percentages and progress bars
+    app.clientside_callback(
+        ClientsideFunction(namespace='neurochair', function_name='goals'),
+        [Output(f"goal-{i}-pct", 'children') for i in range(len(GOALS))] +
+        [Output(f"goal-{i}-pct", 'style') for i in range(len(GOALS))] +
+        [Output(f"goal-{i}-bar", 'value') for i in range(len(GOALS))] +
+        [Output(f"goal-{i}-bar", 'color') for i in range(len(GOALS))],
+        Input('user-metrics', 'data'), State('goals-config', 'data')
+    )
+
+    # Hourly aggregates: activity and posture distribution
+    @app.callback(
+        [Output('activity-timeline', 'figure'), Output('posture-pie', 'figure')],
+        [refresh_input('hourly')]
+    )
+    def update_hourly(n):
+        user = active_users.session_user()
+        stats = data_loader.get_user_stats(user)
+        return create_activity_timeline(data_loader.get_hourly_activity(user)), create_posture_pie(stats['posture_avg'])
+
+    # Daily/weekly charts
+    @app.callback(Output('weekly-chart', 'figure'), [refresh_input('daily')])
+    def update_weekly(n):
+        user = active_users.session_user()
+        history = data_loader.get_recent_history(user)
+        stress_profile, posture_profile = [temporal_profile.get_profile(('user', user), days, metric)
+                                           for days, metric in WEEKLY_PROFILES]
+        return create_weekly_chart(history, stress_profile, posture_profile, data_loader.get_daily_sitting(user))
 
 def create_gauge(value):
     color = COLORS['green'] if value <= 3 else COLORS['orange'] if value <= 6 else COLORS['red']
@@ -201,26 +285,37 @@ def create_gauge(value):
     fig.update_layout(**LAYOUT)
     return fig
 
+def _hrv_series(data):
+    return [f"-{i*5}m" for i in range(len(data))], [d.get('hrv', 70) for d in data]
+
 def create_hrv_chart(data):
     fig = go.Figure()
     if data:
-        times = [f"-{i*5}m" for i in range(len(data))]
-        hrvs = [d.get('hrv', 70) for d in data]
+        times, hrvs = _hrv_series(data)
         fig.add_trace(go.Scatter(x=times, y=hrvs, mode='lines+markers', line={'color': COLORS['teal'], 'width': 2}, marker={'size': 5}, fill='tozeroy', fillcolor='rgba(118,183,178,0.1)'))
     fig.update_layout(**LAYOUT, yaxis={'range': [50, 100], 'gridcolor': '#eee'}, xaxis={'gridcolor': '#eee'}, showlegend=False)
     return fig
 
-def create_weekly_chart(history):
-    days = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+def create_weekly_chart(history, stress_profile=None, posture_profile=None, daily_sitting=None):
+    days = temporal_profile.DAYS
     stress = [4, 5, 6, 4, 7, 3, 5]
     posture = [75, 70, 65, 80, 60, 85, 72]
     
-    if len(history) >= 7:
+    if stress_profile is not None and posture_profile is not None:
+        # Day-of-week means over the last 7 days
+        stress = [None if np.isnan(v) else round(float(v), 1) for v in temporal_profile.by_day_of_week(stress_profile)]
+        posture = [None if np.isnan(v) else round(float(v)) for v in temporal_profile.by_day_of_week(posture_profile)]
+    elif len(history) >= 7:
         mock_days = history[-7:]
         stress = [d['stress_level'] for d in mock_days]
         posture = [d['posture_score'] for d in mock_days]
 
     sitting = [5, 6, 7, 4, 8, 3, 5]
+    if daily_sitting is not None:
+        # Sitting hours of the last 7 days (sessions.py intervals), by day of week
+        sitting = [None] * 7
+        for date, hours in zip(*daily_sitting):
+            sitting[date.weekday()] = round(hours, 1)
     
     fig = go.Figure()
     fig.add_trace(go.Bar(x=days, y=posture, name='Posture %', marker_color=COLORS['blue'], opacity=0.7, yaxis='y2'))
@@ -233,12 +328,21 @@ def create_weekly_chart(history):
                      xaxis={'gridcolor': '#eee'}, bargap=0.4)
     return fig
 
-def create_activity_timeline():
+def create_activity_timeline(hourly=None):
     hours = list(range(9, 18))
     activity = [1, 2, 2, 3, 1, 2, 1, 2, 3]  # 1=sitting, 2=active, 3=break
+    text = None
+    if hourly is not None:
+        # Today's intervals: an hour with a break is a break, 45+ sitting minutes is sitting
+        sitting, breaks = hourly
+        used = [h for h in range(24) if sitting[h] > 0 or breaks[h] > 0]
+        hours = list(range(min([9] + used), max([17] + used) + 1))
+        activity = [3 if breaks[h] else 1 if sitting[h] >= SITTING_HOUR_MINUTES else 2 for h in hours]
+        text = [f"{sitting[h]:.0f} min sitting, {breaks[h]} break(s)" for h in hours]
     colors = [COLORS['orange'] if a == 1 else COLORS['green'] if a == 2 else COLORS['teal'] for a in activity]
     
-    fig = go.Figure(go.Bar(x=[f"{h}:00" for h in hours], y=[1]*len(hours), marker_color=colors, showlegend=False))
+    fig = go.Figure(go.Bar(x=[f"{h}:00" for h in hours], y=[1]*len(hours), marker_color=colors, showlegend=False,
+                           hovertext=text))
     fig.update_layout(**LAYOUT, yaxis={'visible': False}, xaxis={'gridcolor': '#eee'}, bargap=0.1)
     return fig
 
@@ -251,11 +355,13 @@ def create_posture_pie(current_posture):
     fig.update_layout(**LAYOUT, showlegend=True, legend={'font': {'size': 9}, 'orientation': 'h', 'y': -0.1})
     return fig
 
+def _gsr_series(data):
+    return [f"-{i}m" for i in range(len(data))], [d.get('gsr', 1.5) for d in data]
+
 def create_gsr_chart(data):
     fig = go.Figure()
     if data:
-        times = [f"-{i}m" for i in range(len(data))]
-        gsrs = [d.get('gsr', 1.5) for d in data]
+        times, gsrs = _gsr_series(data)
         fig.add_trace(go.Scatter(x=times, y=gsrs, mode='lines', line={'color': COLORS['purple'], 'width': 2}, fill='tozeroy', fillcolor='rgba(176,122,161,0.1)'))
     fig.update_layout(**LAYOUT, yaxis={'range': [0, 3], 'gridcolor': '#eee'}, xaxis={'gridcolor': '#eee'}, showlegend=False)
     return fig
@@ -266,25 +372,18 @@ def create_alert(title, desc, level):
         html.Div(desc, className="alert-desc")
     ], className=f"alert-item {level}")
 
-def create_goals_progress(stress, posture, sitting, breaks):
-    goals = [
-        {"name": "Stress below 5", "current": max(0, 10 - stress), "target": 5, "color": COLORS['red']},
-        {"name": "Posture above 70%", "current": posture, "target": 70, "color": COLORS['blue']},
-        {"name": "Sitting under 6h", "current": max(0, 6 - sitting), "target": 6, "color": COLORS['orange']},
-        {"name": "Take 4+ breaks", "current": breaks, "target": 4, "color": COLORS['green']},
-    ]
-    
+def create_goals_progress():
+    """Static goal rows; percentages and bar values are filled in clientside."""
     return html.Div([
         html.Div([
             html.Div([
                 html.Span(g["name"], style={'fontSize': '11px', 'color': '#555'}),
-                html.Span(f"{min(100, int((g['current']/g['target'])*100) if g['target'] > 0 else 0)}%", 
-                         style={'fontSize': '11px', 'color': g['color'], 'float': 'right'})
+                html.Span(id=f"goal-{i}-pct", style={'fontSize': '11px', 'color': g['color'], 'float': 'right'})
             ]),
-            dbc.Progress(value=min(100, (g['current']/g['target'])*100 if g['target'] > 0 else 0), color="primary" if g['current'] >= g['target'] else "secondary",
+            dbc.Progress(id=f"goal-{i}-bar", value=0, color="secondary",
                         style={'height': '4px', 'marginTop': '4px', 'marginBottom': '12px'})
-        ]) for g in goals
-    ])
+        ]) for i, g in enumerate(GOALS)
+    ], id='goals-progress')
 
 def create_recommendations(stress, posture, sitting):
     recs = []
@@ -2,14 +2,22 @@ from dash import html, dcc
 import dash_bootstrap_components as dbc
 import plotly.graph_objects as go
 import pandas as pd
-from dash.dependencies import Input, Output
+from dash.dependencies import Input, Output, ClientsideFunction
 import datetime
 import numpy as np
+import auth
+import data_loader
+from refresh import refresh_input
+from downsample import time_series_trace
+import temporal_profile
+import pressure_map
+import clinical_summary
 
 COLORS = {'blue': '#4e79a7', 'orange': '#f28e2c', 'red': '#e15759', 'green': '#59a14f', 'teal': '#76b7b2', 'purple': '#b07aa1'}
 LAYOUT = {'paper_bgcolor': 'white', 'plot_bgcolor': 'white', 'font': {'family': 'Helvetica Neue', 'size': 11, 'color': '#555'}, 'margin': {'l': 40, 'r': 20, 't': 30, 'b': 30}}
 
 def render_therapist_tab():
+    patients = patient_options()
     return dbc.Container([
         # Header Row
         dbc.Row([
@@ -19,14 +27,15 @@ def render_therapist_tab():
             ], lg=5),
             dbc.Col([
                 dbc.Row([
-                    dbc.Col([dcc.Dropdown(id='patient-selector', options=[
-                        {'label': 'John Doe (ID: 123)', 'value': '123'},
-                        {'label': 'Jane Smith (ID: 456)', 'value': '456'},
-                        {'label': 'Mike Wilson (ID: 789)', 'value': '789'},
-                    ], value='123', style={'fontSize': '12px'})], width=5),
+                    dbc.Col([dcc.Dropdown(id='patient-selector', options=patients,
+                                          value=patients[0]['value'] if patients else None,
+                                          style={'fontSize': '12px'})], width=5),
                     dbc.Col([dcc.DatePickerRange(id='date-range', start_date=datetime.date.today() - datetime.timedelta(days=30),
                                                  end_date=datetime.date.today(), style={'fontSize': '11px'})], width=5),
-                    dbc.Col([dbc.Button("Export", size="sm", outline=True, color="secondary")], width=2)
+                    dbc.Col([dbc.DropdownMenu([
+                        dbc.DropdownMenuItem("CSV", id='export-csv', href='', external_link=True),
+                        dbc.DropdownMenuItem("Parquet", id='export-parquet', href='', external_link=True),
+                    ], label="Export", size="sm", color="secondary")], width=2)
                 ])
             ], lg=7)
         ], className="mb-3 align-items-center"),
@@ -97,6 +106,12 @@ def render_therapist_tab():
         ])
     ], fluid=True)
 
+def patient_options():
+    """Every user of the datasets whose samples the session account may read."""
+    account = auth.current_user()
+    users = [u for u in sorted(data_loader.known_users()) if auth.can_view_patient(account, u)]
+    return [{'label': f"Patient {u}", 'value': u} for u in users]
+
 def create_summary_card(div_id, label, color):
     return dbc.Card([
         dbc.CardBody([
@@ -106,17 +121,28 @@ def create_summary_card(div_id, label, color):
     ])
 
 def register_therapist_callbacks(app):
+    # Export links (streamed by the /export route) for the selected patient and range
+    app.clientside_callback(
+        ClientsideFunction(namespace='neurochair', function_name='patientExport'),
+        [Output('export-csv', 'href'), Output('export-parquet', 'href')],
+        Input('patient-selector', 'value'), Input('date-range', 'start_date'), Input('date-range', 'end_date')
+    )
+
+    # Patient summary, sessions and events: hourly aggregates
     @app.callback(
         [Output('patient-stress-avg', 'children'), Output('patient-posture-avg', 'children'),
          Output('patient-sessions', 'children'), Output('patient-improvement', 'children'),
          Output('patient-compliance', 'children'), Output('patient-risk', 'children'),
-         Output('session-list', 'children'), Output('stress-trend', 'figure'),
-         Output('posture-trend', 'figure'), Output('heatmap', 'figure'),
-         Output('stress-hour', 'figure'), Output('events-table', 'children'),
-         Output('treatment-plan', 'children')],
-        [Input('patient-selector', 'value'), Input('interval-component', 'n_intervals')]
+         Output('session-list', 'children'), Output('events-table', 'children')],
+        [Input('patient-selector', 'value'), Input('date-range', 'start_date'), Input('date-range', 'end_date'),
+         refresh_input('hourly')]
     )
-    def update(patient, n):
+    def update_summary(patient, start_date, end_date, n):
+        auth.require_tab('therapist')
+        summary = get_summary(patient, start_date, end_date)
+        if summary is not None:
+            return summary_content(summary)
+        
         # Summary metrics
         stress_avg, posture_avg, sessions = "5.2", "68%", "12"
         improvement, compliance, risk = "+15%", "82%", "Medium"
@@ -131,43 +157,48 @@ def register_therapist_callbacks(app):
             ])
         ], className=f"timeline-item{' active' if i==0 else ''}") for i in range(12)]
         
+        # Events
+        events = html.Div([html.Table([
+            html.Thead([html.Tr([html.Th("Date"), html.Th("Event"), html.Th("Duration"), html.Th("")])]),
+            html.Tbody([
+                html.Tr([html.Td("Dec 04"), html.Td("High Stress"), html.Td("45m"), html.Td(html.Span("Critical", className="status-pill critical"))]),
+                html.Tr([html.Td("Dec 02"), html.Td("Long Sitting"), html.Td("5h"), html.Td(html.Span("Warning", className="status-pill warning"))]),
+                html.Tr([html.Td("Nov 28"), html.Td("Poor Posture"), html.Td("2h"), html.Td(html.Span("Warning", className="status-pill warning"))]),
+            ])
+        ], className="data-table")])
+        
+        return (stress_avg, posture_avg, sessions, improvement, compliance, risk,
+                sessions_list, events)
+
+    # 30-day trends and treatment plan: daily charts
+    @app.callback(
+        [Output('stress-trend', 'figure'), Output('posture-trend', 'figure'),
+         Output('treatment-plan', 'children')],
+        [Input('patient-selector', 'value'), Input('date-range', 'start_date'), Input('date-range', 'end_date'),
+         refresh_input('daily')]
+    )
+    def update_trends(patient, start_date, end_date, n):
+        auth.require_tab('therapist')
         # Stress Trend
         dates = pd.date_range(end=datetime.datetime.now(), periods=30)
         vals = np.random.uniform(3, 7, 30); vals[5], vals[15], vals[22] = 9, 8.5, 8
+        posture_vals = np.linspace(55, 75, 30) + np.random.normal(0, 5, 30)
+        summary = get_summary(patient, start_date, end_date)
+        if summary is not None:
+            dates = pd.to_datetime(summary['daily_dates'])
+            vals = np.array([np.nan if v is None else v for v in summary['daily_stress']])
+            posture_vals = np.array([np.nan if v is None else v for v in summary['daily_posture']])
         stress_fig = go.Figure()
-        stress_fig.add_trace(go.Scatter(x=dates, y=vals, fill='tozeroy', line={'color': COLORS['red'], 'width': 1.5}, fillcolor='rgba(225,87,89,0.1)'))
+        stress_fig.add_trace(time_series_trace(dates, vals, fill='tozeroy', line={'color': COLORS['red'], 'width': 1.5}, fillcolor='rgba(225,87,89,0.1)'))
         stress_fig.add_hline(y=7, line_dash="dash", line_color=COLORS['red'], annotation_text="Threshold", annotation_font_size=9)
         stress_fig.update_layout(**LAYOUT, yaxis={'range': [0, 10], 'gridcolor': '#eee'}, xaxis={'gridcolor': '#eee'})
         
         # Posture Trend
-        posture_vals = np.linspace(55, 75, 30) + np.random.normal(0, 5, 30)
         posture_fig = go.Figure()
-        posture_fig.add_trace(go.Scatter(x=dates, y=posture_vals, fill='tozeroy', line={'color': COLORS['blue'], 'width': 1.5}, fillcolor='rgba(78,121,167,0.1)'))
+        posture_fig.add_trace(time_series_trace(dates, posture_vals, fill='tozeroy', line={'color': COLORS['blue'], 'width': 1.5}, fillcolor='rgba(78,121,167,0.1)'))
         posture_fig.add_hline(y=70, line_dash="dash", line_color=COLORS['green'], annotation_text="Target", annotation_font_size=9)
         posture_fig.update_layout(**LAYOUT, yaxis={'range': [40, 100], 'gridcolor': '#eee'}, xaxis={'gridcolor': '#eee'})
         
-        # Heatmap
-        heat = np.random.rand(6, 6) * 0.4 + 0.2; heat[3:5, 3:5] += 0.4
-        heatmap_fig = go.Figure(go.Heatmap(z=heat, colorscale=[[0, '#f0f7ff'], [0.5, COLORS['orange']], [1, COLORS['red']]], showscale=False))
-        heatmap_fig.update_layout(**LAYOUT, xaxis={'showticklabels': False}, yaxis={'showticklabels': False})
-        
-        # Stress by Hour
-        hours = [f"{h}:00" for h in range(9, 18)]
-        hour_stress = [3.5, 4.2, 5.8, 6.5, 5.2, 4.0, 3.8, 5.5, 6.2]
-        colors = [COLORS['green'] if s < 4 else COLORS['orange'] if s < 6 else COLORS['red'] for s in hour_stress]
-        hour_fig = go.Figure(go.Bar(x=hours, y=hour_stress, marker_color=colors))
-        hour_fig.update_layout(**LAYOUT, yaxis={'range': [0, 8], 'gridcolor': '#eee'})
-        
-        # Events
-        events = html.Div([html.Table([
-            html.Thead([html.Tr([html.Th("Date"), html.Th("Event"), html.Th("Duration"), html.Th("")])]),
-            html.Tbody([
-                html.Tr([html.Td("Dec 04"), html.Td("High Stress"), html.Td("45m"), html.Td(html.Span("Critical", className="status-pill critical"))]),
-                html.Tr([html.Td("Dec 02"), html.Td("Long Sitting"), html.Td("5h"), html.Td(html.Span("Warning", className="status-pill warning"))]),
-                html.Tr([html.Td("Nov 28"), html.Td("Poor Posture"), html.Td("2h"), html.Td(html.Span("Warning", className="status-pill warning"))]),
-            ])
-        ], className="data-table")])
-        
         # Treatment
         plan = html.Div([
             html.Div([html.Span("Priority:", style={'color': '#888'}), html.Span(" Stress Management", style={'fontWeight': '600', 'color': COLORS['red']})], style={'marginBottom': '12px'}),
@@ -180,5 +211,73 @@ def register_therapist_callbacks(app):
             ], style={'paddingLeft': '16px', 'fontSize': '12px', 'color': '#555', 'lineHeight': '1.8'})
         ])
         
-        return (stress_avg, posture_avg, sessions, improvement, compliance, risk,
-                sessions_list, stress_fig, posture_fig, heatmap_fig, hour_fig, events, plan)
+        return stress_fig, posture_fig, plan
+
+    # Pressure heatmap and stress by hour: hourly aggregates
+    @app.callback(
+        [Output('heatmap', 'figure'), Output('stress-hour', 'figure')],
+        [Input('patient-selector', 'value'), Input('date-range', 'start_date'), Input('date-range', 'end_date'),
+         refresh_input('hourly')]
+    )
+    def update_patterns(patient, start_date, end_date, n):
+        auth.require_tab('therapist')
+        # Heatmap: seat pressure over the selected range, backrest at the top
+        heat = None
+        if patient and start_date and end_date:
+            heat = pressure_map.get_heatmap(patient, *parse_range(start_date, end_date))
+        if heat is None:
+            heat = np.random.rand(6, 6) * 0.4 + 0.2; heat[3:5, 3:5] += 0.4
+        heatmap_fig = go.Figure(go.Heatmap(z=heat, colorscale=[[0, '#f0f7ff'], [0.5, COLORS['orange']], [1, COLORS['red']]], showscale=False))
+        heatmap_fig.update_layout(**LAYOUT, xaxis={'showticklabels': False}, yaxis={'showticklabels': False, 'autorange': 'reversed'})
+        
+        # Stress by Hour
+        hours = [f"{h}:00" for h in range(9, 18)]
+        hour_stress = [3.5, 4.2, 5.8, 6.5, 5.2, 4.0, 3.8, 5.5, 6.2]
+        profile = temporal_profile.get_profile(('user', patient), 30, 'stress_level') if patient else None
+        if profile is not None:
+            hour_stress = [None if np.isnan(v) else round(float(v), 1) for v in temporal_profile.by_hour(profile)[9:18]]
+        colors = [COLORS['green'] if s is not None and s < 4 else COLORS['orange'] if s is not None and s < 6 else COLORS['red'] for s in hour_stress]
+        hour_fig = go.Figure(go.Bar(x=hours, y=hour_stress, marker_color=colors))
+        hour_fig.update_layout(**LAYOUT, yaxis={'range': [0, 8], 'gridcolor': '#eee'})
+        
+        return heatmap_fig, hour_fig
+
+def parse_range(start_date, end_date):
+    """DatePickerRange values ('YYYY-MM-DD' or ISO datetimes) as dates."""
+    return datetime.date.fromisoformat(start_date[:10]), datetime.date.fromisoformat(end_date[:10])
+
+def get_summary(patient, start_date, end_date):
+    if not (patient and start_date and end_date):
+        return None
+    return clinical_summary.get_summary(patient, *parse_range(start_date, end_date))
+
+def format_minutes(seconds):
+    hours, minutes = divmod(int(seconds) // 60, 60)
+    return f"{hours}h {minutes}m" if hours else f"{minutes}m"
+
+def summary_content(summary):
+    """KPI values, session timeline and events table from a clinical summary."""
+    def fmt(value, pattern, default="-"):
+        return pattern.format(value) if value is not None else default
+    
+    sessions_list = [html.Div([
+        html.Div(f"Session {summary['sessions'] - i}", className="timeline-title"),
+        html.Div(f"{pd.Timestamp(s['start']).strftime('%b %d')} • {format_minutes(s['seconds'])}", className="timeline-meta"),
+        html.Div([
+            html.Span(f"Stress: {fmt(s['stress'], '{:.0f}')}", style={'fontSize': '10px', 'color': COLORS['red'], 'marginRight': '10px'}),
+            html.Span(f"Posture: {fmt(s['posture'], '{:.0f}%')}", style={'fontSize': '10px', 'color': COLORS['blue']})
+        ])
+    ], className=f"timeline-item{' active' if i==0 else ''}") for i, s in enumerate(summary['recent_sessions'])]
+    
+    events = html.Div([html.Table([
+        html.Thead([html.Tr([html.Th("Date"), html.Th("Event"), html.Th("Duration"), html.Th("")])]),
+        html.Tbody([
+            html.Tr([html.Td(pd.Timestamp(e['start']).strftime('%b %d')), html.Td(e['type']), html.Td(format_minutes(e['seconds'])),
+                     html.Td(html.Span(e['level'].capitalize(), className=f"status-pill {e['level']}"))])
+            for e in summary['recent_events']
+        ])
+    ], className="data-table")])
+    
+    return (fmt(summary['stress_avg'], "{:.1f}"), fmt(summary['posture_avg'], "{:.0f}%"), str(summary['sessions']),
+            fmt(summary['improvement_pct'], "{:+.0f}%"), f"{summary['compliance_pct']:.0f}%", summary['risk'],
+            sessions_list, events)
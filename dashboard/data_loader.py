@@ -1,6 +1,19 @@
 import pandas as pd
 import os
 import numpy as np
+from pymongo.errors import PyMongoError
+from cache import shared_cache, cached
+import schema
+import sessions
+
+# Snapshot lifetime for computed per-user stats (seconds)
+STATS_TTL = 2
+# Lifetime of sitting/break interval queries (sessions.py); also how long an
+# unreachable database is not retried
+SESSION_TTL = 30
+
+# Posture_Class (0-3) to estimated posture %: 0=Good, 1=Fair, 2=Poor, 3=Bad
+POSTURE_SCORES = {0: 95, 1: 75, 2: 50, 3: 25}
 
 # Path to datasets - cross-platform detection
 # Get the directory where this file is located
@@ -15,69 +28,161 @@ possible_paths = [
     "Datasets",  # Current working directory
 ]
 
-DATASET_PATH = None
-for p in possible_paths:
-    if os.path.exists(p):
-        DATASET_PATH = p
-        print(f"Found Datasets at: {p}")
-        break
+# Resolved on first use (see dataset_path), so importing this module touches no files
+DATASET_PATH = os.getenv("DATASET_PATH")
+
+def dataset_path():
+    global DATASET_PATH
+    if DATASET_PATH is None:
+        found = next((p for p in possible_paths if os.path.exists(p)), None)
+        if found is None:
+            print(f"Warning: Datasets folder not found! Checked: {possible_paths}")
+            found = os.path.join(PROJECT_ROOT, "Datasets")  # Default
+        else:
+            print(f"Found Datasets at: {found}")
+        DATASET_PATH = found
+    return DATASET_PATH
+
+def load_features_frame():
+    """
+    Load the full features table in the compact dtypes of schema.py. Parsed once
+    and shared across worker processes; the file's mtime is part of the cache
+    key so edits are picked up.
+    """
+    features_file = os.path.join(dataset_path(), "posture_features.csv")
+    if not os.path.exists(features_file):
+        print(f"Dataset not found at {features_file}")
+        return None
+    key = ("posture_features", os.path.getmtime(features_file), schema.SCHEMA_VERSION)
+    return shared_cache.get_or_compute(
+        key, lambda: schema.compact(pd.read_csv(features_file, dtype=schema.READ_DTYPES)))
+
+def load_user_rows():
+    """
+    Map User_ID -> row positions in the features table, so a user's rows are
+    taken without scanning the whole table. Shared and keyed like the table.
+    """
+    df = load_features_frame()
+    if df is None:
+        return {}
+    features_file = os.path.join(dataset_path(), "posture_features.csv")
+    key = ("posture_features_users", os.path.getmtime(features_file), schema.SCHEMA_VERSION)
+    return shared_cache.get_or_compute(
+        key, lambda: {str(user): rows for user, rows in df.groupby('User_ID', observed=True, sort=False).indices.items()})
+
+def known_users():
+    """User IDs present in the features table or the department file."""
+    return set(load_user_rows()) | {str(u) for u in load_user_departments()}
+
+def warm_up():
+    """
+    Preload dataset frames into the shared cache (called before workers fork,
+    or from a background thread at boot with DASH_LAZY_STARTUP).
+    """
+    df = load_features_frame()
+    print(f"Cache warm-up: {0 if df is None else len(df)} feature rows, {len(load_user_rows())} users")
+
+def load_user_departments():
+    """
+    Map User_ID -> department from Datasets/user_departments.csv (User_ID,Department).
+    Users missing from the file are reported under 'unassigned'.
+    """
+    departments_file = os.path.join(dataset_path(), "user_departments.csv")
+    if not os.path.exists(departments_file):
+        return {}
+    df = pd.read_csv(departments_file)
+    return dict(zip(df['User_ID'], df['Department']))
 
-if DATASET_PATH is None:
-    print(f"Warning: Datasets folder not found! Checked: {possible_paths}")
-    DATASET_PATH = os.path.join(PROJECT_ROOT, "Datasets")  # Default
+def docs_to_frame(docs, compact=True):
+    """
+    Build a DataFrame from sensor_data documents with canonical columns:
+    user_id, timestamp, posture_score and Posture_Class (when derivable),
+    plus whichever raw channels the documents carry. compact applies the
+    dtypes of schema.py; compact=False keeps the stored values exactly.
+    """
+    df = pd.DataFrame(docs)
+    if df.empty:
+        return df
+    if 'User_ID' in df:
+        df['user_id'] = df['user_id'].fillna(df['User_ID']) if 'user_id' in df else df['User_ID']
+    if 'posture_score' not in df and 'Posture_Class' in df:
+        df['posture_score'] = df['Posture_Class'].map(POSTURE_SCORES)
+    if 'timestamp' in df:
+        df['timestamp'] = pd.to_datetime(df['timestamp'])
+    return schema.compact(df) if compact else df
 
 def load_user_data(user_id="U01"):
     """
     Load historical data for a specific user from CSV files.
     """
     try:
-        # Load features file
-        features_file = os.path.join(DATASET_PATH, "posture_features.csv")
-        if not os.path.exists(features_file):
-            print(f"Dataset not found at {features_file}")
+        df = load_features_frame()
+        if df is None:
             return None
-
-        df = pd.read_csv(features_file)
         
-        # Filter for specific user
-        user_df = df[df['User_ID'] == user_id].copy()
-        
-        if user_df.empty:
+        # Rows of this user from the shared index, not a scan of every user's rows
+        rows = load_user_rows().get(user_id)
+        if rows is None or len(rows) == 0:
             return None
             
-        return user_df
+        return df.iloc[rows].copy()
     except Exception as e:
         print(f"Error loading data: {e}")
         return None
 
+def _session_query(query, *args):
+    try:
+        return query(*args)
+    except PyMongoError as e:
+        print(f"Session query failed: {e}")
+        return None
+
+@cached(ttl=SESSION_TTL, per_user=True)
+def get_sitting_summary(user_id="U01"):
+    """Today's sitting hours and breaks from the user's sit/away intervals, or None without any."""
+    return _session_query(sessions.day_summary, user_id)
+
+@cached(ttl=SESSION_TTL, per_user=True)
+def get_hourly_activity(user_id="U01"):
+    """(sitting minutes, breaks started) per hour of today, or None without intervals."""
+    return _session_query(sessions.hourly_activity, user_id)
+
+@cached(ttl=SESSION_TTL, per_user=True)
+def get_daily_sitting(user_id="U01", days=7):
+    """(dates, sitting hours) of the last days days, or None without intervals."""
+    return _session_query(sessions.daily_sitting_hours, user_id, days)
+
+@cached(ttl=STATS_TTL, per_user=True)
 def get_user_stats(user_id="U01"):
     """
-    Get aggregated statistics for the user.
+    Get aggregated statistics for the user. Sitting hours and breaks come from
+    today's sit/away intervals when the sessionizer has any for the user.
     """
+    sitting = get_sitting_summary(user_id)
     df = load_user_data(user_id)
     if df is None:
         return {
             "stress_avg": 5.0,
             "posture_avg": 70,
-            "sitting_hours": 4.5,
-            "breaks": 3
+            "sitting_hours": sitting['sitting_hours'] if sitting else 4.5,
+            "breaks": sitting['breaks'] if sitting else 3
         }
 
     # Calculate actual stats from CSV
     # Using 'Posture_Class' (0-3) to estimate %: 0=Good(100%), 1=Fair(75%), 2=Poor(50%), 3=Bad(25%)
-    posture_map = {0: 95, 1: 75, 2: 50, 3: 25}
-    df['Posture_Score_Est'] = df['Posture_Class'].map(posture_map)
+    df['Posture_Score_Est'] = df['Posture_Class'].map(POSTURE_SCORES)
     
     # Stress estimation (mock from features if not explicit)
     stats = {
         "stress_avg": round(np.random.uniform(3, 7), 1), # Mock for now as CSV lacks stress col
         "posture_avg": int(df['Posture_Score_Est'].mean()),
-        "sitting_hours": 5.2, # Constant for presentation or calc from rows * duration
-        "breaks": 4
+        "sitting_hours": sitting['sitting_hours'] if sitting else 5.2,  # Presentation value without intervals
+        "breaks": sitting['breaks'] if sitting else 4
     }
     
     return stats
 
+@cached(ttl=STATS_TTL, per_user=True)
 def get_recent_history(user_id="U01", limit=10):
     """
     Get recent data points for charts.
@@ -92,14 +197,14 @@ def get_recent_history(user_id="U01", limit=10):
     # Use last 'limit' rows
     recent = df.tail(limit)
     
-    for _, row in recent.iterrows():
-        posture_score = {0: 95, 1: 75, 2: 50, 3: 25}.get(row['Posture_Class'], 70)
+    for posture_class, fsr_left in zip(recent['Posture_Class'].tolist(), recent['FSR_Left'].tolist()):
+        posture_score = POSTURE_SCORES.get(posture_class, 70)
         
         data.append({
             "stress_level": np.random.randint(3, 8), # Mock
             "posture_score": posture_score,
             "hrv": np.random.randint(60, 90),
-            "gsr": round(row['FSR_Left'] / 1000, 2) # Proxy using FSR
+            "gsr": round(fsr_left / 1000, 2) # Proxy using FSR
         })
         
     return data
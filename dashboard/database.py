@@ -1,4 +1,5 @@
-from pymongo import MongoClient
+from pymongo import MongoClient, ReturnDocument
+from pymongo.errors import PyMongoError
 import os
 import datetime
 
@@ -7,22 +8,207 @@ import datetime
 # Fallback to localhost if not in docker for local testing
 MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017/neurochair")
 DB_NAME = "neurochair"
+# Fail fast when Mongo is unreachable instead of blocking callbacks for 30s
+SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_TIMEOUT_MS", 2000))
+# Samples older than the hot window (SENSOR_HOT_DAYS) expire from sensor_data and
+# are read from the Parquet archive (archive.py); time-range queries below
+# combine both transparently.
+
+_client = None
 
 def get_db():
-    client = MongoClient(MONGO_URI)
-    return client[DB_NAME]
+    # Reuse one client (and its connection pool) per process
+    global _client
+    if _client is None:
+        _client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=SERVER_SELECTION_TIMEOUT_MS)
+    return _client[DB_NAME]
 
 def get_sensor_data_collection():
     db = get_db()
     return db["sensor_data"]
 
+# Per-user time-range reads (get_metric_samples, iter_sensor_data) filter on
+# either user field spelling plus timestamp; each $or branch needs its own index.
+USER_TIME_INDEXES = [[("user_id", 1), ("timestamp", 1)], [("User_ID", 1), ("timestamp", 1)]]
+
+def ensure_indexes():
+    """
+    Create the sensor_data query indexes (no-op when they exist). Runs at
+    startup, before gunicorn forks, so it uses its own short-lived client.
+    """
+    try:
+        with MongoClient(MONGO_URI, serverSelectionTimeoutMS=SERVER_SELECTION_TIMEOUT_MS) as client:
+            collection = client[DB_NAME]["sensor_data"]
+            for keys in USER_TIME_INDEXES:
+                collection.create_index(keys)
+    except PyMongoError as e:
+        print(f"sensor_data index creation failed: {e}")  # Queries still work, only slower
+
+# Counter bumped by every writer that changes samples of closed days (late
+# ingest, mongo replay, archive compaction); caches of closed days key on it.
+# analytics/data_processor.py and replay.py bump the same document.
+GENERATIONS = "data_generations"
+GENERATION_ID = "sensor_data"
+
+def get_data_generation():
+    """Current closed-day data generation (0 before the first bump)."""
+    doc = get_db()[GENERATIONS].find_one({"_id": GENERATION_ID})
+    return doc["generation"] if doc else 0
+
+def bump_data_generation():
+    """Mark samples of closed days as changed."""
+    get_db()[GENERATIONS].update_one({"_id": GENERATION_ID}, {"$inc": {"generation": 1}}, upsert=True)
+
 def get_recent_sensor_data(limit=1):
     """Get the most recent sensor data entries."""
     collection = get_sensor_data_collection()
     return list(collection.find().sort("timestamp", -1).limit(limit))
 
+def archived_until(start_time):
+    """Split point of a query from start_time: archived before, Mongo from here on."""
+    import archive  # pyarrow is only loaded once archived days are read
+    return archive.covered_until(start_time)
+
+def _archived_docs(start_time, end_time, fields=None, user_ids=None, with_ids=True, after_id=None):
+    import archive
+    return archive.iter_docs(start_time, end_time, fields, user_ids, with_ids, after_id)
+
 def get_historical_data(hours=24):
     """Get sensor data for the last n hours."""
     collection = get_sensor_data_collection()
     start_time = datetime.datetime.now() - datetime.timedelta(hours=hours)
-    return list(collection.find({"timestamp": {"$gte": start_time}}).sort("timestamp", 1))
+    hot_from = archived_until(start_time)
+    docs = list(_archived_docs(start_time, hot_from)) if hot_from > start_time else []
+    return docs + list(collection.find({"timestamp": {"$gte": hot_from}}).sort("timestamp", 1))
+
+def get_sensor_data_after(last_id=None, limit=500):
+    """Get sensor data stored after the given _id (or the latest entry if None)."""
+    collection = get_sensor_data_collection()
+    if last_id is None:
+        return list(collection.find().sort("_id", -1).limit(1))
+    return list(collection.find({"_id": {"$gt": last_id}}).sort("_id", 1).limit(limit))
+
+def get_sensor_data_since(start_time, after_id=None, limit=5000):
+    """
+    Get sensor data with timestamp >= start_time, in _id order, resuming after
+    after_id. Reads Mongo only: start at archived_until() and read the span
+    before it with iter_sensor_data.
+    """
+    collection = get_sensor_data_collection()
+    query = {"timestamp": {"$gte": start_time}}
+    if after_id is not None:
+        query["_id"] = {"$gt": after_id}
+    return list(collection.find(query).sort("_id", 1).limit(limit))
+
+def get_metric_samples(start_time, fields, user_ids=None, end_time=None, after_id=None, with_ids=False):
+    """
+    Get timestamp + selected fields for samples in a time window, optionally for
+    some users. with_ids returns _id too, in _id order; after_id resumes after it.
+    """
+    with_ids = with_ids or after_id is not None
+    hot_from = archived_until(start_time)
+    archived = []
+    if hot_from > start_time:
+        archive_end = hot_from if end_time is None else min(hot_from, end_time)
+        archived = list(_archived_docs(start_time, archive_end, fields, user_ids, with_ids, after_id))
+        if with_ids:
+            archived.sort(key=lambda doc: doc["_id"])
+        start_time = hot_from
+        if end_time is not None and end_time <= start_time:
+            return archived
+    collection = get_sensor_data_collection()
+    query = {"timestamp": {"$gte": start_time}}
+    if end_time is not None:
+        query["timestamp"]["$lt"] = end_time
+    if user_ids is not None:
+        query["$or"] = [{"user_id": {"$in": list(user_ids)}}, {"User_ID": {"$in": list(user_ids)}}]
+    if after_id is not None:
+        query["_id"] = {"$gt": after_id}
+    projection = {"_id": 1 if with_ids else 0, "timestamp": 1, "user_id": 1, "User_ID": 1}
+    projection.update({f: 1 for f in fields})
+    cursor = collection.find(query, projection).batch_size(10000)
+    if with_ids:
+        cursor = cursor.sort("_id", 1)
+    return archived + list(cursor)
+
+def iter_sensor_data(start_time, end_time, fields=None, user_ids=None, batch_size=5000):
+    """
+    Yield lists of up to batch_size samples in [start_time, end_time), oldest
+    first, streaming from one cursor so callers never hold the whole range.
+    Archived days are streamed from the archive first.
+    """
+    hot_from = min(archived_until(start_time), end_time)
+    batch = []
+    if hot_from > start_time:
+        for doc in _archived_docs(start_time, hot_from, fields, user_ids, with_ids=fields is None):
+            batch.append(doc)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        start_time = hot_from
+    collection = get_sensor_data_collection()
+    query = {"timestamp": {"$gte": start_time, "$lt": end_time}}
+    if user_ids is not None:
+        query["$or"] = [{"user_id": {"$in": list(user_ids)}}, {"User_ID": {"$in": list(user_ids)}}]
+    projection = None
+    if fields is not None:
+        projection = {"_id": 0, "timestamp": 1, "user_id": 1, "User_ID": 1}
+        projection.update({f: 1 for f in fields})
+    cursor = collection.find(query, projection).sort("timestamp", 1).batch_size(batch_size)
+    for doc in cursor:
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def get_sessions_collection():
+    db = get_db()
+    return db["user_sessions"]
+
+def get_user_sessions(user_id, start_time, end_time):
+    """Sit/away intervals (sessions.py) of a user overlapping [start_time, end_time), oldest first."""
+    collection = get_sessions_collection()
+    query = {"user_id": user_id, "start": {"$lt": end_time}, "end": {"$gt": start_time}}
+    return list(collection.find(query, {"_id": 0}).sort("start", 1))
+
+def get_alerts_collection():
+    db = get_db()
+    return db["alerts"]
+
+def insert_alert(alert):
+    """
+    Insert an alert unless one with its _id exists. Returns the stored
+    document: the existing one when another process inserted it first.
+    """
+    collection = get_alerts_collection()
+    fields = {k: v for k, v in alert.items() if k != "_id"}
+    return collection.find_one_and_update({"_id": alert["_id"]}, {"$setOnInsert": fields},
+                                          upsert=True, return_document=ReturnDocument.AFTER)
+
+def update_alert(alert_id, condition, fields):
+    """
+    Set fields on an alert if it still matches condition (e.g. its status).
+    Returns the stored document, updated or as another process left it; None
+    if the alert does not exist.
+    """
+    collection = get_alerts_collection()
+    updated = collection.find_one_and_update({"_id": alert_id, **condition}, {"$set": fields},
+                                             return_document=ReturnDocument.AFTER)
+    return updated if updated is not None else collection.find_one({"_id": alert_id})
+
+def get_open_alerts():
+    """Get alerts that have not been resolved yet."""
+    collection = get_alerts_collection()
+    return list(collection.find({"status": {"$ne": "resolved"}}))
+
+def get_alerts_since(start_time):
+    """Get alerts triggered at or after start_time."""
+    collection = get_alerts_collection()
+    return list(collection.find({"triggered_at": {"$gte": start_time}}))
+
+def get_alerts_updated_since(updated_at):
+    """Get alerts changed at or after updated_at, oldest change first."""
+    collection = get_alerts_collection()
+    return list(collection.find({"updated_at": {"$gte": updated_at}}).sort("updated_at", 1))
@@ -0,0 +1,102 @@
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+# Server-side downsampling for long time-series charts.
+# A chart can't show more than a couple of points per horizontal pixel, so series
+# are reduced to a target tied to chart width before being serialized.
+DEFAULT_CHART_WIDTH = 800  # px; dashboard graphs are responsive, this is a typical card width
+POINTS_PER_PIXEL = 2
+WEBGL_THRESHOLD = 1000  # Switch to Scattergl when a trace still has more points than this
+
+def target_points(width_px=DEFAULT_CHART_WIDTH):
+    return int(width_px * POINTS_PER_PIXEL)
+
+def _as_float(x):
+    x = np.asarray(x)
+    if x.dtype == object:
+        x = pd.to_datetime(x).to_numpy()  # datetime.date / datetime objects
+    if np.issubdtype(x.dtype, np.datetime64):
+        return x.astype('datetime64[ns]').astype(np.int64).astype(np.float64)
+    return x.astype(np.float64)
+
+def lttb_indices(x, y, n_out):
+    """
+    Indices of the points kept by Largest-Triangle-Three-Buckets.
+    First and last points are always kept; each interior bucket keeps the point
+    forming the largest triangle with the previously kept point and the next
+    bucket's centroid. NaN points (days without data) are left out of the
+    buckets; the first point of each NaN run is kept so the line still breaks.
+    """
+    x = _as_float(x)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    missing = np.isnan(y)
+    if missing.any():
+        present = np.flatnonzero(~missing)
+        gaps = np.flatnonzero(missing & ~np.concatenate([[False], missing[:-1]]))
+        return np.union1d(present[lttb_indices(x[present], y[present], n_out)], gaps)
+
+    # n_out - 2 buckets over the interior points [1, n - 1)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    starts, ends = edges[:-1], edges[1:]
+    counts = ends - starts
+    avg_x = np.add.reduceat(x[:n - 1], starts) / counts
+    avg_y = np.add.reduceat(y[:n - 1], starts) / counts
+    # Centroid of the following bucket (the last bucket looks at the final point)
+    next_x = np.append(avg_x[1:], x[n - 1])
+    next_y = np.append(avg_y[1:], y[n - 1])
+
+    out = np.empty(n_out, dtype=np.int64)
+    out[0], out[-1] = 0, n - 1
+    a = 0
+    for i in range(len(starts)):
+        s, e = starts[i], ends[i]
+        bx, by = x[s:e], y[s:e]
+        area = np.abs((x[a] - next_x[i]) * (by - y[a]) - (x[a] - bx) * (next_y[i] - y[a]))
+        a = s + int(np.argmax(area))
+        out[i + 1] = a
+    return out
+
+def minmax_indices(y, n_buckets):
+    """
+    Indices of the min and max point of each of n_buckets equal-size buckets
+    (fully vectorized). Keeps spikes that LTTB may smooth over.
+    """
+    y = np.asarray(y, dtype=np.float64)
+    n = len(y)
+    if n_buckets * 2 >= n:
+        return np.arange(n)
+    size = -(-n // n_buckets)
+    padded = np.full(n_buckets * size, np.nan)
+    padded[:n] = y
+    blocks = padded.reshape(n_buckets, size)
+    valid = ~np.all(np.isnan(blocks), axis=1)
+    offsets = np.arange(n_buckets)[valid] * size
+    lo = offsets + np.nanargmin(blocks[valid], axis=1)
+    hi = offsets + np.nanargmax(blocks[valid], axis=1)
+    return np.unique(np.concatenate([[0, n - 1], lo, hi]))
+
+def downsample(x, y, n_out=None, method='lttb'):
+    """
+    Reduce a series to about n_out points. Returns (x, y) arrays.
+    """
+    x = np.asarray(x)
+    y = np.asarray(y)
+    n_out = n_out or target_points()
+    if method == 'minmax':
+        idx = minmax_indices(y, max(1, n_out // 2))
+    else:
+        idx = lttb_indices(x, y, n_out)
+    return x[idx], y[idx]
+
+def time_series_trace(x, y, width_px=DEFAULT_CHART_WIDTH, method='lttb', **trace_kwargs):
+    """
+    Build a line trace for a long series: downsampled to the chart width, and
+    rendered with WebGL (Scattergl) when it is still large.
+    """
+    x, y = downsample(x, y, target_points(width_px), method)
+    trace_type = go.Scattergl if len(x) > WEBGL_THRESHOLD else go.Scatter
+    return trace_type(x=x, y=y, **trace_kwargs)
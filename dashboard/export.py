@@ -0,0 +1,210 @@
+import datetime
+import hashlib
+import os
+
+import numpy as np
+import pandas as pd
+from flask import Response, abort, request, stream_with_context
+from pymongo.errors import PyMongoError
+
+import auth
+import data_loader
+import database
+import org_cube
+
+# Streaming report export for the Clinical View ("Export") and the employer
+# view ("Download Report"). Rows are read from one batched Mongo cursor and
+# written out batch by batch, so memory stays flat and the download starts
+# with the first batch regardless of range length.
+# Exports need a logged-in session: patient files go to the patient and to
+# clinical roles (auth.can_view_patient), organization reports to roles that
+# may open the employer tab. Each account runs at most MAX_CONCURRENT_EXPORTS
+# at a time across all workers (flock'ed slot files in the cache directory,
+# released when the download ends or its worker dies).
+BATCH_SIZE = 5000
+MAX_EXPORT_DAYS = 366
+MAX_CONCURRENT_EXPORTS = int(os.getenv("EXPORT_MAX_CONCURRENT", 2))
+SLOT_DIR = "exports"
+
+PATIENT_COLUMNS = ['timestamp', 'user_id', 'NFC_ID', 'stress_level', 'hrv', 'gsr', 'posture_score', 'Posture_Class',
+                   'AccX', 'AccY', 'AccZ', 'GyroX', 'GyroY', 'GyroZ', 'FSR_Left', 'FSR_Right', 'FSR_Back',
+                   'Limit_Back_Up', 'Limit_Back_Down', 'Limit_Left', 'Limit_Right']
+PATIENT_TEXT_COLUMNS = ('user_id', 'NFC_ID')
+# Organization reports are hourly department aggregates; groups with fewer than
+# K_ANONYMITY distinct users are left out, as on the dashboard
+ORG_COLUMNS = ['hour', 'department', 'active_users', 'samples', 'avg_stress', 'avg_posture_score',
+               'good_posture_pct', 'wellness']
+ORG_TEXT_COLUMNS = ('department',)
+
+def patient_frames(patient, start, end, batch_size=BATCH_SIZE):
+    """Raw samples for one patient, one DataFrame per cursor batch."""
+    fields = [c for c in PATIENT_COLUMNS if c not in ('timestamp', 'user_id')]
+    for docs in database.iter_sensor_data(start, end, fields, [patient], batch_size):
+        # Full precision: exported files are read back by replay.py and analysis tools
+        yield data_loader.docs_to_frame(docs, compact=False).reindex(columns=PATIENT_COLUMNS)
+
+def _aggregate_hours(df, departments):
+    df = df.assign(department=df['user_id'].map(departments).fillna(org_cube.UNASSIGNED))
+    stress = df['stress_level'].astype(float) if 'stress_level' in df else pd.Series(np.nan, index=df.index)
+    posture = df['posture_score'].astype(float) if 'posture_score' in df else pd.Series(np.nan, index=df.index)
+    good = (df['Posture_Class'] <= 1).astype(float).where(df['Posture_Class'].notna()) if 'Posture_Class' in df else np.nan
+    df = df.assign(stress=stress, posture=posture, good=good, wellness=org_cube.wellness_score(stress, posture))
+    out = df.groupby(['hour', 'department']).agg(
+        active_users=('user_id', 'nunique'), samples=('user_id', 'size'), avg_stress=('stress', 'mean'),
+        avg_posture_score=('posture', 'mean'), good_posture_pct=('good', 'mean'), wellness=('wellness', 'mean'),
+    ).reset_index()
+    out['good_posture_pct'] *= 100
+    return out[out['active_users'] >= org_cube.K_ANONYMITY].reindex(columns=ORG_COLUMNS)
+
+def org_frames(dept, start, end, batch_size=BATCH_SIZE):
+    """
+    Hourly department aggregates. The cursor is in time order, so every hour
+    before the last one in a batch is complete and can be written out; only the
+    trailing hour is carried into the next batch.
+    """
+    departments = data_loader.load_user_departments()
+    users = None if dept in (None, 'all') else [u for u, d in departments.items() if d == dept]
+    fields = ['stress_level', 'posture_score', 'Posture_Class']
+    carry = None
+    for docs in database.iter_sensor_data(start, end, fields, users, batch_size):
+        df = data_loader.docs_to_frame(docs, compact=False)
+        df['hour'] = df['timestamp'].dt.floor('h')
+        if carry is not None:
+            df = pd.concat([carry, df], ignore_index=True)
+        last = df['hour'].max()
+        carry = df[df['hour'] == last]
+        done = df[df['hour'] < last]
+        if not done.empty:
+            yield _aggregate_hours(done, departments)
+    if carry is not None and not carry.empty:
+        yield _aggregate_hours(carry, departments)
+
+def csv_chunks(frames, columns):
+    """Encode frames as one CSV stream (header once, even with no rows)."""
+    yield ','.join(columns) + '\n'
+    for df in frames:
+        if not df.empty:
+            yield df.to_csv(index=False, header=False, date_format='%Y-%m-%dT%H:%M:%S')
+
+class _StreamSink:
+    """Write-only file object whose written bytes are collected between drains."""
+    closed = False
+
+    def __init__(self):
+        self._parts = []
+        self._position = 0
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b''.join(self._parts)
+        self._parts = []
+        return data
+
+def _arrow_schema(columns, text_columns):
+    import pyarrow as pa
+    time_column = columns[0]
+    return pa.schema([(c, pa.timestamp('ms') if c == time_column else pa.string() if c in text_columns else pa.float64())
+                      for c in columns])
+
+def parquet_chunks(frames, columns, text_columns):
+    """Encode frames as one Parquet file, one row group per frame."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    schema = _arrow_schema(columns, text_columns)
+    sink = _StreamSink()
+    with pq.ParquetWriter(sink, schema) as writer:
+        for df in frames:
+            if df.empty:
+                continue
+            df = df.astype({c: float for c in columns[1:] if c not in text_columns})
+            df = df.astype({c: object for c in text_columns})
+            writer.write_table(pa.Table.from_pandas(df, schema=schema, preserve_index=False))
+            yield sink.drain()
+    yield sink.drain()
+
+def _guarded(chunks):
+    # Headers are already sent once streaming starts; a DB error can only end the file early
+    try:
+        yield from chunks
+    except PyMongoError as e:
+        print(f"Export stream failed: {e}")
+
+def _export_slot(user):
+    """An flock'ed export slot file of user, or None when all MAX_CONCURRENT_EXPORTS are taken."""
+    import fcntl
+    from cache import CACHE_DIR
+    directory = os.path.join(CACHE_DIR, SLOT_DIR)
+    os.makedirs(directory, exist_ok=True)
+    name = hashlib.sha1(user.encode()).hexdigest()[:16]
+    for i in range(MAX_CONCURRENT_EXPORTS):
+        slot = open(os.path.join(directory, f"{name}.{i}"), "a")
+        try:
+            fcntl.flock(slot, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return slot
+        except OSError:
+            slot.close()
+    return None
+
+def _parse_date(value):
+    try:
+        return datetime.date.fromisoformat((value or '')[:10])
+    except ValueError:
+        abort(400, f"Invalid date: {value!r}")
+
+def export():
+    """
+    Flask view for the /export route (registered by app.py):
+    /export?scope=patient|org&id=<patient or department>&start=YYYY-MM-DD&end=YYYY-MM-DD&format=csv|parquet
+    """
+    scope = request.args.get('scope', 'patient')
+    target = request.args.get('id') or ('all' if scope == 'org' else None)
+    fmt = request.args.get('format', 'csv')
+    start, end = _parse_date(request.args.get('start')), _parse_date(request.args.get('end'))
+    if scope not in ('patient', 'org') or target is None or fmt not in ('csv', 'parquet'):
+        abort(400, "Expected scope=patient|org, id and format=csv|parquet")
+    if end < start or (end - start).days >= MAX_EXPORT_DAYS:
+        abort(400, f"Date range must be 1-{MAX_EXPORT_DAYS} days")
+    account = auth.current_user()
+    if account is None:
+        abort(401, "Login required")
+    if not (auth.can_view_patient(account, target) if scope == 'patient' else auth.can_open('employer', account)):
+        abort(403, "Not allowed to export this data")
+
+    start_time = datetime.datetime.combine(start, datetime.time())
+    end_time = datetime.datetime.combine(end + datetime.timedelta(days=1), datetime.time())
+    if scope == 'patient':
+        frames, columns, text_columns = patient_frames(target, start_time, end_time), PATIENT_COLUMNS, PATIENT_TEXT_COLUMNS
+    else:
+        frames, columns, text_columns = org_frames(target, start_time, end_time), ORG_COLUMNS, ORG_TEXT_COLUMNS
+
+    if fmt == 'parquet':
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            abort(501, "Parquet export requires pyarrow")
+        chunks, mimetype = parquet_chunks(frames, columns, text_columns), 'application/vnd.apache.parquet'
+    else:
+        chunks, mimetype = csv_chunks(frames, columns), 'text/csv'
+
+    slot = _export_slot(account['user'])
+    if slot is None:
+        abort(429, f"At most {MAX_CONCURRENT_EXPORTS} exports at a time")
+    filename = f"neurochair_{scope}_{target}_{start}_{end}.{fmt}"
+    response = Response(stream_with_context(_guarded(chunks)), mimetype=mimetype)
+    response.call_on_close(slot.close)  # Closing the slot file releases its flock
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,32 @@
+# Gunicorn settings for the production dashboard (see wsgi.py).
+#
+# Sizing:
+#   - workers: one process per CPU core. Callbacks are CPU-bound (pandas/plotly
+#     figure building), so more processes than cores only adds contention.
+#   - threads: callbacks also wait on Mongo and the shared cache, and every open
+#     dashboard holds one /stream (SSE) connection on a thread. Each worker can
+#     serve `threads` concurrent requests; total concurrent SSE clients are
+#     roughly workers * threads minus headroom for callbacks. Raise
+#     GUNICORN_THREADS for many idle dashboards, keep it lower for heavy tabs.
+#   - memory: each worker holds its own in-process cache layer (cache.LOCAL_ENTRIES)
+#     on top of the shared filesystem cache; budget roughly dataset size per worker.
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8050')}"
+workers = int(os.getenv("GUNICORN_WORKERS", multiprocessing.cpu_count()))
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", 8))
+
+# Import the app (and warm the dataset cache) once, before forking workers.
+# DASH_LAZY_STARTUP=1 trades that for fast worker boot: the tabs load in a
+# background thread per worker, which cannot be started before fork.
+preload_app = os.getenv("DASH_LAZY_STARTUP", "0") != "1"
+
+# SSE responses stay open; keep-alive comments are sent every 15s (live_stream.py)
+timeout = 60
+graceful_timeout = 30
+keepalive = 5
+
+accesslog = "-"
+errorlog = "-"
@@ -0,0 +1,175 @@
+import json
+import os
+import queue
+import threading
+import time
+import datetime
+
+from flask import Response, request, stream_with_context
+from pymongo.errors import OperationFailure, PyMongoError
+
+import auth
+import database
+
+# Server-Sent Events channel for live updates.
+# One watcher thread per server process follows sensor_data (change stream when
+# Mongo runs as a replica set, _id tailing otherwise) and fans new samples out to
+# every subscribed browser. With no subscribers the watcher does no queries.
+# /stream needs a logged-in session (auth.py): a subscriber gets the samples of
+# one user (its own, or with ?user= a patient its role may view) and the alerts
+# of that user; clinical roles get every alert (emergency tab).
+POLL_SECONDS = float(os.getenv("LIVE_POLL_SECONDS", 0.5))
+KEEPALIVE_SECONDS = 15
+MIN_SAMPLE_INTERVAL = float(os.getenv("LIVE_MIN_SAMPLE_INTERVAL", 0.5))  # Per-client sample rate cap
+QUEUE_SIZE = 100
+
+def _to_json(doc):
+    """Make a Mongo document JSON-serializable."""
+    out = {}
+    for key, value in doc.items():
+        if isinstance(value, (datetime.datetime, datetime.date)):
+            out[key] = value.isoformat()
+        elif key == '_id':
+            out[key] = str(value)
+        else:
+            out[key] = value
+    return out
+
+def _sample_user(sample):
+    return sample.get('user_id') or sample.get('User_ID')
+
+class LiveBroadcaster:
+    """
+    Fan out sensor samples and alert events to SSE subscribers.
+    """
+    def __init__(self):
+        self._subscribers = {}  # queue -> (user, receives every user's alerts)
+        self._lock = threading.Lock()
+        self._has_subscribers = threading.Event()
+        self._thread = None
+
+    def subscribe(self, user_id, all_alerts=False):
+        q = queue.Queue(maxsize=QUEUE_SIZE)
+        with self._lock:
+            self._subscribers[q] = (user_id, all_alerts)
+            self._has_subscribers.set()
+        self.start()
+        return q
+
+    def unsubscribe(self, q):
+        with self._lock:
+            self._subscribers.pop(q, None)
+            if not self._subscribers:
+                self._has_subscribers.clear()
+
+    def publish(self, event, data):
+        """Push an event to all matching subscribers; slow clients drop their oldest event."""
+        user_id = _sample_user(data)
+        with self._lock:
+            targets = [q for q, (user, all_alerts) in self._subscribers.items()
+                       if user == user_id or (all_alerts and event == 'alert')]
+        for q in targets:
+            try:
+                q.put_nowait((event, data))
+            except queue.Full:
+                try:
+                    q.get_nowait()
+                    q.put_nowait((event, data))
+                except (queue.Empty, queue.Full):
+                    pass
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._watch, name="live-stream-watcher", daemon=True)
+                self._thread.start()
+
+    def _watch(self):
+        use_change_stream = True
+        last_id = None
+        while True:
+            if not self._has_subscribers.is_set():
+                last_id = None  # Resume from "now" once someone subscribes again
+                self._has_subscribers.wait()
+            try:
+                if use_change_stream:
+                    try:
+                        self._follow_change_stream()
+                    except OperationFailure:
+                        # Standalone mongod: change streams need a replica set
+                        use_change_stream = False
+                    continue
+                docs = database.get_sensor_data_after(last_id)
+                if last_id is None:
+                    # First poll only sets the watermark
+                    last_id = docs[0]['_id'] if docs else None
+                    if last_id is None:
+                        time.sleep(POLL_SECONDS)
+                    continue
+                for doc in docs:
+                    last_id = doc['_id']
+                    self.publish('sample', _to_json(doc))
+                if not docs:
+                    time.sleep(POLL_SECONDS)
+            except PyMongoError as e:
+                print(f"Live stream watcher error: {e}")
+                time.sleep(5)
+
+    def _follow_change_stream(self):
+        collection = database.get_sensor_data_collection()
+        with collection.watch([{"$match": {"operationType": "insert"}}], max_await_time_ms=1000) as stream:
+            while self._has_subscribers.is_set():
+                change = stream.try_next()
+                if change is not None:
+                    self.publish('sample', _to_json(change['fullDocument']))
+
+broadcaster = LiveBroadcaster()
+
+def _format_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+def _event_stream(q):
+    """Yield SSE frames for one subscriber, coalescing samples to MIN_SAMPLE_INTERVAL."""
+    pending_sample = None
+    last_sample_sent = 0.0
+    yield ": connected\n\n"
+    try:
+        while True:
+            timeout = KEEPALIVE_SECONDS
+            if pending_sample is not None:
+                timeout = max(0.0, last_sample_sent + MIN_SAMPLE_INTERVAL - time.monotonic())
+            try:
+                event, data = q.get(timeout=timeout)
+                if event == 'sample':
+                    pending_sample = data
+                else:
+                    yield _format_event(event, data)
+            except queue.Empty:
+                if pending_sample is None:
+                    yield ": keepalive\n\n"
+            now = time.monotonic()
+            if pending_sample is not None and now - last_sample_sent >= MIN_SAMPLE_INTERVAL:
+                yield _format_event('sample', pending_sample)
+                pending_sample = None
+                last_sample_sent = now
+    finally:
+        broadcaster.unsubscribe(q)
+
+def register_live_stream(server):
+    """
+    Add the /stream SSE route to the Flask server. Streams the session user's
+    samples, or with ?user=<id> those of a patient the session may view.
+    """
+    @server.route('/stream')
+    def stream():
+        account = auth.current_user()
+        if account is None:
+            return Response("Login required", status=401)
+        user_id = request.args.get('user') or account['user']
+        if not auth.can_view_patient(account, user_id):
+            return Response("Forbidden", status=403)
+        q = broadcaster.subscribe(user_id, all_alerts=account['role'] in auth.CLINICAL_ROLES)
+        response = Response(stream_with_context(_event_stream(q)), mimetype='text/event-stream')
+        response.headers['Cache-Control'] = 'no-cache'
+        response.headers['X-Accel-Buffering'] = 'no'
+        return response
@@ -0,0 +1,283 @@
+import datetime
+import os
+import threading
+import time
+from collections import defaultdict
+
+import numpy as np
+
+import data_loader
+import database
+from cache import shared_cache
+
+# Materialized aggregation cube for the employer (organization) view.
+# Sums are kept per (department, day, hour) so any department / 7D-30D-90D
+# selection is a slice-and-sum over at most 90 * 24 cells per department,
+# independent of how many employees or samples are behind it.
+# Each worker serves its own copy, refreshed by a background thread once per
+# REFRESH_SECONDS period, never on the request path. Per period one process
+# extends the previous period's cube with the samples stored since (the
+# shared cache's lock file elects it) and stores the result in the shared
+# cache; the other workers load that copy. Only a start with no cube left in
+# the cache scans the full HISTORY_DAYS.
+HISTORY_DAYS = 90
+K_ANONYMITY = int(os.getenv("K_ANONYMITY", 5))  # Groups with fewer distinct users are suppressed
+REFRESH_SECONDS = 60
+SHARED_PERIODS = 3  # Periods a shared cube stays in the cache
+MAX_SAMPLE_GAP = 60  # Seconds; longer gaps between samples are not counted as sitting time
+UNASSIGNED = 'unassigned'
+EPOCH_ORDINAL = datetime.date(1970, 1, 1).toordinal()
+
+METRICS = ('samples', 'wellness_sum', 'stress_sum', 'stress_n', 'sitting_seconds',
+           'posture_0', 'posture_1', 'posture_2', 'posture_3')
+
+def wellness_score(stress, posture_score):
+    """Per-sample wellness (0-100): equal parts posture score and inverted stress."""
+    return 0.5 * posture_score + 0.5 * (100 - stress * 10)
+
+def _posture_class(df):
+    if 'Posture_Class' in df:
+        return df['Posture_Class'].to_numpy(dtype=np.int64)
+    score = df['posture_score'].to_numpy(dtype=np.float64)
+    return np.select([score >= 85, score >= 65, score >= 40], [0, 1, 2], 3)
+
+class OrgCube:
+    """
+    Per (department, day, hour) sums of wellness, stress, posture-class counts
+    and sitting time, plus the distinct users behind each (department, day).
+    """
+    def __init__(self, days=HISTORY_DAYS, today=None):
+        self.days = days
+        self.end_day = (today or datetime.date.today()).toordinal()  # Ordinal of the last day slot
+        self.departments = {}  # name -> row index
+        self.sums = {m: np.zeros((0, days, 24)) for m in METRICS}
+        self.users = defaultdict(set)  # (dept index, day ordinal) -> user ids
+        self.last_seen = {}  # user id -> timestamp (epoch seconds) of their latest ingested sample
+        self.watermark = None  # Last ingested sensor_data _id
+        self.hot_from = None  # Samples before this were loaded from the archive
+        self.version = 0
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        with self._lock:
+            state = dict(self.__dict__, sums={m: a.copy() for m, a in self.sums.items()},
+                         users={k: set(v) for k, v in self.users.items()}, last_seen=dict(self.last_seen),
+                         departments=dict(self.departments))
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.users = defaultdict(set, self.users)
+        self._lock = threading.Lock()
+
+    # ---- maintenance ----
+
+    def _dept_index(self, name):
+        if name not in self.departments:
+            self.departments[name] = len(self.departments)
+            for m in METRICS:
+                self.sums[m] = np.concatenate([self.sums[m], np.zeros((1, self.days, 24))])
+        return self.departments[name]
+
+    def _advance_to(self, day_ordinal):
+        """Roll the day axis forward so day_ordinal is the last slot."""
+        shift = day_ordinal - self.end_day
+        if shift <= 0:
+            return
+        for m in METRICS:
+            if shift >= self.days:
+                self.sums[m][:] = 0
+            else:
+                self.sums[m][:, :-shift] = self.sums[m][:, shift:]
+                self.sums[m][:, -shift:] = 0
+        self.end_day = day_ordinal
+        oldest = self.end_day - self.days + 1
+        for key in [k for k in self.users if k[1] < oldest]:
+            del self.users[key]
+
+    def ingest(self, df, departments):
+        """
+        Add samples (frame from data_loader.docs_to_frame) to the cube.
+        departments maps user_id -> department name.
+        """
+        if df is None or df.empty or 'timestamp' not in df:
+            return
+        df = df.sort_values(['user_id', 'timestamp'])
+        ts = df['timestamp']
+        day = ts.to_numpy().astype('datetime64[D]').astype(np.int64) + EPOCH_ORDINAL
+        hour = ts.dt.hour.to_numpy()
+        users = df['user_id'].to_numpy()
+
+        stress = df['stress_level'].to_numpy(dtype=np.float64) if 'stress_level' in df else np.full(len(df), np.nan)
+        posture = df['posture_score'].to_numpy(dtype=np.float64) if 'posture_score' in df else np.full(len(df), np.nan)
+        has_stress = ~np.isnan(stress)
+        wellness = np.where(has_stress, wellness_score(np.nan_to_num(stress), np.nan_to_num(posture)), 0.0)
+        classes = _posture_class(df) if ('Posture_Class' in df or 'posture_score' in df) else np.full(len(df), -1)
+
+        # Sitting time: gap to the user's previous sample, ignoring long gaps. A
+        # user's first sample here continues from their last one of earlier batches.
+        seconds = ts.to_numpy().astype('datetime64[ns]').astype(np.int64) / 1e9
+        first = np.ones(len(df), dtype=bool)
+        first[1:] = users[1:] != users[:-1]
+        last = np.roll(first, -1)
+        previous = np.empty(len(df))
+        previous[1:] = seconds[:-1]
+
+        with self._lock:
+            previous[first] = [self.last_seen.get(u, np.nan) for u in users[first]]
+            gaps = seconds - previous
+            with np.errstate(invalid='ignore'):
+                sitting = np.where((gaps >= 0) & (gaps <= MAX_SAMPLE_GAP), gaps, 0.0)
+            for u, t in zip(users[last].tolist(), seconds[last].tolist()):
+                if t > self.last_seen.get(u, -np.inf):
+                    self.last_seen[u] = t
+
+            self._advance_to(int(day.max()))
+            start = self.end_day - self.days + 1
+            keep = day >= start
+            uniq, inverse = np.unique(users, return_inverse=True)
+            dept_of_user = np.array([self._dept_index(departments.get(u, UNASSIGNED)) for u in uniq], dtype=np.int64)
+            dept_idx = dept_of_user[inverse]
+            idx = (dept_idx[keep], day[keep] - start, hour[keep])
+            np.add.at(self.sums['samples'], idx, 1)
+            np.add.at(self.sums['wellness_sum'], idx, wellness[keep])
+            np.add.at(self.sums['stress_sum'], idx, np.nan_to_num(stress)[keep])
+            np.add.at(self.sums['stress_n'], idx, has_stress[keep])
+            np.add.at(self.sums['sitting_seconds'], idx, sitting[keep])
+            for c in range(4):
+                np.add.at(self.sums[f'posture_{c}'], idx, (classes == c)[keep])
+            # Distinct users per (department, day), one set update per unique triple
+            triples = set(zip(dept_idx[keep].tolist(), day[keep].tolist(), users[keep].tolist()))
+            for d, dd, u in triples:
+                self.users[(d, dd)].add(u)
+            self.version += 1
+
+    def refresh_from_db(self, departments=None):
+        """Pull samples stored since the last refresh (incremental)."""
+        departments = departments if departments is not None else data_loader.load_user_departments()
+        with self._lock:
+            # Windows end today even when no samples arrived since the last ingest day
+            end_day = self.end_day
+            self._advance_to(datetime.date.today().toordinal())
+            if self.end_day != end_day:
+                self.version += 1
+        start = datetime.datetime.combine(datetime.date.fromordinal(self.end_day - self.days + 1), datetime.time())
+        if self.hot_from is None:
+            # Days already compacted out of sensor_data are read once from the archive
+            self.hot_from = database.archived_until(start)
+            for docs in database.iter_sensor_data(start, self.hot_from):
+                self.ingest(data_loader.docs_to_frame(docs), departments)
+        start = max(start, self.hot_from)
+        while True:
+            docs = database.get_sensor_data_since(start, self.watermark)
+            if not docs:
+                break
+            self.ingest(data_loader.docs_to_frame(docs), departments)
+            self.watermark = docs[-1]['_id']
+
+    # ---- queries ----
+
+    def _selection(self, dept):
+        if dept in (None, 'all'):
+            return list(self.departments.values())
+        return [self.departments[dept]] if dept in self.departments else []
+
+    def distinct_users(self, dept='all', days=30):
+        rows = self._selection(dept)
+        first = self.end_day - days + 1
+        seen = set()
+        for (d, day), users in self.users.items():
+            if d in rows and day >= first:
+                seen |= users
+        return len(seen)
+
+    def _slice(self, metric, rows, days):
+        return self.sums[metric][rows, -days:, :]
+
+    def summary(self, dept='all', days=30, k=K_ANONYMITY):
+        """
+        Aggregates for a department (or 'all') over the last `days` days, or None
+        if the group has fewer than k distinct users (or no data).
+        """
+        with self._lock:
+            rows = self._selection(dept)
+            active = self.distinct_users(dept, days)
+            if not rows or active < k:
+                return None
+            total = {m: float(self._slice(m, rows, days).sum()) for m in METRICS}
+            if total['samples'] == 0:
+                return None
+            per_day = self._slice('samples', rows, days).sum(axis=(0, 2)) > 0
+            daily = {m: self._slice(m, rows, days).sum(axis=(0, 2)) for m in ('wellness_sum', 'stress_sum', 'stress_n')}
+            hourly = {m: self._slice(m, rows, days).sum(axis=(0, 1)) for m in ('stress_sum', 'stress_n')}
+        posture_counts = [total[f'posture_{c}'] for c in range(4)]
+        classified = sum(posture_counts)
+        user_days = max(1, active * int(per_day.sum()))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return {
+                'wellness': total['wellness_sum'] / total['stress_n'] if total['stress_n'] else None,
+                'stress': total['stress_sum'] / total['stress_n'] if total['stress_n'] else None,
+                'good_posture_pct': 100 * (posture_counts[0] + posture_counts[1]) / classified if classified else None,
+                'posture_counts': posture_counts,
+                'avg_sitting_hours': total['sitting_seconds'] / 3600 / user_days,
+                'active_users': active,
+                'samples': int(total['samples']),
+                'daily_dates': [datetime.date.fromordinal(self.end_day - days + 1 + i) for i in range(days)],
+                'daily_wellness': daily['wellness_sum'] / daily['stress_n'],
+                'daily_stress': daily['stress_sum'] / daily['stress_n'],
+                'hourly_stress': hourly['stress_sum'] / hourly['stress_n'],
+            }
+
+    def department_names(self):
+        with self._lock:
+            return list(self.departments)
+
+    def department_scores(self, days=30, k=K_ANONYMITY):
+        """Wellness per department over the last `days` days; small groups suppressed."""
+        scores = {}
+        for name in self.department_names():
+            s = self.summary(name, days, k)
+            if s is not None and s['wellness'] is not None:
+                scores[name] = s['wellness']
+        return scores
+
+_cube = None
+_cube_lock = threading.Lock()
+
+def refreshed(cube):
+    """
+    The cube of the current REFRESH_SECONDS period: computed by one process
+    (the previous period's shared cube, or cube, extended from Mongo) and
+    loaded from the shared cache by the others.
+    """
+    period = int(time.time() // REFRESH_SECONDS)
+
+    def extend():
+        base = shared_cache.get(('org_cube', period - 1)) or cube
+        base.refresh_from_db()
+        return base
+
+    return shared_cache.get_or_compute(('org_cube', period), extend, ttl=REFRESH_SECONDS * SHARED_PERIODS)
+
+def _run():
+    global _cube
+    while True:
+        try:
+            _cube = refreshed(_cube)
+        except Exception as e:
+            print(f"Org cube refresh failed: {e}")  # The previous cube stays in use
+        time.sleep(REFRESH_SECONDS - time.time() % REFRESH_SECONDS)
+
+def get_org_cube():
+    """
+    Process-wide cube; the first call starts its background refresh thread
+    (after gunicorn has forked, since callbacks only run in workers). Until
+    the first refresh lands the cube is empty and the tab shows its defaults.
+    """
+    global _cube
+    with _cube_lock:
+        if _cube is None:
+            _cube = OrgCube()
+            threading.Thread(target=_run, name="org-cube-refresh", daemon=True).start()
+    return _cube
@@ -0,0 +1,139 @@
+import datetime
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+import data_loader
+import database
+
+# Seat pressure distribution from the chair's FSR channels and limit switches.
+# Each channel sits at a fixed position on the seat; a sample's readings are
+# spread onto a grid with normalized Gaussian weights. Because that interpolation
+# is linear, averaging grids equals interpolating averaged channels, so only
+# per-day channel sums and occupied-sample counts are accumulated. A range is
+# the sum of its days: closed days are computed once, today is topped up
+# incrementally from the last seen _id. Day accumulators are kept in an LRU of
+# DAY_ENTRIES; a top-up only lands if the entry it started from is still the
+# stored one, so concurrent top-ups never add the same samples twice.
+DAY_ENTRIES = 5000  # ~ 50 patients x 100 days
+GRID_SIZE = 12
+KERNEL_WIDTH = 0.18  # Gaussian sigma, in seat widths
+OCCUPIED_FSR = 200  # FSR_Left + FSR_Right above this counts as someone seated
+SWITCH_PRESSURE = 1000  # Pressure attributed to a closed limit switch (FSR units)
+
+# Channel -> (x, y) on the seat, x left to right, y backrest (0) to front edge (1)
+CHANNELS = {
+    'FSR_Back': (0.5, 0.1),
+    'FSR_Left': (0.3, 0.6),
+    'FSR_Right': (0.7, 0.6),
+    'Limit_Back_Up': (0.5, 0.0),
+    'Limit_Back_Down': (0.5, 0.25),
+    'Limit_Left': (0.05, 0.6),
+    'Limit_Right': (0.95, 0.6),
+}
+SWITCHES = ('Limit_Back_Up', 'Limit_Back_Down', 'Limit_Left', 'Limit_Right')
+
+def interpolation_kernel(grid_size=GRID_SIZE, width=KERNEL_WIDTH):
+    """(grid_size * grid_size, channels) matrix of row-normalized Gaussian weights."""
+    axis = (np.arange(grid_size) + 0.5) / grid_size
+    gx, gy = np.meshgrid(axis, axis)
+    points = np.column_stack([gx.ravel(), gy.ravel()])
+    sensors = np.array(list(CHANNELS.values()))
+    d2 = ((points[:, None, :] - sensors[None, :, :]) ** 2).sum(axis=2)
+    weights = np.exp(-d2 / (2 * width ** 2))
+    return weights / weights.sum(axis=1, keepdims=True)
+
+KERNEL = interpolation_kernel()
+
+def channel_matrix(df):
+    """(samples, channels) pressure matrix; switches scaled to SWITCH_PRESSURE."""
+    columns = []
+    for name in CHANNELS:
+        col = df[name].to_numpy(dtype=np.float64) if name in df else np.zeros(len(df))
+        col = np.nan_to_num(col)
+        columns.append(col * SWITCH_PRESSURE if name in SWITCHES else col)
+    return np.column_stack(columns)
+
+def accumulate(df):
+    """Occupancy-weighted channel sums and occupied-sample count for a frame."""
+    if df is None or df.empty:
+        return np.zeros(len(CHANNELS)), 0
+    pressures = channel_matrix(df)
+    seat = pressures[:, list(CHANNELS).index('FSR_Left')] + pressures[:, list(CHANNELS).index('FSR_Right')]
+    occupied = seat > OCCUPIED_FSR
+    return pressures[occupied].sum(axis=0), int(occupied.sum())
+
+def to_grid(sums, count, grid_size=GRID_SIZE):
+    """Average pressure grid (grid_size x grid_size) from accumulated sums."""
+    if count == 0:
+        return None
+    return (KERNEL @ (sums / count)).reshape(grid_size, grid_size)
+
+class PressureMapEngine:
+    """
+    Per (patient, day) accumulators behind cached heatmaps.
+    """
+    def __init__(self, max_entries=DAY_ENTRIES):
+        self.max_entries = max_entries
+        self._days = OrderedDict()  # (patient, date) -> (sums, count, last_id), least recent first
+        self._lock = threading.Lock()
+
+    def _load(self, patient, day, after_id=None):
+        start = datetime.datetime.combine(day, datetime.time())
+        end = start + datetime.timedelta(days=1)
+        docs = database.get_metric_samples(start, list(CHANNELS), [patient], end_time=end,
+                                           after_id=after_id, with_ids=True)
+        sums, count = accumulate(data_loader.docs_to_frame(docs))
+        last_id = docs[-1]['_id'] if docs else after_id
+        return sums, count, last_id
+
+    def _day(self, patient, day, today):
+        key = (patient, day)
+        with self._lock:
+            entry = self._days.get(key)
+            if entry is not None:
+                self._days.move_to_end(key)
+        if entry is None:
+            updated = self._load(patient, day)
+        elif day >= today:
+            # Open day: add only samples stored since the last refresh
+            sums, count, last_id = self._load(patient, day, entry[2])
+            updated = (entry[0] + sums, entry[1] + count, last_id)
+        else:
+            return entry
+        with self._lock:
+            current = self._days.get(key)
+            if current is not entry:
+                # Another thread stored this day meanwhile, from the same or a later
+                # watermark; merging ours as well would count its samples twice
+                return current if current is not None else updated
+            self._days[key] = updated
+            self._days.move_to_end(key)
+            while len(self._days) > self.max_entries:
+                self._days.popitem(last=False)
+        return updated
+
+    def heatmap(self, patient, start_date, end_date):
+        """
+        Average pressure grid for a patient over [start_date, end_date], or None
+        if the chair was never occupied in that range.
+        """
+        today = datetime.date.today()
+        total, count = np.zeros(len(CHANNELS)), 0
+        day = start_date
+        while day <= min(end_date, today):
+            sums, n, _ = self._day(patient, day, today)
+            total, count = total + sums, count + n
+            day += datetime.timedelta(days=1)
+        return to_grid(total, count)
+
+engine = PressureMapEngine()
+
+def get_heatmap(patient, start_date, end_date):
+    """Heatmap grid for the Clinical View, or None on missing data / DB errors."""
+    try:
+        return engine.heatmap(patient, start_date, end_date)
+    except Exception as e:
+        print(f"Pressure map query failed: {e}")
+        return None
@@ -0,0 +1,39 @@
+from dash import dcc
+from dash.dependencies import Input
+import os
+
+# Live samples pushed over /stream land here (see live_stream.py and assets/live_stream.js)
+LIVE_STORE_ID = 'live-store'
+
+# Refresh cadences (milliseconds) per panel group.
+# Live vitals change every sample, hourly aggregates once a minute is plenty,
+# daily/weekly charts only need a refresh every 15 minutes.
+REFRESH_INTERVALS = {
+    'live': ('interval-component', int(os.getenv("REFRESH_LIVE_MS", 2 * 1000))),
+    'hourly': ('interval-hourly', int(os.getenv("REFRESH_HOURLY_MS", 60 * 1000))),
+    'daily': ('interval-daily', int(os.getenv("REFRESH_DAILY_MS", 15 * 60 * 1000))),
+}
+# Live cadence while the /stream push channel is connected: pushed samples are
+# applied in the browser, the live interval only refreshes the aggregates
+LIVE_CONNECTED_MS = int(os.getenv("REFRESH_LIVE_CONNECTED_MS", 30 * 1000))
+
+def create_intervals():
+    """
+    Build one dcc.Interval per refresh cadence for the dashboard layout.
+    """
+    return [dcc.Interval(id=interval_id, interval=ms, n_intervals=0)
+            for interval_id, ms in REFRESH_INTERVALS.values()]
+
+def refresh_input(cadence):
+    """
+    Callback Input that fires at the given cadence ('live', 'hourly' or 'daily').
+    """
+    interval_id, _ = REFRESH_INTERVALS[cadence]
+    return Input(interval_id, 'n_intervals')
+
+def live_inputs():
+    """
+    Inputs for live panels: pushed samples, plus the polling fallback (slowed to
+    LIVE_CONNECTED_MS while the push channel is connected).
+    """
+    return [Input(LIVE_STORE_ID, 'data'), refresh_input('live')]
@@ -0,0 +1,64 @@
+import pandas as pd
+
+# Compact in-memory dtypes for sensor tables (Datasets/ CSVs and frames built
+# from sensor_data documents).
+# IDs repeat on every sample and are stored as categoricals; IMU/FSR channels
+# and derived features need far less than float64 precision and are float32,
+# as are gsr, posture_score and stress_level (device readings are whole
+# numbers, but averaged or model-derived levels are not and must survive
+# compaction); posture classes (0-3) and hrv are small ints; limit
+# switches (0/1) are bool. Integer columns with gaps (documents missing a
+# field) fall back to float32 so NaN stays representable. Columns not listed
+# keep whatever pandas inferred.
+ID_COLUMNS = ('User_ID', 'NFC_ID', 'user_id', 'topic')
+IMU = ('AccX', 'AccY', 'AccZ', 'GyroX', 'GyroY', 'GyroZ')
+FILTERED = tuple(c + '_filt' for c in IMU)
+FSR = ('FSR_Left', 'FSR_Right', 'FSR_Back')
+FEATURES = ('Roll', 'Pitch', 'FSR_LR_Diff', 'FSR_Back_Ratio', 'Gyro_Mag')
+SWITCHES = ('Limit_Back_Up', 'Limit_Back_Down', 'Limit_Left', 'Limit_Right')
+CLASSES = ('Posture_Class', 'Predicted_Class')
+
+SENSOR_DTYPES = {
+    **{c: 'category' for c in ID_COLUMNS},
+    **{c: 'float32' for c in IMU + FILTERED + FSR + FEATURES + ('gsr', 'posture_score', 'stress_level')},
+    **{c: 'int8' for c in CLASSES},
+    'hrv': 'int16',
+    **{c: 'bool' for c in SWITCHES},
+}
+INTEGER_DTYPES = ('int8', 'int16', 'bool')
+SCHEMA_VERSION = 2  # Part of cache keys of compacted frames; bump when SENSOR_DTYPES changes
+
+# dtype= for pd.read_csv: IDs parse straight into categoricals and floats into
+# float32; integer and bool columns are narrowed by compact() once gaps are known
+READ_DTYPES = {c: t for c, t in SENSOR_DTYPES.items() if t not in INTEGER_DTYPES}
+
+def _target(series, dtype):
+    if dtype in INTEGER_DTYPES and series.isna().any():
+        return 'float32'
+    return dtype
+
+def compact(df):
+    """
+    Frame with SENSOR_DTYPES applied to the columns it has (values that are
+    not numbers become NaN in numeric columns).
+    """
+    if df is None or df.empty:
+        return df
+    dtypes = {}
+    for column in df.columns:
+        dtype = SENSOR_DTYPES.get(column)
+        if dtype is None or str(df[column].dtype) == dtype:
+            continue
+        if dtype != 'category' and df[column].dtype == object:
+            df = df.assign(**{column: pd.to_numeric(df[column], errors='coerce')})
+        dtypes[column] = _target(df[column], dtype)
+    return df.astype(dtypes) if dtypes else df
+
+def bytes_per_sample(df):
+    """Deep in-memory size of a frame per row, by column, plus 'total'."""
+    if df is None or df.empty:
+        return {'total': 0.0}
+    usage = df.memory_usage(deep=True, index=True) / len(df)
+    report = {str(column): float(size) for column, size in usage.items()}
+    report['total'] = float(usage.sum())
+    return report
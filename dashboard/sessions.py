@@ -0,0 +1,305 @@
+"""
+Sessionization: sit / away intervals per user from the sensor_data stream.
+
+A sample counts as occupied when the seat pressure (FSR_Left + FSR_Right)
+reaches SEAT_PRESSURE and, for chairs that report NFC_ID, a tag is present.
+Per user, samples in time order are run-length encoded over that mask:
+
+  - a run ends where occupancy flips or where samples are more than
+    MAX_SAMPLE_GAP seconds apart (the chair stopped reporting);
+  - a sit run covers its samples plus the gap to the next sample (<= 60 s),
+    as the org cube counts sitting time;
+  - sit runs less than BREAK_SECONDS apart are merged (shifting weight or a
+    short dropout is not a break); merged sits shorter than MIN_SIT_SECONDS
+    are dropped;
+  - the time between two sits is an away interval; away intervals of up to
+    LONG_ABSENCE_SECONDS count as breaks.
+
+Intervals are stored in the user_sessions collection:
+
+    {_id: "<user>|sit|<start>", user_id, state: 'sit'|'away', start, end, samples}
+
+The last sit of each user stays open (its end moves) until the user has been
+away for BREAK_SECONDS. The job runs as its own process (docker-compose service
+"sessionizer"), reads new samples by _id like baseline_service.py and keeps its
+per-user state in SESSION_STATE_PATH; on first start it replays the archived
+days of the last BOOTSTRAP_DAYS. Samples older than a user's last processed
+sample are ignored. Sitting time, breaks and the activity timeline of the
+dashboard are then interval queries (day_summary, hourly_activity,
+daily_sitting_hours).
+
+Usage:
+    python sessions.py [--poll-seconds 5] [--reset]
+"""
+import argparse
+import datetime
+import json
+import os
+import time
+
+import numpy as np
+from pymongo import UpdateOne
+
+import database
+
+SEAT_PRESSURE = float(os.getenv("SEAT_PRESSURE", 500))  # FSR_Left + FSR_Right of an occupied seat
+MAX_SAMPLE_GAP = 60  # Seconds without samples after which a run ends
+BREAK_SECONDS = float(os.getenv("SESSION_BREAK_SECONDS", 120))  # Shorter absences are part of the sit
+MIN_SIT_SECONDS = 60
+LONG_ABSENCE_SECONDS = 4 * 3600  # Longer away intervals (end of day, overnight) are not breaks
+BOOTSTRAP_DAYS = 30
+BATCH_SIZE = 5000
+POLL_SECONDS = 5
+STATE_PATH = os.getenv("SESSION_STATE_PATH")  # Default: <Datasets>/sessions_state.json
+FIELDS = ('FSR_Left', 'FSR_Right', 'NFC_ID')
+
+NS = 10 ** 9
+
+def state_path():
+    if STATE_PATH:
+        return STATE_PATH
+    import data_loader
+    return os.path.join(data_loader.dataset_path(), "sessions_state.json")
+
+def _datetime(ns):
+    return np.datetime64(int(ns), 'ns').astype('datetime64[us]').astype(datetime.datetime)
+
+def occupancy(docs):
+    """(user ids, timestamps in ns, occupied mask) of the docs that carry seat pressure."""
+    docs = [d for d in docs if d.get('FSR_Left') is not None and d.get('FSR_Right') is not None
+            and d.get('timestamp') is not None]
+    users = np.array([str(d.get('user_id') or d.get('User_ID') or 'unknown') for d in docs], dtype=object)
+    ts = np.array([d['timestamp'] for d in docs], dtype='datetime64[ns]').astype(np.int64)
+    pressure = np.array([d['FSR_Left'] for d in docs], dtype=np.float64) + \
+        np.array([d['FSR_Right'] for d in docs], dtype=np.float64)
+    tagged = np.array(['NFC_ID' not in d or bool(d['NFC_ID']) for d in docs], dtype=bool)
+    return users, ts, (pressure >= SEAT_PRESSURE) & tagged
+
+def sit_intervals(users, ts, occupied, weights=None):
+    """
+    Merged sit intervals of samples sorted by (user, timestamp): arrays
+    (user, start ns, end ns, samples). weights (default 1) counts samples;
+    carried-over samples have weight 0.
+    """
+    weights = np.ones(len(ts), dtype=np.int64) if weights is None else weights
+    if not occupied.any():
+        return users[:0], ts[:0], ts[:0], weights[:0]
+    new_user = np.r_[True, users[1:] != users[:-1]]
+    gap = np.r_[0, np.diff(ts)]
+    broken = new_user | (gap > MAX_SAMPLE_GAP * NS)
+    # Each sample covers the time until the next one of the same user, unless the chair went quiet
+    cover_end = ts + np.where(np.r_[~broken[1:], False], np.r_[gap[1:], 0], 0)
+
+    # Run-length encoding of the mask, split at users and gaps
+    starts = np.flatnonzero(broken | np.r_[True, occupied[1:] != occupied[:-1]])
+    sit = occupied[starts]
+    run_user = users[starts][sit]
+    run_start = ts[starts][sit]
+    run_stop = np.maximum.reduceat(cover_end, starts)[sit]
+    run_samples = np.add.reduceat(weights, starts)[sit]
+
+    # Gap tolerance: merge sits of the same user less than BREAK_SECONDS apart
+    merge = np.r_[False, (run_user[1:] == run_user[:-1]) & (run_start[1:] - run_stop[:-1] < BREAK_SECONDS * NS)]
+    groups = np.flatnonzero(~merge)
+    return (run_user[groups], run_start[groups], np.maximum.reduceat(run_stop, groups),
+            np.add.reduceat(run_samples, groups))
+
+def _record(user, state, start, end, samples=None):
+    record = {'_id': f"{user}|{state}|{_datetime(start).isoformat()}", 'user_id': user, 'state': state,
+              'start': _datetime(start), 'end': _datetime(end)}
+    if samples is not None:
+        record['samples'] = int(samples)
+    return record
+
+class Sessionizer:
+    """
+    Incremental sessionization. Per user it carries the last sample (for gaps
+    and run continuation across batches), the open sit interval and the end of
+    the last stored sit (start of the next away interval).
+    """
+    def __init__(self):
+        self.users = {}  # user -> {'t', 'occupied', 'sit': [start, end, samples] or None, 'last_end'}
+        self.watermark = None  # Last processed sensor_data _id
+        self.ignored = 0  # Out-of-order samples
+
+    def update(self, docs):
+        """Add samples; returns the interval records created or changed."""
+        users, ts, occupied = occupancy(docs)
+        if len(ts) == 0:
+            return []
+        # Drop samples older than what was already processed for their user
+        last = np.array([self.users[u]['t'] if u in self.users else -1 for u in users], dtype=np.int64)
+        fresh = ts > last
+        self.ignored += int((~fresh).sum())
+        users, ts, occupied = users[fresh], ts[fresh], occupied[fresh]
+        # Carry each user's last sample in front of the batch (weight 0)
+        carried = [u for u in dict.fromkeys(users.tolist()) if u in self.users]
+        users = np.r_[np.array(carried, dtype=object), users]
+        ts = np.r_[np.array([self.users[u]['t'] for u in carried], dtype=np.int64), ts]
+        occupied = np.r_[np.array([self.users[u]['occupied'] for u in carried], dtype=bool), occupied]
+        weights = np.r_[np.zeros(len(carried), dtype=np.int64), np.ones(len(ts) - len(carried), dtype=np.int64)]
+        order = np.lexsort((ts, users.astype(str)))
+        users, ts, occupied, weights = users[order], ts[order], occupied[order], weights[order]
+
+        changed = {}
+        for user, start, end, samples in zip(*sit_intervals(users, ts, occupied, weights)):
+            self._add_sit(user, int(start), int(end), int(samples), changed)
+        last_of_user = np.r_[users[1:] != users[:-1], True]
+        for user, t, occ in zip(users[last_of_user], ts[last_of_user], occupied[last_of_user]):
+            state = self.users.setdefault(user, {'sit': None, 'last_end': None})
+            state['t'], state['occupied'] = int(t), bool(occ)
+        return list(changed.values())
+
+    def _add_sit(self, user, start, end, samples, changed):
+        state = self.users.setdefault(user, {'t': -1, 'occupied': False, 'sit': None, 'last_end': None})
+        sit = state['sit']
+        if sit is not None and start - sit[1] < BREAK_SECONDS * NS:
+            sit[1] = max(sit[1], end)
+            sit[2] += samples
+        else:
+            if sit is not None and sit[1] - sit[0] >= MIN_SIT_SECONDS * NS:
+                state['last_end'] = sit[1]
+            sit = state['sit'] = [start, end, samples]
+        if sit[1] - sit[0] < MIN_SIT_SECONDS * NS:
+            return
+        record = _record(user, 'sit', *sit)
+        changed[record['_id']] = record
+        if state['last_end'] is not None:
+            away = _record(user, 'away', state['last_end'], sit[0])
+            changed[away['_id']] = away
+
+    # ---- persistence ----
+
+    def to_state(self):
+        return {'watermark': str(self.watermark) if self.watermark is not None else None,
+                'seat_pressure': SEAT_PRESSURE, 'users': self.users}
+
+    @classmethod
+    def from_state(cls, state):
+        from bson import ObjectId
+        sessionizer = cls()
+        sessionizer.watermark = ObjectId(state['watermark']) if state['watermark'] else None
+        sessionizer.users = state['users']
+        return sessionizer
+
+def save_state(sessionizer, path=None):
+    path = path or state_path()
+    with open(path + '.tmp', 'w') as f:
+        json.dump(sessionizer.to_state(), f)
+    os.replace(path + '.tmp', path)
+
+def load_state(path=None):
+    try:
+        with open(path or state_path()) as f:
+            return Sessionizer.from_state(json.load(f))
+    except FileNotFoundError:
+        return None
+
+def write(records):
+    if not records:
+        return
+    now = datetime.datetime.now()
+    database.get_sessions_collection().bulk_write(
+        [UpdateOne({'_id': r['_id']}, {'$set': dict(r, updated_at=now)}, upsert=True) for r in records],
+        ordered=False)
+
+def ensure_indexes():
+    database.get_sessions_collection().create_index([('user_id', 1), ('start', 1)])
+
+def run(poll_seconds=POLL_SECONDS, reset=False):
+    collection = database.get_sensor_data_collection()
+    ensure_indexes()
+    sessionizer = None if reset else load_state()
+    if sessionizer is None:
+        database.get_sessions_collection().delete_many({})
+        sessionizer = Sessionizer()
+        # Days already compacted out of sensor_data are replayed from the archive first
+        start = datetime.datetime.combine(datetime.date.today() - datetime.timedelta(days=BOOTSTRAP_DAYS),
+                                          datetime.time())
+        hot_from = database.archived_until(start)
+        if hot_from > start:
+            for docs in database.iter_sensor_data(start, hot_from, fields=FIELDS):
+                write(sessionizer.update(docs))
+    projection = {f: 1 for f in FIELDS + ('timestamp', 'user_id', 'User_ID')}
+    try:
+        while True:
+            query = {'_id': {'$gt': sessionizer.watermark}} if sessionizer.watermark is not None else {}
+            docs = list(collection.find(query, projection).sort('_id', 1).limit(BATCH_SIZE))
+            if docs:
+                records = sessionizer.update(docs)
+                write(records)
+                sessionizer.watermark = docs[-1]['_id']
+                save_state(sessionizer)
+                print(f"Sessionized {len(docs)} samples, {len(records)} intervals updated")
+            if len(docs) < BATCH_SIZE:
+                time.sleep(poll_seconds)
+    finally:
+        save_state(sessionizer)
+
+# ---- queries ----
+
+def _day_bounds(day):
+    start = datetime.datetime.combine(day or datetime.date.today(), datetime.time())
+    return start, start + datetime.timedelta(days=1)
+
+def _clipped_seconds(interval, start, end):
+    return max(0.0, (min(interval['end'], end) - max(interval['start'], start)).total_seconds())
+
+def _is_break(interval):
+    return (interval['end'] - interval['start']).total_seconds() <= LONG_ABSENCE_SECONDS
+
+def day_summary(user_id, day=None):
+    """
+    Sitting time and breaks of user_id on day (default today), or None when
+    the user has no intervals that day.
+    """
+    start, end = _day_bounds(day)
+    intervals = database.get_user_sessions(user_id, start, end)
+    if not intervals:
+        return None
+    sits = [i for i in intervals if i['state'] == 'sit']
+    breaks = [i for i in intervals if i['state'] == 'away' and start <= i['start'] < end and _is_break(i)]
+    sitting = [_clipped_seconds(i, start, end) for i in sits]
+    return {
+        'sitting_hours': round(sum(sitting) / 3600, 1),
+        'breaks': len(breaks),
+        'longest_sit_minutes': round(max(sitting, default=0) / 60),
+        'sessions': len(sits),
+    }
+
+def hourly_activity(user_id, day=None):
+    """Per hour of day (0-23): (sitting minutes, breaks started) of user_id on day, or None without data."""
+    start, end = _day_bounds(day)
+    intervals = database.get_user_sessions(user_id, start, end)
+    if not intervals:
+        return None
+    sitting, breaks = np.zeros(24), np.zeros(24, dtype=np.int64)
+    for interval in intervals:
+        if interval['state'] == 'away':
+            if start <= interval['start'] < end and _is_break(interval):
+                breaks[interval['start'].hour] += 1
+            continue
+        for hour in range(24):
+            hour_start = start + datetime.timedelta(hours=hour)
+            sitting[hour] += _clipped_seconds(interval, hour_start, hour_start + datetime.timedelta(hours=1)) / 60
+    return sitting, breaks
+
+def daily_sitting_hours(user_id, days=7):
+    """Sitting hours of user_id per day for the last days days (oldest first), or None without data."""
+    first = datetime.date.today() - datetime.timedelta(days=days - 1)
+    start, end = _day_bounds(first)[0], _day_bounds(None)[1]
+    intervals = [i for i in database.get_user_sessions(user_id, start, end) if i['state'] == 'sit']
+    if not intervals:
+        return None
+    hours = []
+    for offset in range(days):
+        day_start, day_end = _day_bounds(first + datetime.timedelta(days=offset))
+        hours.append(sum(_clipped_seconds(i, day_start, day_end) for i in intervals) / 3600)
+    return [first + datetime.timedelta(days=offset) for offset in range(days)], hours
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Derive sit/away intervals per user from sensor_data.")
+    parser.add_argument("--poll-seconds", type=float, default=POLL_SECONDS)
+    parser.add_argument("--reset", action="store_true", help="Drop the stored intervals and state and start over")
+    args = parser.parse_args()
+    run(args.poll_seconds, args.reset)
@@ -0,0 +1,126 @@
+import datetime
+
+import numpy as np
+
+import data_loader
+import database
+from cache import shared_cache
+
+# Hour-of-day x day-of-week profiling shared by all tabs.
+# Samples are binned into 7 * 24 cells in one bincount pass; means and
+# percentiles per cell come from the same pass. Results are cached per
+# (entity, window, metric) in the shared cache.
+PROFILE_TTL = 300  # seconds
+PERCENTILES = (50, 90)
+ALERT_STRESS_LEVEL = 8  # Stress level that triggers a High Stress alert (alert_store.py)
+DAYS = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+CELLS = 7 * 24
+
+def cell_index(timestamps):
+    """Map timestamps to day_of_week * 24 + hour (Monday = 0)."""
+    ts = np.asarray(timestamps, dtype='datetime64[ns]')
+    hours = ts.astype('datetime64[h]').astype(np.int64)
+    hour_of_day = hours % 24
+    day_of_week = (hours // 24 + 3) % 7  # 1970-01-01 was a Thursday
+    return day_of_week * 24 + hour_of_day
+
+def _cell_percentiles(cells, values, counts, percentiles):
+    """Per-cell percentiles (linear interpolation) from one lexsort over (cell, value)."""
+    order = np.lexsort((values, cells))
+    sorted_values = values[order]
+    starts = np.cumsum(counts) - counts
+    out = {}
+    has = counts > 0
+    for p in percentiles:
+        pos = starts + (counts - 1) * (p / 100.0)
+        lo = np.floor(pos).astype(np.int64)
+        hi = np.ceil(pos).astype(np.int64)
+        result = np.full(CELLS, np.nan)
+        frac = pos[has] - lo[has]
+        result[has] = sorted_values[lo[has]] * (1 - frac) + sorted_values[hi[has]] * frac
+        out[f'p{p}'] = result.reshape(7, 24)
+    return out
+
+def hour_dow_profile(timestamps, values=None, percentiles=PERCENTILES):
+    """
+    Profile a metric over hour-of-day x day-of-week.
+    Returns 7x24 arrays: counts, sums, mean and one per requested percentile.
+    With values=None only event counts are computed.
+    """
+    cells = cell_index(timestamps)
+    if values is None:
+        counts = np.bincount(cells, minlength=CELLS)
+        return {'counts': counts.reshape(7, 24)}
+    values = np.asarray(values, dtype=np.float64)
+    valid = ~np.isnan(values)
+    cells, values = cells[valid], values[valid]
+    counts = np.bincount(cells, minlength=CELLS)
+    sums = np.bincount(cells, weights=values, minlength=CELLS)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = sums / counts
+    profile = {'counts': counts.reshape(7, 24), 'sums': sums.reshape(7, 24), 'mean': mean.reshape(7, 24)}
+    if len(values):
+        profile.update(_cell_percentiles(cells, values, counts, percentiles))
+    return profile
+
+def by_hour(profile):
+    """Collapse a profile to 24 hour-of-day means (or counts)."""
+    counts = profile['counts'].sum(axis=0)
+    if 'sums' not in profile:
+        return counts
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return profile['sums'].sum(axis=0) / counts
+
+def by_day_of_week(profile):
+    """Collapse a profile to 7 day-of-week means (or counts), Monday first."""
+    counts = profile['counts'].sum(axis=1)
+    if 'sums' not in profile:
+        return counts
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return profile['sums'].sum(axis=1) / counts
+
+def _entity_users(entity):
+    kind, key = entity
+    if kind == 'user':
+        return [key]
+    if kind == 'dept' and key not in (None, 'all'):
+        departments = data_loader.load_user_departments()
+        return [u for u, d in departments.items() if d == key]
+    return None  # Whole organization
+
+def _compute_profile(entity, window_days, metric):
+    start = datetime.datetime.now() - datetime.timedelta(days=window_days)
+    fields = [metric]
+    if metric == 'posture_score':
+        fields.append('Posture_Class')
+    df = data_loader.docs_to_frame(database.get_metric_samples(start, fields, _entity_users(entity)))
+    if df.empty or metric not in df:
+        return None
+    return hour_dow_profile(df['timestamp'].to_numpy(), df[metric].to_numpy(dtype=np.float64))
+
+def get_profile(entity, window_days, metric):
+    """
+    Cached profile for an entity over the last window_days, or None without data.
+    entity is ('user', user_id), ('dept', department) or ('org', None);
+    metric is a sensor field (e.g. 'stress_level', 'posture_score').
+    """
+    key = ('temporal_profile', entity, window_days, metric)
+    try:
+        return shared_cache.get_or_compute(key, lambda: _compute_profile(entity, window_days, metric),
+                                           ttl=PROFILE_TTL, partition=_partition(entity))
+    except Exception as e:
+        # Not cached, so the next refresh retries
+        print(f"Profile query failed: {e}")
+        return None
+
+def _partition(entity):
+    # User profiles go to that user's cache partition; dept/org ones are shared
+    return entity[1] if entity[0] == 'user' else None
+
+def warm_user_profile(user_id, window_days, metric, ahead=0.0):
+    """Recompute a user's profile read since it was stored when it expires within ahead seconds (active_users.py)."""
+    entity = ('user', user_id)
+    key = ('temporal_profile', entity, window_days, metric)
+    if not shared_cache.was_read(key, user_id) or shared_cache.expires_in(key, user_id) > ahead:
+        return False
+    return shared_cache.refresh(key, lambda: _compute_profile(entity, window_days, metric), PROFILE_TTL, user_id)
@@ -0,0 +1,24 @@
+"""
+WSGI entry point for production serving.
+
+    gunicorn -c gunicorn.conf.py wsgi:server
+
+With preload_app enabled in gunicorn.conf.py this module is imported once in
+the master process, so the app, its callbacks and the warmed dataset cache are
+shared copy-on-write by every forked worker.
+
+With DASH_LAZY_STARTUP=1 preloading is off (threads do not survive fork): each
+worker imports this module, starts serving at once and loads the tabs and the
+dataset cache in the background (see app.py).
+"""
+from app import LAZY_STARTUP, server
+
+if not LAZY_STARTUP:
+    import data_loader
+    import database
+
+    # Parse datasets into the shared cache before workers fork
+    data_loader.warm_up()
+    database.ensure_indexes()
+
+application = server
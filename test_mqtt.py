@@ -5,6 +5,7 @@ import random
 
 client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
 client.connect("localhost", 1883, 60)
+client.loop_start()  # QoS 1 publishes need the network loop for their PUBACKs
 
 while True:
     data = {
@@ -15,6 +16,6 @@ while True:
         "posture_score": random.randint(50, 100)
     }
 
-    client.publish("neurochair/sensors/test", json.dumps(data))
+    client.publish("neurochair/sensors/test", json.dumps(data), qos=1)  # Queued by the broker while ingestion is down
     print(f"Published: {data}")
     time.sleep(5)